@@ -0,0 +1,123 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.exception import response_for_exception
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from art_master_backend.db_router import replica_reads
+from art_master_backend.metrics import metrics
+from art_master_backend.middleware import ReplicaRoutingMiddleware
+
+from .throttling import get_cost
+
+
+def build_subrequest(request, url):
+    """GET-запрос пакета: заголовки и пользователь берутся из пакета."""
+    parts = urlsplit(url)
+    subrequest = HttpRequest()
+    subrequest.method = 'GET'
+    subrequest.path = subrequest.path_info = parts.path
+    subrequest.META = {**request.META,
+                       'REQUEST_METHOD': 'GET',
+                       'PATH_INFO': parts.path,
+                       'QUERY_STRING': parts.query}
+    subrequest.META.pop('CONTENT_LENGTH', None)
+    subrequest.META.pop('CONTENT_TYPE', None)
+    subrequest.GET = QueryDict(parts.query)
+    subrequest.COOKIES = request.COOKIES
+    subrequest.batch = True
+    return subrequest
+
+
+class SubRequest:
+    """Подзапрос пакета: URL, найденная вьюха и стоимость."""
+
+    def __init__(self, request, url):
+        self.url = url
+        self.request = build_subrequest(request, url)
+        self.match = None
+        self.error = None
+        self.cost = 0
+        try:
+            match = resolve(self.request.path_info)
+        except Resolver404:
+            self.error = (status.HTTP_404_NOT_FOUND, 'Не найдено.')
+            return
+
+        view_class = getattr(match.func, 'cls', None)
+        if (view_class is None
+                or not issubclass(view_class, APIView)
+                or getattr(view_class, 'batchable', True) is False):
+            self.error = (status.HTTP_400_BAD_REQUEST,
+                          'URL недоступен в пакетном запросе.')
+            return
+        self.match = match
+        self.cost = self.get_cost(view_class)
+
+    def get_cost(self, view_class):
+        view = view_class(**getattr(self.match.func, 'initkwargs', {}))
+        view.action = getattr(self.match.func, 'actions', {}).get('get')
+        return get_cost(Request(self.request), view)
+
+    def run(self, user, auth):
+        if self.error is not None:
+            code, detail = self.error
+            return {'url': self.url, 'status': code,
+                    'body': {'detail': detail}}
+
+        self.request._force_auth_user = user
+        self.request._force_auth_token = auth
+        try:
+            response = self.match.func(self.request, *self.match.args,
+                                       **self.match.kwargs)
+        except Exception as error:
+            # Ошибка подзапроса не обрывает пакет: она журналируется и
+            # сигналится как у обычного запроса, а ответ - в её слоте.
+            metrics.incr('batch.errors')
+            response = response_for_exception(self.request, error)
+            return {'url': self.url, 'status': response.status_code,
+                    'body': {'detail': response.reason_phrase}}
+        if not isinstance(response, Response):
+            return {'url': self.url,
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'body': {'detail': 'Ответ не поддерживается в пакете.'}}
+        return {'url': self.url, 'status': response.status_code,
+                'body': response.data}
+
+
+class Batch:
+    """Пакет GET-подзапросов с общей аутентификацией.
+
+    Подзапросы вызывают вьюхи роутера напрямую, без повторного
+    прохода middleware; стоимость пакета - сумма стоимостей
+    подзапросов, и троттлинг списывает её один раз на весь пакет.
+    """
+
+    def __init__(self, request, urls):
+        self.subrequests = [SubRequest(request, url) for url in urls]
+        self.cost = sum(subrequest.cost for subrequest in self.subrequests)
+        if self.cost > settings.BATCH_MAX_COST:
+            raise ValidationError(
+                f'Стоимость пакета {self.cost} больше '
+                f'{settings.BATCH_MAX_COST}.'
+            )
+
+    def use_replica(self, request):
+        sticky_key = ReplicaRoutingMiddleware.get_sticky_key(request)
+        return bool(settings.DATABASE_REPLICAS
+                    and not (sticky_key and cache.get(sticky_key)))
+
+    def run(self, request):
+        metrics.incr('batch.requests')
+        metrics.incr('batch.subrequests', len(self.subrequests))
+        with replica_reads(self.use_replica(request)):
+            return [subrequest.run(request.user, request.auth)
+                    for subrequest in self.subrequests]
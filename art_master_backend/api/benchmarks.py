@@ -0,0 +1,214 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    """Регистрирует сценарий бенчмарка под именем функции."""
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def measure(func, repeat):
+    """Среднее время одного вызова func в секундах."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+@scenario
+def connection(repeat):
+    """Накладные расходы на соединение с БД в расчёте на запрос."""
+    db = connections[DEFAULT_DB_ALIAS]
+    engine = settings.DATABASES[DEFAULT_DB_ALIAS]['ENGINE']
+
+    def select_one():
+        with db.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def reconnect():
+        db.close()
+        select_one()
+
+    return {
+        f'connect per request ({engine})': measure(reconnect, repeat),
+        'persistent connection': measure(select_one, repeat),
+    }
+
+
+def get_anonymous_request(path='/'):
+    request = Request(APIRequestFactory().get(path))
+    request.user = AnonymousUser()
+    return request
+
+
+def get_list_queryset(viewset_class, request):
+    """Queryset, который вьюсет строит для action='list'."""
+    view = viewset_class(request=request, action='list', format_kwarg=None,
+                         kwargs={})
+    return view.get_queryset()
+
+
+def get_list_pages(request):
+    """Первые страницы списков: эндпоинт -> (сериализатор, объекты)."""
+    from services.models import Review
+
+    from .serializers import (MasterSerializer,
+                              ReviewSerializer,
+                              ServiceSerializer)
+    from .views import MasterViewSet, ServiceViewSet
+
+    size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    return {
+        'services': (ServiceSerializer, list(
+            get_list_queryset(ServiceViewSet, request)[:size]
+        )),
+        'reviews': (ReviewSerializer, list(
+            Review.objects.select_related(
+                'author', 'service'
+            ).prefetch_related('comments__author')[:size]
+        )),
+        'masters': (MasterSerializer, list(
+            get_list_queryset(MasterViewSet, request)[:size]
+        )),
+    }
+
+
+@scenario
+def serialization(repeat):
+    """Сериализация и рендеринг первой страницы списков по эндпоинтам."""
+    from .renderers import FastJSONRenderer
+
+    request = get_anonymous_request()
+    results = {}
+    for endpoint, (serializer_class, objects) in get_list_pages(
+        request
+    ).items():
+        data = serializer_class(
+            objects, many=True, context={'request': request}
+        ).data
+        results[f'{endpoint}: serialize page'] = measure(
+            lambda: serializer_class(
+                objects, many=True, context={'request': request}
+            ).data,
+            repeat
+        )
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            results[f'{endpoint}: {type(renderer).__name__}'] = measure(
+                lambda: renderer.render(data), repeat
+            )
+    return results
+
+
+@scenario
+def list_serializers(repeat):
+    """ModelSerializer против скомпилированного плана на списках."""
+    from .fast_serializers import get_plan
+    from .views import MasterViewSet, ServiceViewSet
+
+    request = get_anonymous_request()
+    context = {'request': request}
+    results = {}
+    for viewset_class in (ServiceViewSet, MasterViewSet):
+        view = viewset_class(request=request, action='list',
+                             format_kwarg=None, kwargs={})
+        serializer_class = view.get_serializer_class()
+        plan = get_plan(serializer_class)
+        size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        name = viewset_class.__name__
+
+        def drf_page():
+            objects = view.get_queryset()[:size]
+            return serializer_class(objects, many=True, context=context).data
+
+        def fast_page():
+            objects = view.get_queryset().only(*plan.only_fields)[:size]
+            serialize = plan.bind(context)
+            return [serialize(instance) for instance in objects]
+
+        results[f'{name}.list: serializer'] = measure(drf_page, repeat)
+        results[f'{name}.list: compiled plan'] = measure(fast_page, repeat)
+    return results
+
+
+@scenario
+def ranking(repeat):
+    """Первая страница по хранимому рангу против ранга в запросе."""
+    from services.models import Service
+    from services.ranking import annotate_rank, order_by_rank
+
+    size = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+    def stored():
+        return list(order_by_rank(Service.objects.all())[:size])
+
+    def annotated():
+        return list(annotate_rank(
+            Service.objects.all()
+        ).order_by('-computed_rank', '-id')[:size])
+
+    return {
+        'services: stored rank (index scan)': measure(stored, repeat),
+        'services: rank annotated in query': measure(annotated, repeat),
+    }
+
+
+def build_middleware_chain(middleware_classes):
+    """Цепочка middleware вокруг пустого ответа, как в BaseHandler."""
+    from django.http import HttpResponse
+
+    def handler(request):
+        return HttpResponse()
+
+    for middleware_class in reversed(middleware_classes):
+        handler = middleware_class(handler)
+    return handler
+
+
+@scenario
+def middleware(repeat):
+    """Накладные расходы стека middleware на запрос к API и к админке."""
+    from django.utils.module_loading import import_string
+
+    from art_master_backend.middleware import SiteOnlyMiddlewareMixin
+
+    project = [import_string(path) for path in settings.MIDDLEWARE]
+    # __mro__: (подкласс проекта, SiteOnlyMiddlewareMixin, класс Django).
+    stock = [middleware_class.__mro__[2]
+             if issubclass(middleware_class, SiteOnlyMiddlewareMixin)
+             else middleware_class
+             for middleware_class in project]
+    full_chain = build_middleware_chain(stock)
+    lean_chain = build_middleware_chain(project)
+    factory = APIRequestFactory()
+    api_path = f'{settings.API_URL_PREFIX}services/'
+
+    return {
+        'api request: full stack': measure(
+            lambda: full_chain(factory.get(api_path)), repeat
+        ),
+        'api request: lean stack': measure(
+            lambda: lean_chain(factory.get(api_path)), repeat
+        ),
+        'admin request: full stack': measure(
+            lambda: lean_chain(factory.get('/admin/')), repeat
+        ),
+    }
+
+
+@scenario
+def cold_start(repeat):
+    """Холодный старт процесса: settings, django.setup() и URLconf."""
+    from .startup import measure_startup
+
+    return {f'cold start: {phase}': seconds
+            for phase, seconds in measure_startup(min(repeat, 10)).items()}
@@ -0,0 +1,235 @@
+import random
+import threading
+import time
+import uuid
+from typing import Any, NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from art_master_backend.metrics import metrics
+
+
+class Entry(NamedTuple):
+    """Значение в кэше с версией и моментом, до которого оно свежее."""
+    value: Any
+    version: Any
+    fresh_until: float
+
+
+# Бэкенды, данные которых видны только текущему процессу.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias='default'):
+    """Кэш общий для всех процессов: смена версии видна каждому воркеру."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def jittered(timeout):
+    """TTL со случайным разбросом: ключи одной волны не истекают разом."""
+    jitter = settings.CACHE_COALESCING['JITTER']
+    return timeout * random.uniform(1 - jitter, 1 + jitter)
+
+
+class LocalLock:
+    """Блокировка ключа внутри процесса.
+
+    Объекты Lock живут в реестре, пока их кто-то держит или ждёт.
+    """
+    registry = {}
+    guard = threading.Lock()
+
+    def __init__(self, key):
+        self.key = key
+
+    def acquire(self, timeout=0):
+        with self.guard:
+            lock, users = self.registry.get(self.key, (None, 0))
+            lock = lock or threading.Lock()
+            self.registry[self.key] = (lock, users + 1)
+        acquired = (lock.acquire(timeout=timeout) if timeout
+                    else lock.acquire(blocking=False))
+        if not acquired:
+            self.forget()
+        return acquired
+
+    def release(self):
+        self.registry[self.key][0].release()
+        self.forget()
+
+    def forget(self):
+        with self.guard:
+            lock, users = self.registry[self.key]
+            if users > 1:
+                self.registry[self.key] = (lock, users - 1)
+            else:
+                del self.registry[self.key]
+
+
+class CacheLock:
+    """Блокировка ключа через cache.add: общая для всех процессов.
+
+    Истекает через LOCK_TIMEOUT, если владелец не успел её снять.
+    """
+    poll_interval = 0.05
+
+    def __init__(self, key):
+        self.key = f'lock:{key}'
+        self.token = uuid.uuid4().hex
+
+    def acquire(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while not cache.add(self.key, self.token,
+                            settings.CACHE_COALESCING['LOCK_TIMEOUT']):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def release(self):
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+LOCKS = {'local': LocalLock, 'cache': CacheLock}
+
+
+def get_lock(key):
+    return LOCKS[settings.CACHE_COALESCING['LOCKS']](key)
+
+
+def set_entries(values, versions, timeout):
+    now = time.time()
+    stale_seconds = settings.CACHE_COALESCING['STALE_SECONDS']
+    for key, value in values.items():
+        ttl = jittered(timeout)
+        cache.set(key, Entry(value, versions[key], now + ttl),
+                  ttl + stale_seconds)
+
+
+def get_or_set_many(versions, compute_many, timeout, name='cache'):
+    """Значения ключей {key: version} с объединением промахов.
+
+    Пересчитывает ключ только тот, кто взял его блокировку. Устаревшее
+    по TTL значение остальные получают сразу (stale-while-revalidate);
+    при отсутствии значения или смене версии они ждут блокировку и
+    перечитывают кэш. compute_many(keys) возвращает {key: value}.
+    """
+    now = time.time()
+    result, stale, missing = {}, {}, []
+    entries = cache.get_many(list(versions))
+    for key, version in versions.items():
+        entry = entries.get(key)
+        if entry is None or entry.version != version:
+            missing.append(key)
+        elif entry.fresh_until > now:
+            result[key] = entry.value
+        else:
+            stale[key] = entry.value
+    metrics.incr(f'{name}.hits', len(result))
+    metrics.incr(f'{name}.stale', len(stale))
+    metrics.incr(f'{name}.misses', len(missing))
+
+    locks, waiting = {}, []
+    for key in [*stale, *missing]:
+        lock = get_lock(key)
+        if lock.acquire():
+            locks[key] = lock
+        elif key in stale:
+            result[key] = stale[key]
+        else:
+            waiting.append(key)
+    try:
+        if locks:
+            values = compute_many(list(locks))
+            set_entries(values, versions, timeout)
+            result.update(values)
+    finally:
+        for lock in locks.values():
+            lock.release()
+
+    if waiting:
+        metrics.incr(f'{name}.coalesced', len(waiting))
+        wait_seconds = settings.CACHE_COALESCING['WAIT_SECONDS']
+        for key in waiting:
+            lock = get_lock(key)
+            if lock.acquire(timeout=wait_seconds):
+                lock.release()
+        entries = cache.get_many(waiting)
+        for key in waiting:
+            entry = entries.get(key)
+            if entry is not None and entry.version == versions[key]:
+                result[key] = entry.value
+        left = [key for key in waiting if key not in result]
+        if left:
+            values = compute_many(left)
+            set_entries(values, versions, timeout)
+            result.update(values)
+    return result
+
+
+def version_key(kind, pk):
+    return f'fragment-version:{kind}:{pk}'
+
+
+def bump_versions(kind, pks):
+    """Инвалидирует фрагменты объектов, меняя версию их ключей.
+
+    Версии хранятся без срока; если ключ вытеснен, новая версия
+    берётся из времени, чтобы не совпасть со старыми фрагментами.
+    """
+    for pk in set(pks):
+        key = version_key(kind, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def get_versions(kind, pks):
+    keys = {version_key(kind, pk): pk for pk in pks}
+    versions = {keys[key]: version
+                for key, version in cache.get_many(keys).items()}
+    missing = {key: time.time_ns() for key, pk in keys.items()
+               if pk not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update({keys[key]: version
+                         for key, version in missing.items()})
+    return versions
+
+
+class FragmentCache:
+    """Сериализованные представления объектов с версиями.
+
+    namespace отделяет фрагменты с абсолютными URL разных хостов.
+    """
+
+    def __init__(self, kind, namespace=''):
+        self.kind = kind
+        self.namespace = namespace
+
+    def get_key(self, pk):
+        return f'fragment:{self.kind}:{pk}:{self.namespace}'
+
+    def get_many(self, pks, build):
+        """Фрагменты {pk: dict}; build(pks) строит недостающие."""
+        versions = get_versions(self.kind, pks)
+        keys = {self.get_key(pk): pk for pk in pks}
+
+        def compute_many(missing):
+            built = build([keys[key] for key in missing])
+            return {self.get_key(pk): fragment
+                    for pk, fragment in built.items()}
+
+        fragments = get_or_set_many(
+            {key: versions[pk] for key, pk in keys.items()},
+            compute_many,
+            settings.FRAGMENT_CACHE_TIMEOUT,
+            name=f'fragments.{self.kind}'
+        )
+        return {keys[key]: fragment for key, fragment in fragments.items()}
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .cache import is_shared_cache
+
+
+@register()
+def check_fragment_cache(app_configs, **kwargs):
+    """FRAGMENT_CACHE требует общего кэша.
+
+    С кэшем процесса смена версий фрагментов не доходит до других
+    воркеров, и они отдают устаревшие данные до FRAGMENT_CACHE_TIMEOUT.
+    """
+    if settings.FRAGMENT_CACHE and not is_shared_cache():
+        return [Error(
+            'FRAGMENT_CACHE requires a shared cache backend.',
+            hint='Set CACHE_BACKEND to Redis or Memcached, or disable '
+                 'FRAGMENT_CACHE.',
+            id='api.E001',
+        )]
+    return []
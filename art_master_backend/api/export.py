@@ -0,0 +1,208 @@
+import csv
+import zlib
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from art_master_backend.connections import statement_timeout
+from art_master_backend.db_router import replica_reads
+from art_master_backend.metrics import metrics
+
+from .renderers import FastJSONRenderer
+
+EXPORTS = {}
+CHUNK_SIZE = 2000
+
+
+def export(name, timestamp_field, fields):
+    """Регистрирует выгрузку: функция возвращает queryset строк."""
+    def decorator(get_queryset):
+        EXPORTS[name] = Export(name, get_queryset, timestamp_field, fields)
+        return get_queryset
+    return decorator
+
+
+class Export:
+    """Выгрузка модели: queryset, поле отметки времени и колонки."""
+
+    def __init__(self, name, get_queryset, timestamp_field, fields):
+        self.name = name
+        self.get_queryset = get_queryset
+        self.timestamp_field = timestamp_field
+        self.fields = fields
+
+    def rows(self, since=None):
+        """Строки по возрастанию (время, id) серверным курсором.
+
+        since - пара (время, id) последней полученной строки: строки с
+        тем же временем и большим id не теряются. Без id выгружаются
+        только строки строго новее.
+        """
+        queryset = self.get_queryset()
+        if since is not None:
+            timestamp, pk = since
+            after = Q(**{f'{self.timestamp_field}__gt': timestamp})
+            if pk is not None:
+                after |= Q(**{self.timestamp_field: timestamp, 'pk__gt': pk})
+            queryset = queryset.filter(after)
+        queryset = queryset.order_by(self.timestamp_field, 'pk')
+        count = 0
+        for instance in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield {name: getter(instance) for name, getter in self.fields}
+            count += 1
+        metrics.incr(f'export.{self.name}.rows', count)
+
+
+@export('services', 'created', (
+    ('id', lambda service: service.pk),
+    ('name', lambda service: service.name),
+    ('master', lambda service: service.master_id),
+    ('activities', lambda service: [
+        activity.slug for activity in service.activities.all()
+    ]),
+    ('locations', lambda service: [
+        location.address for location in service.locations.all()
+    ]),
+    ('rating', lambda service: (
+        service.reviews_score_sum / service.reviews_count
+        if service.reviews_count else None
+    )),
+    ('reviews_count', lambda service: service.reviews_count),
+    ('favorites_count', lambda service: service.favorites_count),
+    ('created', lambda service: service.created),
+))
+def export_services():
+    from services.models import Service
+
+    return Service.objects.filter(is_active=True).defer(
+        'description', 'about_master'
+    ).prefetch_related('activities', 'locations')
+
+
+@export('reviews', 'pub_date', (
+    ('id', lambda review: review.pk),
+    ('service', lambda review: review.service_id),
+    ('author', lambda review: review.author_id),
+    ('score', lambda review: review.score),
+    ('text', lambda review: review.text),
+    ('pub_date', lambda review: review.pub_date),
+))
+def export_reviews():
+    from services.models import ReviewHistory
+
+    return ReviewHistory.objects.all()
+
+
+@export('comments', 'pub_date', (
+    ('id', lambda comment: comment.pk),
+    ('review', lambda comment: comment.review_id),
+    ('author', lambda comment: comment.author_id),
+    ('text', lambda comment: comment.text),
+    ('pub_date', lambda comment: comment.pub_date),
+))
+def export_comments():
+    from services.models import CommentHistory
+
+    return CommentHistory.objects.all()
+
+
+@export('users', 'date_joined', (
+    ('id', lambda user: user.pk),
+    ('username', lambda user: user.username),
+    ('first_name', lambda user: user.first_name),
+    ('last_name', lambda user: user.last_name),
+    ('is_master', lambda user: user.is_master),
+    ('date_joined', lambda user: user.date_joined),
+))
+def export_users():
+    from users.models import CustomUser
+
+    return CustomUser.objects.filter(is_active=True).only(
+        'pk', 'username', 'first_name', 'last_name', 'is_master',
+        'date_joined'
+    )
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return '|'.join(map(str, value))
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(export, rows):
+    writer = csv.writer(Echo())
+    names = [name for name, _ in export.fields]
+    yield writer.writerow(names).encode()
+    for row in rows:
+        yield writer.writerow(map(csv_value, row.values())).encode()
+
+
+def encode_jsonl(export, rows):
+    renderer = FastJSONRenderer()
+    for row in rows:
+        yield renderer.render(row) + b'\n'
+
+
+ENCODERS = {'csv': encode_csv, 'jsonl': encode_jsonl}
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def gzip_stream(chunks, flush_every=CHUNK_SIZE):
+    """Инкрементальное gzip-сжатие: память не зависит от объёма."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for number, chunk in enumerate(chunks, 1):
+        data = compressor.compress(chunk)
+        if number % flush_every == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, file_format, since=None, compress=False,
+                  timeout=None):
+    """Байтовый поток выгрузки; чтение идёт с реплик, если они есть.
+
+    timeout - statement_timeout (мс) запросов выгрузки: поток читается
+    уже после выхода из вьюхи и её ограничения.
+    """
+    export = EXPORTS[name]
+
+    def chunks():
+        with replica_reads(), statement_timeout(timeout):
+            yield from ENCODERS[file_format](export, export.rows(since))
+
+    return gzip_stream(chunks()) if compress else chunks()
+
+
+def parse_since(value, since_id=None):
+    """Курсор инкрементальной выгрузки: время (ISO 8601) и id строки.
+
+    Возвращает пару (время, id) для Export.rows или None.
+    """
+    if not value:
+        if since_id:
+            raise ValueError('since_id задаётся вместе с since')
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'Некорректная отметка времени: {value}')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    if since_id in (None, ''):
+        return since, None
+    try:
+        return since, int(since_id)
+    except ValueError:
+        raise ValueError(f'Некорректный id: {since_id}')
@@ -0,0 +1,190 @@
+import operator
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+from rest_framework import serializers
+from rest_framework.relations import (ManyRelatedField,
+                                      PrimaryKeyRelatedField,
+                                      SlugRelatedField,
+                                      StringRelatedField)
+
+_plans = {}
+
+
+def get_plan(serializer_class):
+    """План сериализации для класса, строится один раз на процесс."""
+    plan = _plans.get(serializer_class)
+    if plan is None:
+        plan = _plans[serializer_class] = SerializerPlan(serializer_class)
+    return plan
+
+
+def get_converter(field):
+    """Функция value -> представление без обращения к объекту поля.
+
+    None означает, что у поля собственный to_representation и его
+    нужно вызывать у поля, привязанного к контексту запроса.
+    """
+    to_representation = type(field).to_representation
+    if to_representation is serializers.CharField.to_representation:
+        return str
+    if to_representation is serializers.IntegerField.to_representation:
+        return int
+    if to_representation is serializers.ReadOnlyField.to_representation:
+        return None if field.source == '*' else _identity
+    if to_representation is StringRelatedField.to_representation:
+        return str
+    if to_representation is SlugRelatedField.to_representation:
+        return operator.attrgetter(field.slug_field)
+    if (to_representation is PrimaryKeyRelatedField.to_representation
+            and field.pk_field is None):
+        return operator.attrgetter('pk')
+    return None
+
+
+def _identity(value):
+    return value
+
+
+def _related_all(value):
+    return value.all() if isinstance(value, models.Manager) else value
+
+
+def get_related_getter(source):
+    """Геттер связи, читающий prefetch-кэш без создания менеджера."""
+    getter = operator.attrgetter(source)
+    if '.' in source:
+        return getter
+
+    def get_related(instance):
+        try:
+            return instance._prefetched_objects_cache[source]
+        except (AttributeError, KeyError):
+            return getter(instance)
+    return get_related
+
+
+class SerializerPlan:
+    """Плоский план чтения для ModelSerializer.
+
+    Для каждого поля заранее выбираются геттер атрибута и конвертер,
+    поэтому на строку не тратятся get_attribute/to_representation
+    объектов Field. Вывод совпадает с serializer.data.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.steps = []
+        only_fields = {self.model._meta.pk.name}
+
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            self.steps.append((name, self.compile_field(field)))
+            if not isinstance(field, serializers.SerializerMethodField):
+                only_fields.update(self.get_model_fields(field.source))
+        self.only_fields = sorted(only_fields)
+
+    def get_model_fields(self, source):
+        name = source.split('.')[0]
+        try:
+            model_field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return ()
+        if model_field.concrete and not model_field.many_to_many:
+            return (name,)
+        return ()
+
+    def compile_field(self, field):
+        """Описание шага плана: (вид, геттер, аргумент)."""
+        if isinstance(field, serializers.SerializerMethodField):
+            return ('method', None, field.method_name)
+        if field.source == '*':
+            return ('field', None, None)
+
+        getter = operator.attrgetter(field.source)
+        if isinstance(field, serializers.ListSerializer):
+            return ('many', get_related_getter(field.source),
+                    get_plan(type(field.child)))
+        if isinstance(field, serializers.BaseSerializer):
+            return ('one', getter, get_plan(type(field)))
+        if isinstance(field, ManyRelatedField):
+            return ('related', get_related_getter(field.source),
+                    get_converter(field.child_relation))
+        if (isinstance(field, PrimaryKeyRelatedField)
+                and field.use_pk_only_optimization()
+                and field.pk_field is None
+                and self.get_model_fields(field.source) == (field.source,)):
+            attname = self.model._meta.get_field(field.source).attname
+            return ('value', operator.attrgetter(attname), _identity)
+
+        converter = get_converter(field)
+        if converter is None:
+            return ('field', None, None)
+        return ('value', getter, converter)
+
+    def bind(self, context):
+        """Функция instance -> dict для контекста текущего запроса."""
+        serializer = self.serializer_class(context=context)
+        fields = serializer.fields
+        steps = []
+
+        for name, (kind, getter, argument) in self.steps:
+            if kind == 'method':
+                steps.append((name, getattr(serializer, argument)))
+            elif kind == 'field':
+                steps.append((name, self.bind_field(fields[name])))
+            elif kind == 'value':
+                steps.append((name, self.bind_value(getter, argument)))
+            elif kind == 'related':
+                converter = (argument
+                             or fields[name].child_relation.to_representation)
+                steps.append((name, self.bind_related(getter, converter)))
+            elif kind == 'one':
+                steps.append(
+                    (name, self.bind_value(getter, argument.bind(context)))
+                )
+            else:
+                steps.append(
+                    (name, self.bind_many(getter, argument.bind(context)))
+                )
+
+        def serialize(instance):
+            return {name: step(instance) for name, step in steps}
+        return serialize
+
+    @staticmethod
+    def bind_value(getter, converter):
+        def step(instance):
+            value = getter(instance)
+            return None if value is None else converter(value)
+        return step
+
+    @staticmethod
+    def bind_related(getter, converter):
+        def step(instance):
+            if instance.pk is None:
+                return []
+            return [converter(value)
+                    for value in _related_all(getter(instance))]
+        return step
+
+    @staticmethod
+    def bind_many(getter, serialize):
+        def step(instance):
+            value = getter(instance)
+            if value is None:
+                return None
+            return [serialize(item) for item in _related_all(value)]
+        return step
+
+    @staticmethod
+    def bind_field(field):
+        def step(instance):
+            attribute = field.get_attribute(instance)
+            if attribute is None:
+                return None
+            return field.to_representation(attribute)
+        return step
@@ -0,0 +1,109 @@
+import re
+from functools import lru_cache
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from phonenumber_field.phonenumber import to_python
+
+from services.registry import activities
+
+_DATETIME_DIRECTIVES = {
+    'd': '{0.day:02d}',
+    'm': '{0.month:02d}',
+    'Y': '{0.year}',
+    'H': '{0.hour:02d}',
+    'M': '{0.minute:02d}',
+    'S': '{0.second:02d}',
+    '%': '%',
+}
+
+
+@lru_cache(maxsize=None)
+def compile_datetime_format(output_format):
+    """Превращает strftime-формат в готовую функцию форматирования.
+
+    Для директив вне _DATETIME_DIRECTIVES используется strftime.
+    """
+    template = []
+    for part in re.split(r'(%.)', output_format):
+        if len(part) == 2 and part.startswith('%'):
+            directive = _DATETIME_DIRECTIVES.get(part[1])
+            if directive is None:
+                return lambda value: value.strftime(output_format)
+            template.append(directive)
+        else:
+            template.append(part.replace('{', '{{').replace('}', '}}'))
+    return ''.join(template).format
+
+
+@lru_cache(maxsize=4096)
+def _format_international_number(raw_input):
+    return str(to_python(raw_input))
+
+
+def format_phone_number(value):
+    """str(PhoneNumber) с кэшем для номеров в международном формате."""
+    raw_input = getattr(value, 'raw_input', None)
+    if raw_input and raw_input.startswith('+'):
+        return _format_international_number(raw_input)
+    return str(value)
+
+
+class FastDateTimeField(serializers.DateTimeField):
+    """DateTimeField с заранее скомпилированным форматом вывода."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+
+        output_format = getattr(self, 'format', api_settings.DATETIME_FORMAT)
+        if (output_format is None
+                or isinstance(value, str)
+                or output_format.lower() == ISO_8601):
+            return super().to_representation(value)
+
+        return compile_datetime_format(output_format)(
+            self.enforce_timezone(value)
+        )
+
+
+class PhoneNumberCharField(serializers.CharField):
+    """CharField для PhoneNumberField с кэшированным форматированием."""
+
+    def to_representation(self, value):
+        return format_phone_number(value)
+
+
+class ValuesRelatedField(serializers.PrimaryKeyRelatedField):
+    """Принимает id объекта, а отдаёт его поля как QuerySet.values()."""
+
+    def use_pk_only_optimization(self):
+        return False
+
+    def to_representation(self, value):
+        return {field.attname: getattr(value, field.attname)
+                for field in value._meta.concrete_fields}
+
+
+class ActivityRelatedField(ValuesRelatedField):
+    """ValuesRelatedField Активностей: id проверяются по реестру, без БД."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            activity = activities.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if activity is None:
+            self.fail('does_not_exist', pk_value=data)
+        return activity
+
+
+class ActivityNameField(serializers.RelatedField):
+    """Название Активности по строке ActivityService из реестра."""
+
+    def to_representation(self, value):
+        activity = activities.get(value.activity_id)
+        return activity.name if activity else str(value.activity)
@@ -1,10 +1,37 @@
 from django_filters.rest_framework import (FilterSet,
                                            BooleanFilter,
                                            CharFilter,
-                                           ModelMultipleChoiceFilter)
+                                           ChoiceFilter,
+                                           MultipleChoiceFilter)
+from rest_framework.exceptions import ValidationError
 
 from services.models import (Activity,
                              Service)
+from services.ranking import order_by_rank
+from services.registry import activities
+
+from .utils import get_point
+
+
+def activity_choices():
+    return activities.choices()
+
+
+class ActivityFilter(MultipleChoiceFilter):
+    """Активности по slug: проверка по реестру, фильтр по id без JOIN."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', activity_choices)
+        super().__init__(*args, **kwargs)
+
+    def get_filter_predicate(self, v):
+        activity = activities.get_by_slug(v)
+        if activity is None:
+            # Активность удалена после проверки формы.
+            raise ValidationError({self.field_name: [
+                f'Активность {v} не найдена.'
+            ]})
+        return {self.field_name: activity.pk}
 
 
 class ActivityFilterSet(FilterSet):
@@ -17,15 +44,16 @@ class ActivityFilterSet(FilterSet):
 
 class ServiceFilterSet(FilterSet):
 
-    activities = ModelMultipleChoiceFilter(
-        field_name='activity__slug',
-        to_field_name='slug',
-        queryset=Activity.objects.all()
-    )
+    activities = ActivityFilter(field_name='activities')
     is_favorited = BooleanFilter(
         field_name='in_favorite_for_clients',
         method='is_exist_filter'
     )
+    near = CharFilter(method='near_filter')
+    ordering = ChoiceFilter(
+        choices=(('rank', 'По рейтингу'), ('-created', 'Сначала новые')),
+        method='ordering_filter'
+    )
 
     class Meta:
         model = Service
@@ -36,3 +64,12 @@ class ServiceFilterSet(FilterSet):
         if self.request.user.is_anonymous:
             return queryset
         return queryset.filter(**{lookup: self.request.user})
+
+    def near_filter(self, queryset, name, value):
+        return queryset
+
+    def ordering_filter(self, queryset, name, value):
+        if value != 'rank':
+            return queryset.order_by(value, '-id')
+        near = self.form.cleaned_data.get('near')
+        return order_by_rank(queryset, get_point(near) if near else None)
@@ -0,0 +1,205 @@
+import re
+import time
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+
+from rest_framework.test import APIClient
+
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+@dataclass
+class QueryPlan:
+    sql: str
+    plan: str
+
+    @property
+    def seq_scans(self):
+        return SEQ_SCAN.findall(self.plan)
+
+
+@dataclass
+class EndpointAudit:
+    url: str
+    status_code: int
+    latency: float
+    plans: list = field(default_factory=list)
+
+    @property
+    def seq_scans(self):
+        return sorted({table for plan in self.plans
+                       for table in plan.seq_scans})
+
+
+def generate_dataset(size):
+    """Синтетические данные: size Сервисов и пропорциональные связи.
+
+    Вызывается внутри транзакции, которую команда откатывает.
+    """
+    from services.models import (Comment,
+                                 Favorite,
+                                 Review,
+                                 Service)
+    from users.models import CustomUser, Subscribe
+
+    password = make_password('audit')
+    masters_count = max(size // 5, 1)
+    clients_count = max(size // 2, 1)
+    users = CustomUser.objects.bulk_create([
+        CustomUser(username=f'audit{number}',
+                   email=f'audit{number}@example.com',
+                   email_normalized=f'audit{number}@example.com',
+                   phone_number=f'+7900{number:07d}',
+                   password=password,
+                   is_master=number < masters_count)
+        for number in range(masters_count + clients_count)
+    ])
+    masters = users[:masters_count]
+    clients = users[masters_count:]
+
+    services = Service.objects.bulk_create([
+        Service(name=f'Сервис {number}',
+                description='Описание',
+                master=masters[number % masters_count],
+                image='services/image/audit.jpg',
+                phone_number='+79000000000')
+        for number in range(size)
+    ])
+    reviews = Review.objects.bulk_create([
+        Review(service=service, author=client, text='Отзыв',
+               score=(service.pk + client.pk) % 10 + 1)
+        for service in services
+        for client in clients[service.pk % 7::7][:10]
+    ])
+    Comment.objects.bulk_create([
+        Comment(review=review, author=masters[0], text='Комментарий')
+        for review in reviews[::2]
+    ])
+    Favorite.objects.bulk_create([
+        Favorite(client=client, service=service)
+        for client in clients
+        for service in services[client.pk % 11::11][:5]
+    ])
+    Subscribe.objects.bulk_create([
+        Subscribe(client=client, master=master)
+        for client in clients
+        for master in masters[client.pk % 3::3][:5]
+    ])
+
+
+def generate_reviews(count, days):
+    """count Отзывов за последние days дней одним INSERT ... SELECT.
+
+    Пары (Сервис, автор) перебираются по порядку, повторы пропускаются;
+    к каждому второму Отзыву Мастер оставляет комментарий.
+    """
+    from services.models import Comment, Review, Service
+    from users.models import CustomUser
+
+    services = list(Service.objects.values_list('pk', flat=True))
+    authors = list(CustomUser.objects.filter(
+        is_master=False
+    ).values_list('pk', flat=True))
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {Review._meta.db_table} '
+            '(service_id, author_id, text, score, pub_date) '
+            'SELECT ids.services[1 + mod(n, cardinality(ids.services))], '
+            'ids.authors[1 + mod(n / cardinality(ids.services), '
+            'cardinality(ids.authors))], '
+            "'Отзыв', 1 + mod(n, 10), "
+            "now() - random() * %s * interval '1 day' "
+            'FROM generate_series(0, %s - 1) AS n, '
+            '(SELECT %s::bigint[] AS services, '
+            '%s::bigint[] AS authors) AS ids '
+            'ON CONFLICT DO NOTHING',
+            [days, count, services, authors]
+        )
+        cursor.execute(
+            f'INSERT INTO {Comment._meta.db_table} '
+            '(review_id, author_id, text, pub_date) '
+            "SELECT review.id, service.master_id, 'Комментарий', "
+            "least(now(), review.pub_date + random() * interval '7 days') "
+            f'FROM {Review._meta.db_table} AS review '
+            f'JOIN {Service._meta.db_table} AS service '
+            'ON service.id = review.service_id '
+            'WHERE mod(review.id, 2) = 0'
+        )
+        cursor.execute(f'ANALYZE {Review._meta.db_table}')
+        cursor.execute(f'ANALYZE {Comment._meta.db_table}')
+
+
+def get_endpoints():
+    """URL list/detail для каждого маршрута роутера API."""
+    from services.models import Comment
+    from users.models import CustomUser
+
+    from .urls import router
+
+    comment = Comment.objects.select_related('review').order_by('pk').first()
+    master = CustomUser.objects.filter(is_master=True).order_by('pk').first()
+    client = CustomUser.objects.filter(is_master=False).order_by('pk').first()
+    if not (comment and master and client):
+        return []
+    kwargs = {'service_id': comment.review.service_id,
+              'review_id': comment.review_id}
+    detail_pks = {'service': comment.review.service_id,
+                  'reviews': comment.review_id,
+                  'comments': comment.pk,
+                  'masters': master.pk,
+                  'users': client.pk}
+
+    urls = []
+    for prefix, viewset, basename in router.registry:
+        route_kwargs = {name: value for name, value in kwargs.items()
+                        if f'<{name}>' in prefix}
+        urls.append(reverse(f'api:{basename}-list', kwargs=route_kwargs))
+        if basename in detail_pks:
+            lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+            try:
+                urls.append(reverse(
+                    f'api:{basename}-detail',
+                    kwargs={**route_kwargs, lookup: detail_pks[basename]}
+                ))
+            except NoReverseMatch:
+                pass
+    return urls
+
+
+def explain(sql, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, FORMAT TEXT) {sql}')
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def audit_endpoint(client, url, repeat=10, using=DEFAULT_DB_ALIAS):
+    """Средняя задержка эндпоинта и планы всех его SELECT."""
+    connection = connections[using]
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        client.get(url)
+    latency = (time.perf_counter() - started) / repeat
+
+    audit = EndpointAudit(url, response.status_code, latency)
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if sql.lstrip().upper().startswith('SELECT'):
+            audit.plans.append(QueryPlan(sql, explain(sql, using)))
+    return audit
+
+
+def audit_endpoints(repeat=10):
+    """Аудит всех эндпоинтов роутера от имени клиента."""
+    from users.models import CustomUser
+
+    client = APIClient()
+    user = CustomUser.objects.filter(is_master=False).order_by('pk').first()
+    client.force_authenticate(user)
+    return [audit_endpoint(client, url, repeat) for url in get_endpoints()]
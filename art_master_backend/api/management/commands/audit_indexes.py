@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.index_audit import audit_endpoints, generate_dataset
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN ANALYZE запросов каждого эндпоинта роутера API: '
+            'задержка, число запросов и последовательные сканирования. '
+            'С --generate данные создаются во временной транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generate', type=int, default=0, metavar='SERVICES',
+            help='Сгенерировать набор данных на указанное число Сервисов.'
+        )
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--plans', action='store_true',
+                            help='Печатать полные планы запросов.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['generate']:
+                    generate_dataset(options['generate'])
+                self.report(audit_endpoints(options['repeat']),
+                            options['plans'])
+                if options['generate']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, audits, show_plans):
+        if not audits:
+            self.stdout.write(self.style.WARNING(
+                'Нет данных для аудита: запустите с --generate.'
+            ))
+        for audit in audits:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'GET {audit.url} -> {audit.status_code}: '
+                f'{audit.latency * 1000:.2f} ms, '
+                f'запросов: {len(audit.plans)}'
+            ))
+            if audit.seq_scans:
+                self.stdout.write(self.style.WARNING(
+                    f'  Seq Scan: {", ".join(audit.seq_scans)}'
+                ))
+            if show_plans:
+                for plan in audit.plans:
+                    self.stdout.write(f'  {plan.sql}\n{plan.plan}\n')
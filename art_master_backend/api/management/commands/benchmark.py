@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Запуск сценариев бенчмарка на текущей базе данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*',
+            help=f'Сценарии: {", ".join(SCENARIOS)}. По умолчанию все.'
+        )
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results = SCENARIOS[name](options['repeat'])
+            for label, seconds in results.items():
+                self.stdout.write(f'  {label}: {seconds * 1000:.3f} ms/op')
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from api.index_audit import audit_endpoint, generate_dataset, generate_reviews
+from services.archive import archive_reviews, relation_sizes
+from services.models import Comment, Review, Service
+
+
+class Rollback(Exception):
+    pass
+
+
+def compact():
+    """Перестраивает индексы горячих таблиц после переноса.
+
+    VACUUM внутри транзакции недоступен, поэтому размер самих таблиц
+    после переноса не меняется - сравниваются размеры индексов.
+    """
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        for model in (Review, Comment):
+            cursor.execute(f'REINDEX TABLE {model._meta.db_table}')
+            cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+
+class Command(BaseCommand):
+    help = ('Размер индексов и задержка ленты Отзывов до и после переноса '
+            'старых веток в архив на сгенерированных данных. Данные '
+            'создаются во временной транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=3000)
+        parser.add_argument('--reviews', type=int, default=2_000_000)
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Период дат сгенерированных Отзывов.')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                generate_dataset(options['services'])
+                generate_reviews(options['reviews'], options['days'])
+                self.report('Без архива', options['repeat'])
+                reviews, comments = archive_reviews()
+                compact()
+                self.report(f'В архиве отзывов: {reviews}, '
+                            f'комментариев: {comments}', options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, title, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for table, (table_size, indexes_size) in relation_sizes().items():
+            self.stdout.write(
+                f'  {table}: таблица {table_size / 2 ** 20:.1f} MB, '
+                f'индексы {indexes_size / 2 ** 20:.1f} MB'
+            )
+
+        service_id = Service.objects.order_by('pk').values_list(
+            'pk', flat=True
+        ).first()
+        client = APIClient()
+        for url in (
+            reverse('api:service-thread', kwargs={'pk': service_id}),
+            reverse('api:reviews-list', kwargs={'service_id': service_id}),
+        ):
+            audit = audit_endpoint(client, url, repeat)
+            self.stdout.write(
+                f'  GET {url} -> {audit.status_code}: '
+                f'{audit.latency * 1000:.2f} ms'
+            )
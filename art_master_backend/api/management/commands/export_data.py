@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import EXPORTS, parse_since, stream_export
+
+
+class Command(BaseCommand):
+    help = ('Потоковая выгрузка данных в CSV или JSONL; память не '
+            'зависит от размера таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='file_format',
+                            choices=('csv', 'jsonl'), default='jsonl')
+        parser.add_argument('--since', help='Только строки новее (ISO 8601).')
+        parser.add_argument('--since-id', type=int,
+                            help='И строки с временем --since и большим id.')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', help='Файл; по умолчанию stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'], options['since_id'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        chunks = stream_export(options['name'], options['file_format'],
+                               since, options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                output.writelines(chunks)
+        else:
+            sys.stdout.buffer.writelines(chunks)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.startup import (StartupError,
+                         group_by_package,
+                         measure_startup,
+                         run_startup)
+
+
+class Command(BaseCommand):
+    help = ('Время холодного старта: импорт по пакетам и модулям, '
+            'settings, django.setup() и загрузка URLconf.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Ошибка, если медиана старта больше STARTUP_BUDGET_SECONDS.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.profile(options)
+        except StartupError as error:
+            raise CommandError(str(error)) from error
+
+    def profile(self, options):
+        top = options['top']
+        _, records = run_startup(importtime=True)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Импорт по пакетам'))
+        for package, seconds in group_by_package(records)[:top]:
+            self.stdout.write(f'  {package}: {seconds * 1000:.1f} ms')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            'Модули (с зависимостями)'
+        ))
+        for record in sorted(records, key=lambda record: record.cumulative,
+                             reverse=True)[:top]:
+            self.stdout.write(
+                f'  {record.module}: {record.cumulative * 1000:.1f} ms'
+            )
+
+        timings = measure_startup(max(options['repeat'], 1))
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Этапы старта (медиана из {options["repeat"]})'
+        ))
+        for phase, seconds in timings.items():
+            self.stdout.write(f'  {phase}: {seconds * 1000:.1f} ms')
+
+        budget = settings.STARTUP_BUDGET_SECONDS
+        if options['check'] and timings['total'] > budget:
+            raise CommandError(
+                f'Холодный старт {timings["total"]:.2f} с больше бюджета '
+                f'{budget:.2f} с'
+            )
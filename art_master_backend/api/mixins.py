@@ -0,0 +1,137 @@
+import abc
+
+from django.conf import settings
+from django.http import Http404
+
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from art_master_backend.connections import statement_timeout
+from art_master_backend.db_router import replica_reads
+
+from .cache import FragmentCache
+from .fast_serializers import get_plan
+
+
+class StatementTimeoutMixin:
+    """Серверный statement_timeout (мс) на время обработки запроса.
+
+    По умолчанию берётся DATABASE_STATEMENT_TIMEOUT, вьюсет может
+    переопределить значение атрибутом statement_timeout. Подзапросы
+    /batch/ выполняются под ограничением пакета.
+    """
+    statement_timeout = None
+
+    def get_statement_timeout(self):
+        if self.statement_timeout is not None:
+            return self.statement_timeout
+        return settings.DATABASE_STATEMENT_TIMEOUT
+
+    def dispatch(self, request, *args, **kwargs):
+        with statement_timeout(self.get_statement_timeout()):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryReadsMixin:
+    """Чтение только с основной БД, в том числе для GET.
+
+    Для эндпоинтов, которым отставание реплики недопустимо.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(False):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class FastListMixin:
+    """Сериализация list по скомпилированному плану (FAST_SERIALIZERS).
+
+    Из БД выбираются только нужные сериализатору колонки, а строки
+    собираются в dict без объектов Field; вывод совпадает с обычным.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+
+        plan = get_plan(self.get_serializer_class())
+        queryset = self.filter_queryset(
+            self.get_queryset()
+        ).only(*plan.only_fields)
+        serialize = plan.bind(self.get_serializer_context())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                [serialize(instance) for instance in page]
+            )
+        return Response([serialize(instance) for instance in queryset])
+
+
+class FragmentCacheMixin(abc.ABC):
+    """list и retrieve из кэша сериализованных фрагментов (FRAGMENT_CACHE).
+
+    Страница строится по лёгкому queryset с персональными аннотациями,
+    представления объектов берутся мульти-get из FragmentCache, и
+    сериализуются только промахи; пересчёт горячих фрагментов
+    объединяется между запросами. Персональные поля накладываются
+    поверх фрагмента в personalize().
+    """
+    fragment_kind = None
+
+    @abc.abstractmethod
+    def get_fragment_queryset(self):
+        """Queryset страницы: порядок и фильтры list, без prefetch."""
+
+    @abc.abstractmethod
+    def make_fragment(self, data):
+        """Общая для всех пользователей часть представления."""
+
+    @abc.abstractmethod
+    def personalize(self, instance, fragment):
+        """Накладывает персональные поля instance на фрагмент."""
+
+    def serialize_many(self, queryset):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        if settings.FAST_SERIALIZERS:
+            plan = get_plan(serializer_class)
+            serialize = plan.bind(context)
+            return [serialize(instance)
+                    for instance in queryset.only(*plan.only_fields)]
+        return serializer_class(queryset, many=True, context=context).data
+
+    def build_fragments(self, pks):
+        return {data['id']: self.make_fragment(data)
+                for data in self.serialize_many(
+                    self.get_queryset().filter(pk__in=pks))}
+
+    def get_fragments(self, instances):
+        cache = FragmentCache(self.fragment_kind,
+                              self.request.build_absolute_uri('/'))
+        fragments = cache.get_many([instance.pk for instance in instances],
+                                   self.build_fragments)
+        return [self.personalize(instance, fragments[instance.pk])
+                for instance in instances if instance.pk in fragments]
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FRAGMENT_CACHE:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.get_fragment_queryset())
+        if page is None:
+            return super().list(request, *args, **kwargs)
+        return self.get_paginated_response(self.get_fragments(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.FRAGMENT_CACHE:
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        instance = get_object_or_404(
+            self.get_fragment_queryset(),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, instance)
+        fragments = self.get_fragments([instance])
+        if not fragments:
+            raise Http404
+        return Response(fragments[0])
@@ -0,0 +1,47 @@
+from rest_framework.pagination import (Cursor,
+                                       CursorPagination,
+                                       PageNumberPagination)
+
+
+class PageSizePagination(PageNumberPagination):
+    """Постраничная пагинация с ?page_size= до max_page_size."""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ThreadCursorPagination(CursorPagination):
+    """Keyset-пагинация ветки обсуждения: отзывы и комментарии."""
+    ordering = ('-pub_date', '-id')
+    comments_limit = 3
+    comments_limit_query_param = 'comments_limit'
+    max_comments_limit = 20
+
+    def get_comments_limit(self, request):
+        """Количество комментариев, встраиваемых в каждый отзыв."""
+        try:
+            limit = int(
+                request.query_params[self.comments_limit_query_param]
+            )
+        except (KeyError, ValueError):
+            return self.comments_limit
+        return min(max(limit, 0), self.max_comments_limit)
+
+    def get_link_after(self, url, instances):
+        """Ссылка на страницу сразу после instances - начала выборки.
+
+        Как в get_next_link: курсор стоит на последней позиции, отличной
+        от позиции последнего объекта, а offset пропускает объекты с
+        совпадающей позицией; без такой позиции - offset от начала.
+        """
+        self.base_url = url
+        positions = [self._get_position_from_instance(instance, self.ordering)
+                     for instance in instances]
+        position, offset = None, 0
+        for candidate in reversed(positions):
+            if candidate != positions[-1]:
+                position = candidate
+                break
+            offset += 1
+        return self.encode_cursor(
+            Cursor(offset=offset, reverse=False, position=position)
+        )
@@ -0,0 +1,54 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson, если он установлен.
+
+    Типы, которые orjson не сериализует сам (даты, Decimal, QuerySet,
+    ленивые строки), передаются кодировщику DRF, поэтому вывод совпадает
+    со стандартным JSONRenderer. Без orjson и для форматированного вывода
+    используется рендерер DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None
+                or data is None
+                or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        # Как и DRF, экранируем U+2028 и U+2029 для совместимости с JS.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(
+                b'\xe2\x80\xa8', b'\\u2028'
+            ).replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSON-парсер на orjson, если он установлен."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -1,33 +1,48 @@
 import re
 
-from geopy import Yandex
-
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.db import transaction
 from django.shortcuts import get_object_or_404
-
-from drf_extra_fields.fields import Base64ImageField
+from django.urls import reverse
 
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from phonenumber_field.modelfields import PhoneNumberField
+
 from djoser.serializers import (UserSerializer,
                                 UserCreateSerializer,
+                                SendEmailResetSerializer,
                                 TokenCreateSerializer)
 
+from services.duplicates import find_duplicate
 from services.models import (Activity,
                              Comment,
                              Location,
                              LocationService,
                              Review,
+                             ReviewHistory,
                              Service)
 
 from users.models import CustomUser
+from users.normalization import normalize_email
+
+from .fields import (ActivityNameField,
+                     ActivityRelatedField,
+                     FastDateTimeField,
+                     PhoneNumberCharField)
+
+from .pagination import ThreadCursorPagination
+
+from .utils import get_geocoder
+
 
 class ServiceContextSerializer(serializers.ModelSerializer):
     """Сериализатор отображения профиля рецепта в других контекстах."""
-    activities = serializers.StringRelatedField(many=True)
+    activities = ActivityNameField(source='in_activities',
+                                   many=True,
+                                   read_only=True)
 
     class Meta:
         model = Service
@@ -50,6 +65,15 @@ class RegisterUserSerializer(UserCreateSerializer):
                   'password',
                   'photo',)
 
+    def validate_email(self, data):
+        if CustomUser.objects.filter(
+            email_normalized=normalize_email(data)
+        ).exists():
+            raise serializers.ValidationError(
+                'Пользователь с таким email уже существует'
+            )
+        return data
+
     def validate_username(self, data):
         username = data
         error_symbols_list = []
@@ -108,7 +132,7 @@ class CustomTokenCreateSerializer(TokenCreateSerializer):
         )
 
         if not self.user:
-            self.user = CustomUser.objects.filter(**params).first()
+            self.user = CustomUser.objects.get_by_identity(**params)
             if self.user and not self.user.check_password(password):
                 raise serializers.ValidationError(
                     'Некорректный пароль пользователя!'
@@ -120,9 +144,35 @@ class CustomTokenCreateSerializer(TokenCreateSerializer):
         )
 
 
+class CustomSendEmailResetSerializer(SendEmailResetSerializer):
+    """Сериализатор сброса пароля с поиском по нормализованному email."""
+
+    def get_user(self, is_active=True):
+        user = CustomUser.objects.filter(
+            is_active=is_active,
+            email_normalized=normalize_email(self.data.get(self.email_field))
+        ).first()
+        if user and user.has_usable_password():
+            return user
+        if (settings.DJOSER.get('PASSWORD_RESET_SHOW_EMAIL_NOT_FOUND')
+                or settings.DJOSER.get('USERNAME_RESET_SHOW_EMAIL_NOT_FOUND')):
+            self.fail('email_not_found')
+
+
 class CustomUserSerializer(UserSerializer):
     """Кастомный базовый сериализатор всех пользователей."""
-    pass
+
+    def validate_email(self, data):
+        users = CustomUser.objects.filter(
+            email_normalized=normalize_email(data)
+        )
+        if self.instance is not None:
+            users = users.exclude(pk=self.instance.pk)
+        if users.exists():
+            raise serializers.ValidationError(
+                'Пользователь с таким email уже существует'
+            )
+        return data
 
 
 class MasterSerializer(CustomUserSerializer):
@@ -143,12 +193,16 @@ class MasterSerializer(CustomUserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, master):
+        if hasattr(master, 'is_subscribed'):
+            return master.is_subscribed
         client = self.context['request'].user
         if client.is_anonymous:
             return False
         return client.subscriptions.filter(master=master).exists()
 
     def get_subscribers_count(self, master):
+        if hasattr(master, 'subscribers_count'):
+            return master.subscribers_count
         return master.subscribers.all().count()
 
 
@@ -185,24 +239,57 @@ class MasterContextSerializer(CustomUserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, master):
+        if hasattr(master, 'is_subscribed'):
+            return master.is_subscribed
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return user.subscriptions.filter(master=master).exists()
 
     def get_subscribers_count(self, master):
+        if hasattr(master, 'subscribers_count'):
+            return master.subscribers_count
         return master.subscribers.all().count()
 
 
+class RelationBulkSerializer(serializers.Serializer):
+    """Сериализатор массового добавления/удаления связей."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """Подзапрос пакета: только GET к API."""
+    method = serializers.ChoiceField(choices=('GET',), default='GET')
+    url = serializers.CharField(max_length=2048)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Сериализатор пакетного запроса."""
+    requests = BatchRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'Не больше {settings.BATCH_MAX_REQUESTS} подзапросов.'
+            )
+        return value
+
+
 class ActivitySerializer(serializers.ModelSerializer):
     """Сериализатор Активностей."""
+    services_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Activity
         fields = ('id',
                   'name',
                   'description',
-                  'slug')
+                  'slug',
+                  'services_count')
 
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -217,14 +304,31 @@ class LocationSerializer(serializers.ModelSerializer):
                   'point')
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class DuplicateTextMixin:
+    """Отклоняет текст, почти совпадающий с опубликованным.
+
+    Кандидаты ищутся по LSH-корзинам MinHash-подписей, а не перебором
+    истории; при DUPLICATE_TEXTS['ACTION'] = 'flag' текст принимается,
+    а дубликат отмечается при сохранении.
+    """
+
+    def validate_text(self, text):
+        if (settings.DUPLICATE_TEXTS['ACTION'] == 'reject'
+                and find_duplicate(text, self.instance) is not None):
+            raise serializers.ValidationError(
+                'Почти такой же текст уже опубликован'
+            )
+        return text
+
+
+class CommentSerializer(DuplicateTextMixin, serializers.ModelSerializer):
     """Сериализатор Комментариев к Отзывам."""
     author = serializers.SlugRelatedField(
         default=serializers.CurrentUserDefault(),
         slug_field='username',
         read_only=True
     )
-    pub_date = serializers.DateTimeField(read_only=True, format='%d.%m.%Y')
+    pub_date = FastDateTimeField(read_only=True, format='%d.%m.%Y')
 
     class Meta:
         model = Comment
@@ -235,7 +339,7 @@ class CommentSerializer(serializers.ModelSerializer):
                   'pub_date')
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DuplicateTextMixin, serializers.ModelSerializer):
     """Сериализатор Отзывов к Сервисам."""
     service = serializers.SlugRelatedField(
         slug_field='name',
@@ -246,7 +350,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         slug_field='username',
         read_only=True
     )
-    pub_date = serializers.DateTimeField(read_only=True, format='%d.%m.%Y')
+    pub_date = FastDateTimeField(read_only=True, format='%d.%m.%Y')
     comments = CommentSerializer(read_only=True, many=True)
 
     class Meta:
@@ -270,16 +374,52 @@ class ReviewSerializer(serializers.ModelSerializer):
                 'Запрещено оставлять отзыв о качестве собственных услуг'
             )
         if request.method == 'POST':
-            if Review.objects.filter(service=service, author=author):
+            if ReviewHistory.objects.filter(service=service,
+                                            author=author).exists():
                 raise serializers.ValidationError(
                     'Можно оставить только один отзыв'
                 )
         return data
 
 
+class ThreadReviewSerializer(ReviewSerializer):
+    """Сериализатор Отзывов в ветке обсуждения Сервиса."""
+    comments = serializers.SerializerMethodField()
+    comments_next = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Review
+        fields = ('id',
+                  'author',
+                  'text',
+                  'score',
+                  'pub_date',
+                  'comments',
+                  'comments_next')
+
+    def get_comments(self, review):
+        comments = review.thread_comments[:self.context['comments_limit']]
+        return CommentSerializer(comments, many=True).data
+
+    def get_comments_next(self, review):
+        limit = self.context['comments_limit']
+        if len(review.thread_comments) <= limit:
+            return None
+        url = self.context['request'].build_absolute_uri(
+            reverse('api:comments-thread',
+                    kwargs={'service_id': review.service_id,
+                            'review_id': review.id})
+        )
+        if not limit:
+            return url
+        return ThreadCursorPagination().get_link_after(
+            url, review.thread_comments[:limit]
+        )
+
+
 class ReviewContextSerializer(serializers.ModelSerializer):
     """Сериализатор Отзывов к Сервисам в других контекстах."""
-    pub_date = serializers.DateTimeField(read_only=True, format='%d.%m.%Y')
+    pub_date = FastDateTimeField(read_only=True, format='%d.%m.%Y')
 
     class Meta:
         model = Review
@@ -287,16 +427,23 @@ class ReviewContextSerializer(serializers.ModelSerializer):
 
 
 class ServiceSerializer(serializers.ModelSerializer):
-    """Сериализатор Сервиса."""
+    """Сериализатор Сервиса.
+
+    reviews - только горячие Отзывы, вся история с архивом отдаётся
+    /services/{id}/reviews/; rating считается по всей истории.
+    """
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        PhoneNumberField: PhoneNumberCharField,
+    }
     master = MasterContextSerializer(
         default=serializers.CurrentUserDefault()
     )
-    activities = serializers.PrimaryKeyRelatedField(
+    activities = ActivityRelatedField(
         queryset=Activity.objects.all(), many=True
     )
     locations = LocationSerializer(many=True)
-    image = Base64ImageField()
-    created = serializers.DateTimeField(read_only=True, format='%d.%m.%Y')
+    created = FastDateTimeField(read_only=True, format='%d.%m.%Y')
     reviews = ReviewContextSerializer(read_only=True, many=True)
     rating = serializers.IntegerField(read_only=True)
     is_favorited = serializers.SerializerMethodField()
@@ -323,17 +470,23 @@ class ServiceSerializer(serializers.ModelSerializer):
                                     fields=['master', 'name'])
         ]
 
+    def get_fields(self):
+        # drf_extra_fields (и Pillow) загружаются при первой сериализации.
+        from drf_extra_fields.fields import Base64ImageField
+
+        fields = super().get_fields()
+        fields['image'] = Base64ImageField()
+        return fields
+
     def get_location(self, location):
         if location.get('address'):
-            location_data = Yandex(
-                api_key=settings.API_KEY
-            ).geocode(location['address'])
+            location_data = get_geocoder().geocode(location['address'])
             location['address'] = location_data.address
             location['point'] = f'POINT({location_data.longitude} {location_data.latitude})'
 
         elif location.get('point'):
             point = location.get('point')
-            location_data = Yandex(api_key=settings.API_KEY).reverse(point)
+            location_data = get_geocoder().reverse(point)
 
             location['address'] = location_data.address
             location['point'] = f'POINT({point})'
@@ -369,12 +522,9 @@ class ServiceSerializer(serializers.ModelSerializer):
         return service
 
     def get_is_favorited(self, service):
+        if hasattr(service, 'is_favorited'):
+            return service.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return user.favorite_services.filter(service=service).exists()
-
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        data['activities'] = instance.activities.values()
-        return data
@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from services.models import (Activity,
+                             ActivityService,
+                             Location,
+                             LocationService,
+                             Review,
+                             ReviewArchive,
+                             Service)
+from services.signals import (relations_created,
+                              rows_archived,
+                              rows_deactivated,
+                              rows_deleted)
+from users.models import CustomUser, Subscribe
+
+from .cache import bump_versions
+
+# Поля пользователя, которых нет во фрагментах: их сохранение (вход,
+# смена пароля) не инвалидирует Мастера.
+UNRENDERED_USER_FIELDS = frozenset({'last_login', 'password'})
+
+
+def invalidate(services=(), masters=()):
+    """Меняет версии фрагментов после фиксации транзакции.
+
+    Раньше фиксации нельзя: параллельный запрос успел бы сохранить
+    под новой версией ещё старые данные.
+    """
+    services, masters = set(services), set(masters)
+    transaction.on_commit(lambda: (bump_versions('service', services),
+                                   bump_versions('master', masters)))
+
+
+def invalidate_services(service_ids):
+    """Сервисы и их Мастера: в фрагменте Мастера есть его Сервисы."""
+    service_ids = set(service_ids)
+    invalidate(service_ids, Service.objects.filter(
+        pk__in=service_ids
+    ).values_list('master_id', flat=True))
+
+
+def invalidate_masters(master_ids):
+    """Мастера и их Сервисы: в фрагменте Сервиса есть его Мастер."""
+    master_ids = set(master_ids)
+    invalidate(Service.objects.filter(
+        master_id__in=master_ids
+    ).values_list('pk', flat=True), master_ids)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def service_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate([instance.pk], [instance.master_id])
+
+
+@receiver(m2m_changed, sender=ActivityService)
+def activities_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate([instance.pk], [instance.master_id])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_services(pk_set)
+    elif action == 'pre_clear':
+        invalidate_services(instance.services.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=ActivityService)
+@receiver(post_delete, sender=ActivityService)
+@receiver(post_save, sender=LocationService)
+@receiver(post_delete, sender=LocationService)
+def service_relation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_services([instance.service_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def reviews_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate([instance.service_id])
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Location)
+def service_object_changed(sender, instance, created, raw=False, **kwargs):
+    if not (created or raw):
+        invalidate_services(instance.services.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def master_changed(sender, instance, raw=False, update_fields=None,
+                   **kwargs):
+    if raw or not instance.is_master:
+        return
+    if update_fields and update_fields <= UNRENDERED_USER_FIELDS:
+        return
+    invalidate_masters([instance.pk])
+
+
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def subscribers_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_masters([instance.master_id])
+
+
+@receiver(relations_created, sender=Subscribe)
+def subscribers_added(sender, rows, **kwargs):
+    invalidate_masters([row['master'] for row in rows])
+
+
+@receiver(rows_deleted, sender=Service)
+@receiver(rows_deactivated, sender=Service)
+def services_deleted(sender, rows, **kwargs):
+    invalidate([row['pk'] for row in rows],
+               [row['master'] for row in rows])
+
+
+@receiver(rows_deleted, sender=Review)
+@receiver(rows_deleted, sender=ReviewArchive)
+@receiver(rows_archived, sender=Review)
+def reviews_deleted(sender, rows, **kwargs):
+    invalidate([row['service'] for row in rows])
+
+
+@receiver(rows_deleted, sender=Subscribe)
+def subscribers_deleted(sender, rows, **kwargs):
+    invalidate_masters([row['master'] for row in rows])
@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+
+# Выполняется в отдельном процессе: холодный старт без кэшей текущего.
+STARTUP_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+settings_loaded = time.perf_counter()
+django.setup()
+apps_ready = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls_loaded = time.perf_counter()
+print(json.dumps({
+    'settings': settings_loaded - started,
+    'apps ready': apps_ready - settings_loaded,
+    'urls': urls_loaded - apps_ready,
+    'total': urls_loaded - started,
+}))
+'''
+
+
+class StartupError(Exception):
+    """Процесс холодного старта завершился с ошибкой."""
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_time: float
+    cumulative: float
+
+    @property
+    def package(self):
+        return self.module.split('.')[0]
+
+
+def run_startup(importtime=False):
+    """Этапы холодного старта (с) и записи -X importtime процесса."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    base_dir = str(settings.BASE_DIR)
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [base_dir, env.get('PYTHONPATH')])
+    )
+    result = subprocess.run(command + ['-c', STARTUP_SCRIPT],
+                            capture_output=True, text=True,
+                            cwd=base_dir, env=env)
+    if result.returncode:
+        # Без строк -X importtime остаётся трассировка ошибки.
+        errors = [line for line in result.stderr.splitlines()
+                  if not line.startswith('import time:')]
+        raise StartupError(
+            f'Процесс старта завершился с кодом {result.returncode}:\n'
+            + '\n'.join(errors[-20:])
+        )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(result.stderr) if importtime else []
+
+
+def parse_importtime(output):
+    """Строки 'import time: self | cumulative | module' (мкс) в записи."""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, module = line[12:].split('|')
+        if not self_time.strip().isdigit():
+            continue
+        records.append(ImportRecord(module.strip(),
+                                    int(self_time) / 1e6,
+                                    int(cumulative) / 1e6))
+    return records
+
+
+def group_by_package(records):
+    """Собственное время импорта по пакетам верхнего уровня."""
+    totals = defaultdict(float)
+    for record in records:
+        totals[record.package] += record.self_time
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure_startup(repeat):
+    """Медиана этапов холодного старта по repeat запускам."""
+    runs = [run_startup()[0] for _ in range(repeat)]
+    return {phase: statistics.median(run[phase] for run in runs)
+            for phase in runs[0]}
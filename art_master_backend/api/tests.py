@@ -1,3 +1,646 @@
-from django.test import TestCase
+import gzip
+import json
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
+from django.test import (SimpleTestCase,
+                         TestCase,
+                         TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from services.deletion import deactivate_services
+from services.models import (Activity,
+                             ActivityService,
+                             Comment,
+                             Favorite,
+                             Location,
+                             LocationService,
+                             Review,
+                             Service)
+from users.models import CustomUser, Subscribe
+
+from .cache import (Entry,
+                    get_lock,
+                    get_or_set_many,
+                    get_versions,
+                    jittered)
+from .batch import Batch
+from .export import (EXPORTS,
+                     Export,
+                     encode_csv,
+                     encode_jsonl,
+                     gzip_stream,
+                     parse_since)
+from .throttling import (LocalWindowStore,
+                         SlidingWindowThrottle,
+                         estimate,
+                         get_wait)
+from .utils import bulk_create_relation, create_relations
+
+
+class ConcurrentRelationTest(TransactionTestCase):
+    """Вставка связей при конкурирующих транзакциях."""
+
+    def setUp(self):
+        self.master = self.create_user(1, is_master=True)
+        self.client_user = self.create_user(2)
+        self.service = Service.objects.create(
+            name='Услуга',
+            description='Описание',
+            master=self.master,
+            image='services/image/service.jpg',
+            phone_number='+79990000000'
+        )
+        self.request = SimpleNamespace(user=self.client_user)
+
+    def create_user(self, number, **kwargs):
+        return CustomUser.objects.create_user(
+            email=f'user{number}@example.com',
+            username=f'user{number}',
+            phone_number=f'+7999000{number:04}',
+            password='password',
+            **kwargs
+        )
+
+    def add_favorite(self):
+        return create_relations(self.request, Favorite,
+                                [self.service.pk], 'service')
+
+    def run_concurrently(self, action, holder):
+        """action в основном потоке, пока holder держит транзакцию.
+
+        Транзакция holder фиксируется через 0.2 с, когда action уже
+        ждёт её блокировки.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with transaction.atomic():
+                    holder()
+                    started.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.assertTrue(started.wait(10))
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        try:
+            return action()
+        finally:
+            release.set()
+            timer.cancel()
+            thread.join()
+
+    def test_concurrent_duplicate_inserts(self):
+        created = []
+        created.append(self.run_concurrently(
+            self.add_favorite, lambda: created.append(self.add_favorite())
+        ))
+        self.assertEqual(sorted(map(len, created)), [0, 1])
+        self.assertEqual(Favorite.objects.count(), 1)
+
+    def test_target_deleted_inside_nested_atomic(self):
+        with transaction.atomic():
+            with self.assertRaises(IntegrityError):
+                self.run_concurrently(self.add_favorite,
+                                      Service.objects.all().delete)
+            # Внешняя транзакция не прервана и фиксируется без ошибки.
+            self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(Service.objects.exists())
+
+    def test_bulk_target_deleted(self):
+        def add_favorites():
+            return bulk_create_relation(self.request, Service.objects.all(),
+                                        Favorite, [self.service.pk],
+                                        'service')
+
+        with self.assertRaises(Http404):
+            self.run_concurrently(add_favorites,
+                                  Service.objects.all().delete)
+        self.assertFalse(Favorite.objects.exists())
+
+
+@override_settings(FRAGMENT_CACHE=False)
+class FastSerializerGoldenTest(TestCase):
+    """Планы FAST_SERIALIZERS выдают то же, что сериализаторы DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            CustomUser.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                phone_number=f'+7999000{number:04}',
+                password='password',
+                is_master=number < 3
+            )
+            for number in range(1, 5)
+        ]
+        cls.masters, cls.client_user = users[:2], users[3]
+        activity = Activity.objects.create(name='Керамика',
+                                           description='Описание',
+                                           slug='ceramics')
+        location = Location.objects.create(address='Москва',
+                                           point=Point(37.62, 55.75))
+        cls.services = [
+            Service.objects.create(name=f'Услуга {number}',
+                                   description='Описание',
+                                   master=cls.masters[number % 2],
+                                   image='services/image/service.jpg',
+                                   phone_number='+79990000000',
+                                   **extra)
+            for number, extra in enumerate([
+                {'site_address': 'https://example.com',
+                 'social_network_contacts': '@master'},
+                {},
+                {},
+            ])
+        ]
+        ActivityService.objects.create(activity=activity,
+                                       service=cls.services[0])
+        LocationService.objects.create(location=location,
+                                       service=cls.services[0])
+        Review.objects.create(service=cls.services[0],
+                              author=users[2],
+                              text='Отличный мастер, всё понравилось',
+                              score=9)
+        Favorite.objects.create(client=cls.client_user,
+                                service=cls.services[0])
+        Subscribe.objects.create(client=cls.client_user,
+                                 master=cls.masters[0])
+
+    def get_both(self, url, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        responses = []
+        for fast in (False, True):
+            with override_settings(FAST_SERIALIZERS=fast):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses.append(response.json())
+        slow, fast = responses
+        self.assertEqual(fast, slow)
+        return slow['results']
+
+    def test_services(self):
+        for user in (None, self.client_user):
+            with self.subTest(user=user):
+                results = self.get_both('/api/services/', user)
+                self.assertEqual(len(results), len(self.services))
+                by_id = {service['id']: service for service in results}
+                full = by_id[self.services[0].pk]
+                self.assertEqual(len(full['activities']), 1)
+                self.assertEqual(len(full['locations']), 1)
+                self.assertEqual(len(full['reviews']), 1)
+                self.assertEqual(full['rating'], 9)
+                self.assertEqual(full['is_favorited'], user is not None)
+                self.assertEqual(full['master']['is_subscribed'],
+                                 user is not None)
+                empty = by_id[self.services[1].pk]
+                self.assertIsNone(empty['site_address'])
+                self.assertIsNone(empty['social_network_contacts'])
+                self.assertIsNone(empty['rating'])
+                self.assertEqual(empty['reviews'], [])
+                self.assertFalse(empty['is_favorited'])
+
+    def test_masters(self):
+        for user in (None, self.client_user):
+            with self.subTest(user=user):
+                results = self.get_both('/api/masters/', user)
+                self.assertEqual(
+                    [master['id'] for master in results],
+                    [master.pk for master in self.masters]
+                )
+                self.assertEqual(results[0]['is_subscribed'],
+                                 user is not None)
+                self.assertEqual(results[0]['subscribers_count'], 1)
+                self.assertFalse(results[1]['is_subscribed'])
+                self.assertEqual(len(results[1]['services']), 1)
+
+
+class ThreadCommentsNextTest(TestCase):
+    """Ссылка comments_next не теряет комментарии с той же датой."""
+
+    def test_equal_pub_dates_not_skipped(self):
+        master, author = (
+            CustomUser.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                phone_number=f'+7999000{number:04}',
+                password='password',
+                is_master=number == 1
+            )
+            for number in (1, 2)
+        )
+        service = Service.objects.create(name='Услуга',
+                                         description='Описание',
+                                         master=master,
+                                         image='services/image/service.jpg',
+                                         phone_number='+79990000000')
+        review = Review.objects.create(service=service, author=author,
+                                       text='Отзыв', score=7)
+        comments = [
+            Comment.objects.create(review=review, author=master,
+                                   text=f'Комментарий {number}')
+            for number in range(5)
+        ]
+        now = timezone.now()
+        Comment.objects.filter(pk=comments[0].pk).update(pub_date=now)
+        Comment.objects.exclude(pk=comments[0].pk).update(
+            pub_date=now - timedelta(hours=1)
+        )
+        expected = [comments[0].pk] + sorted(
+            (comment.pk for comment in comments[1:]), reverse=True
+        )
+
+        client = APIClient()
+        for limit in (1, 2, 3):
+            with self.subTest(limit=limit):
+                thread = client.get(f'/api/services/{service.pk}/thread/',
+                                    {'comments_limit': limit}).json()
+                embedded = thread['results'][0]
+                rest = client.get(embedded['comments_next']).json()
+                self.assertEqual(
+                    [comment['id'] for comment in embedded['comments']]
+                    + [comment['id'] for comment in rest['results']],
+                    expected
+                )
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'api-tests',
+}})
+class CacheCoalescingTest(SimpleTestCase):
+    """Объединение промахов, stale-while-revalidate и разброс TTL."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute_many(self, keys, delay=0):
+        self.calls.append(keys)
+        time.sleep(delay)
+        return {key: f'value:{key}:{len(self.calls)}' for key in keys}
+
+    def test_jitter_bounds(self):
+        options = {**settings.CACHE_COALESCING, 'JITTER': 0.1}
+        with override_settings(CACHE_COALESCING=options):
+            ttls = [jittered(100) for _ in range(1000)]
+        self.assertGreaterEqual(min(ttls), 90)
+        self.assertLessEqual(max(ttls), 110)
+        self.assertGreater(len(set(ttls)), 1)
+
+    def test_local_lock_single_flight(self):
+        options = {**settings.CACHE_COALESCING, 'LOCKS': 'local'}
+        results = []
+
+        def read():
+            results.append(get_or_set_many(
+                {'key': 1}, lambda keys: self.compute_many(keys, 0.2), 60
+            ))
+
+        with override_settings(CACHE_COALESCING=options):
+            threads = [threading.Thread(target=read) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.calls, [['key']])
+        self.assertEqual(results, [{'key': 'value:key:1'}] * 5)
+
+    def test_stale_while_revalidate(self):
+        cache.set('key', Entry('old', 1, time.time() - 1), 60)
+        lock = get_lock('key')
+        self.assertTrue(lock.acquire())
+        try:
+            # Ключ пересчитывает держатель блокировки, остальным - старое.
+            self.assertEqual(
+                get_or_set_many({'key': 1}, self.compute_many, 60),
+                {'key': 'old'}
+            )
+        finally:
+            lock.release()
+        self.assertEqual(self.calls, [])
+
+        self.assertEqual(get_or_set_many({'key': 1}, self.compute_many, 60),
+                         {'key': 'value:key:1'})
+        self.assertEqual(get_or_set_many({'key': 1}, self.compute_many, 60),
+                         {'key': 'value:key:1'})
+        self.assertEqual(self.calls, [['key']])
+
+    def test_new_version_recomputed(self):
+        get_or_set_many({'key': 1}, self.compute_many, 60)
+        self.assertEqual(get_or_set_many({'key': 2}, self.compute_many, 60),
+                         {'key': 'value:key:2'})
+
+
+class SlidingWindowTest(SimpleTestCase):
+    """Оценка скользящего окна и время ожидания после отказа."""
+    LIMIT, DURATION = 10, 60
+    # Начало окна номер 100.
+    START = 100 * DURATION
+
+    def setUp(self):
+        self.store = LocalWindowStore()
+
+    def hit(self, at, cost=1):
+        return self.store.hit('key', cost, self.LIMIT, self.DURATION,
+                              self.START + at)
+
+    def test_previous_window_weight(self):
+        self.assertEqual(estimate(10, 5, 0), 15)
+        self.assertAlmostEqual(estimate(10, 5, 0.99), 5.1)
+        self.assertEqual(estimate(10, 5, 1), 5)
+
+    def test_get_wait(self):
+        # Есть место без учёта предыдущего окна: ждать его затухания.
+        self.assertAlmostEqual(get_wait(10, 2, 1, 10, 0.1, 60), 12)
+        self.assertEqual(get_wait(10, 2, 1, 10, 0.5, 60), 0)
+        # Текущее окно заполнено: ждать, пока оно станет предыдущим.
+        self.assertAlmostEqual(get_wait(0, 10, 1, 10, 0.5, 60), 36)
+        self.assertAlmostEqual(get_wait(0, 0, 11, 10, 0.25, 60), 45)
+
+    def test_hit_near_window_edge(self):
+        for _ in range(self.LIMIT):
+            self.assertEqual(self.hit(30), (True, None))
+        allowed, wait = self.hit(30)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 36)
+
+        # В начале следующего окна предыдущее весит почти полностью.
+        self.assertFalse(self.hit(self.DURATION + 1)[0])
+        self.assertFalse(self.hit(30 + wait - 1)[0])
+        self.assertTrue(self.hit(30 + wait + 1)[0])
+        # У конца окна вес предыдущего почти нулевой.
+        for _ in range(self.LIMIT - 2):
+            self.assertTrue(self.hit(2 * self.DURATION - 1)[0])
+        self.assertFalse(self.hit(2 * self.DURATION - 1)[0])
+
+    def test_key_required(self):
+        with self.assertRaises(TypeError):
+            SlidingWindowThrottle()
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'fragment-invalidation-tests',
+}})
+class FragmentInvalidationTest(TestCase):
+    """Какие фрагменты инвалидирует изменение каждой модели."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.masters = [
+            CustomUser.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                phone_number=f'+7999000{number:04}',
+                password='password',
+                is_master=number < 3
+            )
+            for number in range(1, 4)
+        ]
+        cls.client_user = cls.masters.pop()
+        cls.services = [
+            Service.objects.create(name=f'Услуга {number}',
+                                   description='Описание',
+                                   master=master,
+                                   image='services/image/service.jpg',
+                                   phone_number='+79990000000')
+            for number, master in enumerate(cls.masters)
+        ]
+        cls.activity = Activity.objects.create(name='Керамика',
+                                               description='Описание',
+                                               slug='ceramics')
+        ActivityService.objects.create(activity=cls.activity,
+                                       service=cls.services[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_versions(self):
+        return (
+            get_versions('service', [service.pk for service in self.services]),
+            get_versions('master', [master.pk for master in self.masters]),
+        )
+
+    def assertInvalidates(self, action, services=(), masters=()):
+        services_before, masters_before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+        services_after, masters_after = self.get_versions()
+        self.assertEqual(
+            {pk for pk in services_after
+             if services_after[pk] != services_before[pk]},
+            {self.services[index].pk for index in services}
+        )
+        self.assertEqual(
+            {pk for pk in masters_after
+             if masters_after[pk] != masters_before[pk]},
+            {self.masters[index].pk for index in masters}
+        )
+
+    def test_service_saved(self):
+        service = self.services[0]
+        service.name = 'Новое название'
+        self.assertInvalidates(service.save, services=[0], masters=[0])
+
+    def test_review_added(self):
+        self.assertInvalidates(
+            lambda: Review.objects.create(service=self.services[1],
+                                          author=self.client_user,
+                                          text='Отзыв',
+                                          score=8),
+            services=[1]
+        )
+
+    def test_activity_renamed(self):
+        self.activity.name = 'Гончарное дело'
+        self.assertInvalidates(self.activity.save, services=[0], masters=[0])
+
+    def test_master_saved(self):
+        master = self.masters[1]
+        master.first_name = 'Имя'
+        self.assertInvalidates(master.save, services=[1], masters=[1])
+
+    def test_master_login_not_rendered(self):
+        self.assertInvalidates(
+            lambda: update_last_login(None, self.masters[0])
+        )
+        self.assertInvalidates(
+            lambda: self.masters[0].save(update_fields=['password'])
+        )
+
+    def test_subscription_added(self):
+        self.assertInvalidates(
+            lambda: Subscribe.objects.create(client=self.client_user,
+                                             master=self.masters[0]),
+            services=[0], masters=[0]
+        )
+
+    def test_services_deactivated(self):
+        self.assertInvalidates(
+            lambda: deactivate_services(
+                Service.objects.filter(pk=self.services[1].pk)
+            ),
+            services=[1], masters=[1]
+        )
+
+
+class ExportEncodingTest(SimpleTestCase):
+    """Кодировщики строк выгрузки и потоковое gzip-сжатие."""
+
+    def setUp(self):
+        self.export = Export('test', None, 'created', (
+            ('id', None), ('tags', None), ('created', None),
+        ))
+        self.rows = [
+            {'id': 1, 'tags': ['a', 'b'],
+             'created': datetime(2024, 5, 1, 12, tzinfo=dt_timezone.utc)},
+            {'id': 2, 'tags': [], 'created': None},
+        ]
+
+    def test_csv(self):
+        self.assertEqual(
+            b''.join(encode_csv(self.export, self.rows)).decode(),
+            'id,tags,created\r\n'
+            '1,a|b,2024-05-01T12:00:00+00:00\r\n'
+            '2,,\r\n'
+        )
+
+    def test_jsonl(self):
+        lines = b''.join(encode_jsonl(self.export, self.rows)).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'id': 1, 'tags': ['a', 'b'],
+             'created': '2024-05-01T12:00:00Z'},
+            {'id': 2, 'tags': [], 'created': None},
+        ])
+
+    def test_gzip_stream(self):
+        chunks = [f'строка {number}\n'.encode() for number in range(10)]
+        parts = list(gzip_stream(iter(chunks), flush_every=4))
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+        # Без финального flush распаковывается всё до последнего сброса:
+        # данные уходят клиенту по ходу выгрузки.
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        self.assertEqual(decompressor.decompress(b''.join(parts[:-1])),
+                         b''.join(chunks[:8]))
+
+    def test_parse_since(self):
+        self.assertIsNone(parse_since(None))
+        since, pk = parse_since('2024-05-01T12:00:00', '7')
+        self.assertEqual(pk, 7)
+        self.assertTrue(timezone.is_aware(since))
+        self.assertIsNone(parse_since('2024-05-01T12:00:00')[1])
+        for value, since_id in (('вчера', None), ('2024-05-01', 'x'),
+                                (None, '7')):
+            with self.subTest(value=value, since_id=since_id):
+                with self.assertRaises(ValueError):
+                    parse_since(value, since_id)
+
+
+class ExportKeysetTest(TestCase):
+    """Курсор (время, id) не теряет строки с одинаковым временем."""
+
+    def test_equal_timestamps(self):
+        users = [
+            CustomUser.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                phone_number=f'+7999000{number:04}',
+                password='password'
+            )
+            for number in range(1, 5)
+        ]
+        moment = timezone.now()
+        CustomUser.objects.update(date_joined=moment)
+        CustomUser.objects.filter(pk=users[-1].pk).update(
+            date_joined=moment + timedelta(seconds=1)
+        )
+        export = EXPORTS['users']
+
+        def ids(since):
+            return [row['id'] for row in export.rows(since)]
+
+        self.assertEqual(ids(None), [user.pk for user in users])
+        self.assertEqual(ids((moment, users[1].pk)),
+                         [user.pk for user in users[2:]])
+        self.assertEqual(ids((moment, None)), [users[-1].pk])
+
+
+class BatchTest(TestCase):
+    """Пакет GET-подзапросов: ответы по слотам и одно списание лимита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.activity = Activity.objects.create(name='Керамика',
+                                               description='Описание',
+                                               slug='ceramics')
+
+    def post(self, *urls):
+        response = APIClient().post(
+            '/api/batch/', {'requests': [{'url': url} for url in urls]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(item['status'], item['body'])
+                for item in response.json()['responses']]
+
+    def test_dispatch(self):
+        (services, _), (activity, body), (missing, _) = self.post(
+            '/api/services/',
+            f'/api/activities/{self.activity.pk}/',
+            '/api/unknown/'
+        )
+        self.assertEqual((services, activity, missing), (200, 200, 404))
+        self.assertEqual(body['slug'], 'ceramics')
+
+    def test_not_batchable(self):
+        self.assertEqual(
+            self.post('/api/changes/', '/api/batch/'),
+            [(400, {'detail': 'URL недоступен в пакетном запросе.'})] * 2
+        )
+
+    def test_error_kept_in_slot(self):
+        retrieve = mock.patch('api.views.ActivityViewSet.retrieve',
+                              side_effect=RuntimeError)
+        with retrieve, self.assertLogs('django.request', 'ERROR'):
+            (failed, body), (services, _) = self.post(
+                f'/api/activities/{self.activity.pk}/', '/api/services/'
+            )
+        self.assertEqual((failed, services), (500, 200))
+        self.assertEqual(body, {'detail': 'Internal Server Error'})
+
+    def test_throttled_once(self):
+        store = mock.Mock()
+        store.hit.return_value = (True, None)
+        urls = ['/api/services/', '/api/services/?page_size=25',
+                f'/api/activities/{self.activity.pk}/']
+        with mock.patch('api.throttling.get_store', return_value=store):
+            self.post(*urls)
+        cost = Batch(SimpleNamespace(META={}, COOKIES={}), urls).cost
+        self.assertEqual(cost, 5)
+        # IP и эндпоинт пакета; пользователь анонимный, подзапросы
+        # лимит не расходуют.
+        self.assertEqual(store.hit.call_count, 2)
+        self.assertEqual({call.args[1] for call in store.hit.call_args_list},
+                         {cost})
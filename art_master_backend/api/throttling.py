@@ -0,0 +1,224 @@
+import abc
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from art_master_backend.metrics import metrics
+
+from users.normalization import normalize_email, normalize_phone_number
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'100/min' -> (100, 60)."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def estimate(previous, current, elapsed):
+    """Оценка скользящего окна по двум соседним фиксированным окнам."""
+    return previous * (1 - elapsed) + current
+
+
+def get_wait(previous, current, cost, limit, elapsed, duration):
+    """Секунды до момента, когда запрос стоимостью cost уложится в лимит."""
+    room = limit - current - cost
+    if room >= 0:
+        needed = 1 - room / previous if previous else 0
+        return max(needed - elapsed, 0) * duration
+    if not current:
+        # cost больше лимита: ждать конца окна, как при полном счётчике.
+        return (1 - elapsed) * duration
+    # В следующем окне текущий счётчик станет предыдущим.
+    needed = 1 - (limit - cost) / current
+    return (1 - elapsed + max(needed, 0)) * duration
+
+
+class LocalWindowStore:
+    """Счётчики скользящего окна в памяти процесса.
+
+    На ключ хранятся номер текущего окна, его счётчик, счётчик
+    предыдущего окна и момент устаревания; устаревшие ключи удаляются
+    раз в prune_every обращений. Лимиты действуют на процесс.
+    """
+    prune_every = 1000
+
+    def __init__(self):
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def hit(self, key, cost, limit, duration, now):
+        index, elapsed = divmod(now / duration, 1)
+        with self.lock:
+            entry = self.windows.get(key)
+            if entry is None or entry[0] < index - 1:
+                current, previous = 0, 0
+            elif entry[0] == index - 1:
+                current, previous = 0, entry[1]
+            else:
+                current, previous = entry[1], entry[2]
+
+            allowed = estimate(previous, current, elapsed) + cost <= limit
+            if allowed:
+                current += cost
+            self.windows[key] = (index, current, previous,
+                                 (index + 2) * duration)
+            self.hits += 1
+            if self.hits % self.prune_every == 0:
+                self.prune(now)
+
+        if allowed:
+            return True, None
+        return False, get_wait(previous, current, cost, limit, elapsed,
+                               duration)
+
+    def prune(self, now):
+        for key in [key for key, entry in self.windows.items()
+                    if entry[3] <= now]:
+            del self.windows[key]
+
+
+class CacheWindowStore:
+    """Счётчики скользящего окна в общем кэше (CACHES['default']).
+
+    Лимиты общие для всех процессов; между чтением и incr возможно
+    небольшое превышение лимита при одновременных запросах.
+    """
+
+    def hit(self, key, cost, limit, duration, now):
+        index, elapsed = divmod(now / duration, 1)
+        current_key = f'throttle:{key}:{int(index)}'
+        previous_key = f'throttle:{key}:{int(index) - 1}'
+        values = cache.get_many([current_key, previous_key])
+        current = values.get(current_key, 0)
+        previous = values.get(previous_key, 0)
+
+        if estimate(previous, current, elapsed) + cost > limit:
+            return False, get_wait(previous, current, cost, limit, elapsed,
+                                   duration)
+        cache.add(current_key, 0, duration * 2)
+        try:
+            cache.incr(current_key, cost)
+        except ValueError:
+            cache.set(current_key, cost, duration * 2)
+        return True, None
+
+
+STORES = {'local': LocalWindowStore, 'cache': CacheWindowStore}
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = STORES[settings.THROTTLE_STORE]()
+    return _store
+
+
+def get_cost(request, view):
+    """Стоимость запроса: throttle_cost вьюсета, для list - по page_size."""
+    cost = getattr(view, 'throttle_cost', 1)
+    paginator = (getattr(view, 'paginator', None)
+                 if getattr(view, 'action', None) == 'list' else None)
+    if paginator is not None and hasattr(paginator, 'get_page_size'):
+        page_size = paginator.get_page_size(request) or 0
+        cost *= max(math.ceil(page_size / api_settings.PAGE_SIZE), 1)
+    return cost
+
+
+class SlidingWindowThrottle(BaseThrottle, abc.ABC):
+    """Базовый троттлинг скользящим окном со стоимостью запросов."""
+    scope = None
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    @abc.abstractmethod
+    def get_key(self, request, view):
+        """Ключ ограничения; None - запрос не ограничивается."""
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if getattr(request._request, 'batch', False):
+            # Стоимость подзапроса уже списана с пакета /batch/.
+            return True
+        rate = self.get_rate()
+        key = self.get_key(request, view) if rate else None
+        if key is None:
+            return True
+
+        limit, duration = parse_rate(rate)
+        # Запрос дороже всего лимита (page_size при низком лимите)
+        # списывает весь лимит, а не отклоняется навсегда.
+        cost = min(get_cost(request, view), limit)
+        allowed, self.wait_seconds = get_store().hit(
+            f'{self.scope}:{key}', cost, limit, duration, time.time()
+        )
+        metrics.incr(f'throttle.{self.scope}.cost', cost)
+        metrics.incr(
+            f'throttle.{self.scope}.{"allowed" if allowed else "rejected"}'
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserRateThrottle(SlidingWindowThrottle):
+    """Лимит на аутентифицированного пользователя."""
+    scope = 'user'
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPRateThrottle(SlidingWindowThrottle):
+    """Лимит на IP-адрес.
+
+    Адрес берётся из REMOTE_ADDR; X-Forwarded-For учитывается только
+    для NUM_PROXIES доверенных прокси перед приложением.
+    """
+    scope = 'ip'
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class EndpointRateThrottle(SlidingWindowThrottle):
+    """Лимит клиента на один эндпоинт: пользователь или IP-адрес.
+
+    Один клиент не может занять тяжёлый эндпоинт, не расходуя лимит
+    других клиентов.
+    """
+    scope = 'endpoint'
+
+    def get_key(self, request, view):
+        endpoint = (getattr(view, 'throttle_scope', None)
+                    or f'{type(view).__name__}.{getattr(view, "action", "")}')
+        if request.user and request.user.is_authenticated:
+            return f'{endpoint}:user:{request.user.pk}'
+        return f'{endpoint}:ip:{self.get_ident(request)}'
+
+
+class LoginRateThrottle(IPRateThrottle):
+    """Попытки входа с одного IP-адреса."""
+    scope = 'login'
+
+
+class LoginIdentityThrottle(SlidingWindowThrottle):
+    """Попытки входа в одну учётную запись с любых адресов."""
+    scope = 'login_identity'
+
+    def get_key(self, request, view):
+        return (normalize_email(request.data.get('email'))
+                or normalize_phone_number(request.data.get('phone_number')))
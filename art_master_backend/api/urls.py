@@ -1,13 +1,18 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 from rest_framework import routers
 
 from .views import (ActivityViewSet,
+                    BatchView,
+                    ChangesView,
                     CommentViewSet,
                     ClientViewSet,
+                    ExportView,
                     MasterViewSet,
+                    MetricsView,
                     ReviewViewSet,
-                    ServiceViewSet)
+                    ServiceViewSet,
+                    ThrottledTokenCreateView)
 
 app_name = 'api'
 
@@ -31,5 +36,15 @@ router.register(
 urlpatterns = [
     path('', include(router.urls)),
     # path('auth/', include('djoser.urls')),
+    re_path(r'^auth/token/login/?$',
+            ThrottledTokenCreateView.as_view(),
+            name='login'),
     path('auth/', include('djoser.urls.authtoken')),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('changes/', ChangesView.as_view(), name='changes'),
+    re_path(r'^export/(?P<name>\w+)\.(?P<file_format>csv|jsonl)'
+            r'(?P<compressed>\.gz)?$',
+            ExportView.as_view(),
+            name='export'),
 ]
@@ -1,21 +1,94 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, Exists, OuterRef, Value
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from services.facets import GLOBAL_CELL, get_cell
+from services.signals import relations_created
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    """Геокодер Яндекса; geopy импортируется при первом использовании."""
+    from geopy import Yandex
+
+    return Yandex(api_key=settings.API_KEY)
+
+
+def insert_relations(model_relation, rows):
+    """Функция вставки связей с ON CONFLICT DO NOTHING.
+
+    rows - список словарей поле -> id. Возвращает только добавленные
+    строки, дополненные ключом 'pk'; уже существующие связи пропускаются.
+    Вызывается внутри транзакции. Внешние ключи отложены до коммита,
+    поэтому проверяются сразу после вставки: удалённый объект даёт
+    IntegrityError здесь, а не при коммите внешней транзакции.
+    """
+
+    if not rows:
+        return []
+    using = router.db_for_write(model_relation)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    opts = model_relation._meta
+    names = list(rows[0])
+    columns = ', '.join(
+        quote_name(opts.get_field(name).column) for name in names
+    )
+    placeholders = ', '.join(
+        [f'({", ".join(["%s"] * len(names))})'] * len(rows)
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(opts.db_table)} ({columns}) '
+            f'VALUES {placeholders} ON CONFLICT DO NOTHING '
+            f'RETURNING {quote_name(opts.pk.column)}, {columns}',
+            [row[name] for row in rows for name in names]
+        )
+        created = [dict(zip(['pk', *names], values))
+                   for values in cursor.fetchall()]
+    connection.check_constraints()
+    return created
+
+
+def create_relations(request, model_relation, ids, field):
+    """Вставка связей и сигнал relations_created в одной транзакции."""
+
+    with transaction.atomic(using=router.db_for_write(model_relation)):
+        created = insert_relations(
+            model_relation,
+            [{'client': request.user.pk, field: obj_id} for obj_id in ids]
+        )
+        if created:
+            relations_created.send(model_relation,
+                                   client=request.user,
+                                   rows=created,
+                                   field=field)
+    return created
+
 
 def create_relation(request, model, model_relation, pk, serializer, field):
     """Функция создания связи User -> Model."""
 
     model_obj = get_object_or_404(model, pk=pk)
-    model_relation_obj = model_relation.objects.filter(
-        client=request.user, **{field: model_obj}
-    )
+    try:
+        created = create_relations(request,
+                                   model_relation,
+                                   [model_obj.pk],
+                                   field)
+    except IntegrityError:
+        raise Http404
 
-    if not model_relation_obj.exists():
-        model_relation.objects.create(client=request.user,
-                                      **{field: model_obj})
+    if created:
         serializer = serializer(model_obj, context={'request': request})
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED)
@@ -25,16 +98,14 @@ def create_relation(request, model, model_relation, pk, serializer, field):
     )
 
 
-def delete_relation(request, model, model_relation, pk, field):
+def delete_relation(request, model_relation, pk, field):
     """Функция удаления связи User -> Model."""
 
-    model_obj = get_object_or_404(model, pk=pk)
-    model_relation_obj = model_relation.objects.filter(
-        client=request.user, **{field: model_obj}
-    )
+    deleted, _ = model_relation.objects.filter(
+        client=request.user, **{f'{field}_id': pk}
+    ).delete()
 
-    if model_relation_obj.exists():
-        model_relation_obj.delete()
+    if deleted:
         return Response(status=status.HTTP_204_NO_CONTENT)
     return Response(
         data={'errors': 'Попытка удаления несуществующего объекта'},
@@ -42,6 +113,71 @@ def delete_relation(request, model, model_relation, pk, field):
     )
 
 
+def get_relation_ids(request, model_relation, field):
+    """Функция получения итогового набора связей User -> Model."""
+
+    return Response(
+        data={'ids': list(model_relation.objects.filter(
+            client=request.user
+        ).values_list(f'{field}_id', flat=True))},
+        status=status.HTTP_200_OK
+    )
+
+
+def bulk_create_relation(request, queryset, model_relation, ids, field):
+    """Функция массового создания связей User -> Model.
+
+    Объект, удалённый между выборкой и вставкой, даёт 404, как и при
+    создании одной связи.
+    """
+
+    existing_ids = list(
+        queryset.filter(pk__in=ids).values_list('pk', flat=True)
+    )
+    try:
+        create_relations(request, model_relation, existing_ids, field)
+    except IntegrityError:
+        raise Http404
+    return get_relation_ids(request, model_relation, field)
+
+
+def bulk_delete_relation(request, model_relation, ids, field):
+    """Функция массового удаления связей User -> Model."""
+
+    model_relation.objects.filter(
+        client=request.user, **{f'{field}_id__in': ids}
+    ).delete()
+    return get_relation_ids(request, model_relation, field)
+
+
+def annotate_is_subscribed(queryset, user):
+    """Аннотирует Мастеров подпиской пользователя."""
+
+    if user.is_anonymous:
+        return queryset.annotate(is_subscribed=Value(False))
+    return queryset.annotate(is_subscribed=Exists(
+        user.subscriptions.filter(master=OuterRef('pk'))
+    ))
+
+
+def annotate_masters(queryset, user):
+    """Аннотирует Мастеров числом подписчиков и подпиской пользователя."""
+
+    return annotate_is_subscribed(
+        queryset.annotate(subscribers_count=Count('subscribers')), user
+    )
+
+
+def annotate_services(queryset, user):
+    """Аннотирует Сервисы признаком избранного для пользователя."""
+
+    if user.is_anonymous:
+        return queryset.annotate(is_favorited=Value(False))
+    return queryset.annotate(is_favorited=Exists(
+        user.favorite_services.filter(service=OuterRef('pk'))
+    ))
+
+
 def get_validated_field(values, model):
     """Вспомогательная функция валидации полей."""
 
@@ -61,3 +197,22 @@ def get_validated_field(values, model):
         )
 
     return values
+
+
+def get_point(value):
+    """Точка из строки "широта,долгота"."""
+
+    try:
+        latitude, longitude = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValidationError(
+            {'near': 'Ожидается строка вида "широта,долгота".'}
+        )
+    return Point(longitude, latitude, srid=4326)
+
+
+def get_facet_cell(request):
+    """Ячейка фасетов по параметру near, без него - все области."""
+
+    near = request.query_params.get('near')
+    return get_cell(get_point(near)) if near else GLOBAL_CELL
@@ -1,39 +1,85 @@
-from django.db.models import Avg
+from django.db.models import Case, F, FloatField, Prefetch, When
+from django.db.models.functions import Cast
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from djoser.conf import settings
-from djoser.views import UserViewSet
+from djoser.utils import logout_user
+from djoser.views import TokenCreateView, UserViewSet
 
 from rest_framework import permissions, viewsets
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from art_master_backend.metrics import metrics
 
 from .filters import ActivityFilterSet, ServiceFilterSet
 
 from services.models import (Activity,
+                             Comment,
+                             CommentHistory,
                              Favorite,
                              Location,
                              Service,
-                             Review)
+                             SimilarService,
+                             Review,
+                             ReviewHistory)
+from services.changelog import (get_cursor,
+                                parse_cursor,
+                                read_changes,
+                                serialize_change)
+from services.deletion import schedule_deletion
+from services.facets import (annotate_services_count,
+                             get_activity_facets,
+                             get_services_counts)
+from services.recommendations import recommend_master_ids
+from services.registry import activities
+
+from .batch import Batch
+from .export import CONTENT_TYPES, EXPORTS, parse_since, stream_export
+from .fast_serializers import get_plan
+
+from .mixins import (FastListMixin,
+                     FragmentCacheMixin,
+                     PrimaryReadsMixin,
+                     StatementTimeoutMixin)
+
+from .pagination import ThreadCursorPagination
 
 from .permissions import IsAdminOrMasterOrReadOnly, IsAdminOrAuthorOrReadOnly
 
+from .throttling import (IPRateThrottle,
+                         LoginIdentityThrottle,
+                         LoginRateThrottle)
+
 from .serializers import (ActivitySerializer,
+                          BatchSerializer,
                           CommentSerializer,
                           LocationSerializer,
                           MasterContextSerializer,
+                          RelationBulkSerializer,
                           ReviewSerializer,
                           ServiceSerializer,
-                          ServiceContextSerializer)
+                          ServiceContextSerializer,
+                          ThreadReviewSerializer)
 
 from users.models import CustomUser, Subscribe
 
-from .utils import create_relation, delete_relation
+from .utils import (annotate_is_subscribed,
+                    annotate_masters,
+                    annotate_services,
+                    bulk_create_relation,
+                    bulk_delete_relation,
+                    create_relation,
+                    delete_relation,
+                    get_facet_cell)
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(StatementTimeoutMixin, UserViewSet):
     """Кастомный базовый вьюсет всех пользователей."""
 
     def get_permissions(self):
@@ -41,9 +87,15 @@ class CustomUserViewSet(UserViewSet):
             self.permission_classes = [permissions.IsAuthenticated, ]
         return super().get_permissions()
 
+    def perform_destroy(self, instance):
+        if instance == self.request.user:
+            logout_user(self.request)
+        schedule_deletion(instance)
+
 
-class MasterViewSet(CustomUserViewSet):
+class MasterViewSet(FragmentCacheMixin, FastListMixin, CustomUserViewSet):
     """Кастомный вьюсет Мастера."""
+    fragment_kind = 'master'
 
     def get_permissions(self):
         if self.action == 'retrieve':
@@ -51,7 +103,47 @@ class MasterViewSet(CustomUserViewSet):
         return super().get_permissions()
 
     def get_queryset(self):
-        return CustomUser.objects.filter(is_master=True)
+        queryset = CustomUser.objects.filter(is_master=True, is_active=True)
+        if self.action in ['list', 'retrieve']:
+            queryset = annotate_masters(
+                queryset, self.request.user
+            ).prefetch_related(
+                Prefetch('services',
+                         queryset=Service.objects.filter(is_active=True)),
+                'services__in_activities'
+            ).order_by('username')
+        return queryset
+
+    def get_fragment_queryset(self):
+        return annotate_is_subscribed(
+            CustomUser.objects.filter(
+                is_master=True, is_active=True
+            ).only('pk'),
+            self.request.user
+        ).order_by('username')
+
+    def make_fragment(self, data):
+        data.pop('is_subscribed')
+        return data
+
+    def personalize(self, master, fragment):
+        fragment['is_subscribed'] = master.is_subscribed
+        return fragment
+
+    @action(detail=False,
+            permission_classes=[permissions.IsAuthenticated, ])
+    def recommended(self, request):
+        master_ids = recommend_master_ids(request.user)
+        masters = annotate_masters(
+            CustomUser.objects.filter(pk__in=master_ids, is_active=True),
+            request.user
+        ).in_bulk()
+        serializer = MasterContextSerializer(
+            [masters[pk] for pk in master_ids if pk in masters],
+            many=True,
+            context={'request': request}
+        )
+        return Response(serializer.data)
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -68,14 +160,17 @@ class ClientViewSet(CustomUserViewSet):
 
     def get_queryset(self):
         if self.action == 'list' and not self.request.user.is_staff:
-            return CustomUser.objects.filter(is_master=True)
-        return CustomUser.objects.filter(is_master=False)
+            return CustomUser.objects.filter(is_master=True, is_active=True)
+        return CustomUser.objects.filter(is_master=False, is_active=True)
 
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=[permissions.IsAuthenticated, ])
     def subscribe(self, request, id):
-        master = get_object_or_404(CustomUser, pk=id, is_master=True)
+        master = get_object_or_404(CustomUser,
+                                   pk=id,
+                                   is_master=True,
+                                   is_active=True)
         if request.user != master:
             if request.method == 'POST':
                 return create_relation(request,
@@ -85,7 +180,6 @@ class ClientViewSet(CustomUserViewSet):
                                        MasterContextSerializer,
                                        field='master')
             return delete_relation(request,
-                                   CustomUser,
                                    Subscribe,
                                    id,
                                    field='master')
@@ -94,11 +188,31 @@ class ClientViewSet(CustomUserViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(methods=['post', 'delete'],
+            detail=False,
+            url_path='subscribe',
+            permission_classes=[permissions.IsAuthenticated, ])
+    def subscribe_bulk(self, request):
+        serializer = RelationBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            return bulk_create_relation(
+                request,
+                CustomUser.objects.filter(
+                    is_master=True, is_active=True
+                ).exclude(pk=request.user.pk),
+                Subscribe,
+                ids,
+                field='master'
+            )
+        return bulk_delete_relation(request, Subscribe, ids, field='master')
+
     @action(detail=False,
             permission_classes=[permissions.IsAuthenticated, ])
     def subscriptions(self, request):
         subscribers_data = CustomUser.objects.filter(
-            subscribers__client=request.user
+            subscribers__client=request.user, is_master=True, is_active=True
         )
         page = self.paginate_queryset(subscribers_data)
         serializer = MasterContextSerializer(
@@ -108,7 +222,7 @@ class ClientViewSet(CustomUserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class ActivityViewSet(viewsets.ReadOnlyModelViewSet):
+class ActivityViewSet(StatementTimeoutMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет Активностей."""
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
@@ -116,72 +230,318 @@ class ActivityViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ActivityFilterSet
 
+    def get_queryset(self):
+        return annotate_services_count(
+            super().get_queryset(), get_facet_cell(self.request)
+        )
 
-class LocationViewSet(viewsets.ReadOnlyModelViewSet):
+    def list(self, request, *args, **kwargs):
+        # Без фильтров список берётся из реестра, без запроса к БД.
+        if any(name in request.query_params
+               for name in self.filterset_class.base_filters):
+            items = self.filter_queryset(Activity.objects.all())
+        else:
+            items = activities.all()
+        counts = get_services_counts(get_facet_cell(request))
+        data = self.get_serializer(items, many=True).data
+        for item in data:
+            item['services_count'] = counts.get(item['id'], 0)
+        return Response(data)
+
+
+class LocationViewSet(StatementTimeoutMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(StatementTimeoutMixin,
+                     FragmentCacheMixin,
+                     FastListMixin,
+                     viewsets.ModelViewSet):
     """Вьюсет Сервисов."""
-    queryset = Service.objects.select_related(
-        'master'
-    ).prefetch_related(
-        'tags', 'activities', 'locations'
+    fragment_kind = 'service'
+    queryset = Service.objects.filter(is_active=True).prefetch_related(
+        'activities', 'locations', 'reviews'
     ).annotate(
-        rating=Avg('reviews__score')
-    ).all()
+        rating=Case(
+            When(reviews_count__gt=0,
+                 then=Cast('reviews_score_sum', FloatField())
+                 / F('reviews_count')),
+            output_field=FloatField()
+        )
+    ).order_by('-created')
     serializer_class = ServiceSerializer
     permission_classes = (IsAdminOrMasterOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ServiceFilterSet
 
+    def get_queryset(self):
+        user = self.request.user
+        masters = annotate_masters(
+            CustomUser.objects.only(
+                *get_plan(MasterContextSerializer).only_fields
+            ),
+            user
+        )
+        return annotate_services(
+            super().get_queryset(), user
+        ).prefetch_related(Prefetch('master', queryset=masters))
+
+    def get_fragment_queryset(self):
+        masters = annotate_is_subscribed(CustomUser.objects.only('pk'),
+                                         self.request.user)
+        return self.filter_queryset(self.get_queryset()).prefetch_related(
+            None
+        ).prefetch_related(
+            Prefetch('master', queryset=masters)
+        ).only('pk', 'master')
+
+    def make_fragment(self, data):
+        data.pop('is_favorited')
+        data['master'].pop('is_subscribed')
+        return data
+
+    def personalize(self, service, fragment):
+        fragment['is_favorited'] = service.is_favorited
+        fragment['master']['is_subscribed'] = service.master.is_subscribed
+        return fragment
+
+    def perform_destroy(self, instance):
+        schedule_deletion(instance)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.action == 'list':
+            response.data['facets'] = get_activity_facets(
+                get_facet_cell(self.request)
+            )
+        return response
+
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=[permissions.IsAuthenticated, ])
     def favorite(self, request, pk):
         if request.method == 'POST':
             return create_relation(request,
-                                   Service,
+                                   Service.objects.filter(is_active=True),
                                    Favorite,
                                    pk,
                                    ServiceContextSerializer,
                                    field='service')
         return delete_relation(request,
-                               Service,
                                Favorite,
                                pk,
                                field='service')
 
+    @action(methods=['post', 'delete'],
+            detail=False,
+            url_path='favorite',
+            permission_classes=[permissions.IsAuthenticated, ])
+    def favorite_bulk(self, request):
+        serializer = RelationBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            return bulk_create_relation(request,
+                                        Service.objects.filter(is_active=True),
+                                        Favorite,
+                                        ids,
+                                        field='service')
+        return bulk_delete_relation(request, Favorite, ids, field='service')
+
+    @action(detail=True, pagination_class=None)
+    def similar(self, request, pk):
+        get_object_or_404(Service.objects.only('pk'), pk=pk, is_active=True)
+        neighbours = SimilarService.objects.filter(
+            service_id=pk, similar__is_active=True
+        ).select_related(
+            'similar'
+        ).prefetch_related(
+            'similar__in_activities'
+        ).order_by('-score')
+        serializer = ServiceContextSerializer(
+            [neighbour.similar for neighbour in neighbours], many=True
+        )
+        return Response(serializer.data)
+
+    @action(detail=True, pagination_class=ThreadCursorPagination)
+    def thread(self, request, pk):
+        get_object_or_404(Service.objects.only('pk'), pk=pk, is_active=True)
+        comments_limit = self.paginator.get_comments_limit(request)
+        reviews = ReviewHistory.objects.filter(
+            service_id=pk
+        ).select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch(
+                'comments',
+                queryset=CommentHistory.objects.select_related(
+                    'author'
+                ).order_by(
+                    *ThreadCursorPagination.ordering
+                )[:comments_limit + 1],
+                to_attr='thread_comments'
+            )
+        )
+        page = self.paginate_queryset(reviews)
+        serializer = ThreadReviewSerializer(
+            page,
+            many=True,
+            context={**self.get_serializer_context(),
+                     'comments_limit': comments_limit}
+        )
+        return self.get_paginated_response(serializer.data)
+
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(StatementTimeoutMixin, viewsets.ModelViewSet):
     """Вьюсет Отзывов к Сервисам."""
     serializer_class = ReviewSerializer
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
 
     def get_queryset(self):
-        service = get_object_or_404(Service, pk=self.kwargs.get('service_id'))
-        return service.reviews.select_related('author').all()
+        service = get_object_or_404(Service,
+                                    pk=self.kwargs.get('service_id'),
+                                    is_active=True)
+        # Чтение - по всей истории, изменение - только горячих Отзывов.
+        if self.request.method in permissions.SAFE_METHODS:
+            reviews = ReviewHistory.objects.filter(
+                service=service
+            ).select_related('service')
+            comments = CommentHistory.objects.all()
+        else:
+            reviews = service.reviews.all()
+            comments = Comment.objects.all()
+        return reviews.select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('comments',
+                     queryset=comments.select_related('author'))
+        )
 
     def perform_create(self, serializer):
-        service = get_object_or_404(Service, pk=self.kwargs.get('service_id'))
+        service = get_object_or_404(Service,
+                                    pk=self.kwargs.get('service_id'),
+                                    is_active=True)
         serializer.save(author=self.request.user, service=service)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(StatementTimeoutMixin, viewsets.ModelViewSet):
     """Вьюсет Комментариев к Отзывам."""
     serializer_class = CommentSerializer
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
 
+    def get_review(self):
+        # Архивные ветки доступны только для чтения.
+        if self.request.method in permissions.SAFE_METHODS:
+            reviews = ReviewHistory.objects
+        else:
+            reviews = Review.objects
+        return get_object_or_404(
+            reviews.only('pk'),
+            id=self.kwargs.get('review_id'),
+            service=self.kwargs.get('service_id'),
+            service__is_active=True
+        )
+
     def get_queryset(self):
-        service = get_object_or_404(Service, pk=self.kwargs.get('service_id'))
-        review = service.reviews.get(pk=self.kwargs.get('review_id'))
-        return review.comments.select_related('author').all()
+        return self.get_review().comments.select_related('author').all()
 
     def perform_create(self, serializer):
-        review = get_object_or_404(
-            Review,
-            id=self.kwargs.get('review_id'),
-            service=self.kwargs.get('service_id')
+        serializer.save(author=self.request.user, review=self.get_review())
+
+    @action(detail=False, pagination_class=ThreadCursorPagination)
+    def thread(self, request, service_id, review_id):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class MetricsView(APIView):
+    """Метрики процесса: пул соединений и прочие счётчики."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
+class ThrottledTokenCreateView(TokenCreateView):
+    """Получение токена с лимитами попыток по IP и учётной записи."""
+    throttle_classes = (IPRateThrottle,
+                        LoginRateThrottle,
+                        LoginIdentityThrottle)
+
+
+class ExportView(StatementTimeoutMixin, APIView):
+    """Потоковая выгрузка Сервисов, Отзывов, Комментариев и пользователей.
+
+    Формат задаётся расширением (.csv или .jsonl, с .gz - сжатие),
+    ?since= выгружает только строки новее отметки времени; с
+    ?since_id= (время и id последней полученной строки) - и строки с
+    той же отметкой и большим id.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    batchable = False
+
+    def get(self, request, name, file_format, compressed=None):
+        if name not in EXPORTS:
+            raise Http404
+        try:
+            since = parse_since(request.query_params.get('since'),
+                                request.query_params.get('since_id'))
+        except ValueError as error:
+            raise ValidationError({'since': str(error)})
+
+        filename = f'{name}.{file_format}{compressed or ""}'
+        response = StreamingHttpResponse(
+            stream_export(name, file_format, since, bool(compressed),
+                          self.get_statement_timeout()),
+            content_type=('application/gzip' if compressed
+                          else CONTENT_TYPES[file_format])
         )
-        serializer.save(author=self.request.user, review=review)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class BatchView(StatementTimeoutMixin, APIView):
+    """Пакет GET-запросов к API в одном запросе: {"requests": [...]}."""
+    permission_classes = (permissions.AllowAny,)
+    batchable = False
+
+    def initial(self, request, *args, **kwargs):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.batch = Batch(request, [
+            item['url'] for item in serializer.validated_data['requests']
+        ])
+        self.throttle_cost = self.batch.cost
+        super().initial(request, *args, **kwargs)
+
+    def post(self, request):
+        return Response({'responses': self.batch.run(request)})
+
+
+class ChangesView(StatementTimeoutMixin, PrimaryReadsMixin, APIView):
+    """Журнал изменений для потребителей: ?since=<курсор>&limit=.
+
+    Читается с основной БД: xmin снимка реплики не учитывает
+    транзакции, о которых она ещё не знает, и их записи оказались бы
+    позади курсора. Лента стоит, пока в кластере открыта хоть одна
+    транзакция старше её позиции (см. read_changes).
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        try:
+            cursor = parse_cursor(since)
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError('since - курсор, limit - целое число')
+
+        changes = read_changes(cursor, min(max(limit, 1), self.max_limit))
+        return Response({
+            'results': [serialize_change(change) for change in changes],
+            'next': get_cursor(changes[-1]) if changes else since or '0.0',
+        })
@@ -0,0 +1,84 @@
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import DatabaseError, connections
+
+_active_timeout = ContextVar('statement_timeout', default=None)
+
+
+class AppliedSetting:
+    """SET, выполненный на соединении.
+
+    SET внутри транзакции откатывается вместе с ней: такой SET
+    действует, пока его колбэк on_commit не выброшен откатом
+    транзакции или точки сохранения.
+    """
+
+    def __init__(self, connection):
+        self.raw = connection.connection
+        self.committed = not connection.in_atomic_block
+        if not self.committed:
+            connection.on_commit(self.commit)
+
+    def commit(self):
+        self.committed = True
+
+    def is_active(self, connection):
+        if connection.connection is not self.raw:
+            return False
+        return self.committed or any(entry[1] == self.commit
+                                     for entry in connection.run_on_commit)
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """Ограничивает время выполнения запросов к PostgreSQL.
+
+    statement_timeout выставляется перед первым запросом на каждом
+    соединении и сбрасывается при выходе из контекста. Значение
+    повторяется, если соединение сменилось (пул, переподключение) или
+    откатилась транзакция, в которой оно было выставлено. Вложенный
+    контекст (подзапросы /batch/) не меняет действующее ограничение.
+    """
+    if not milliseconds or _active_timeout.get() is not None:
+        yield
+        return
+
+    applied = {}
+
+    def make_wrapper(alias):
+        def wrapper(execute, sql, params, many, context):
+            connection = context['connection']
+            setting = applied.get(alias)
+            if setting is None or not setting.is_active(connection):
+                context['cursor'].execute(
+                    'SET statement_timeout = %s', [milliseconds]
+                )
+                applied[alias] = AppliedSetting(connection)
+            return execute(sql, params, many, context)
+        return wrapper
+
+    token = _active_timeout.set(milliseconds)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            if connection.vendor == 'postgresql':
+                stack.enter_context(
+                    connection.execute_wrapper(make_wrapper(connection.alias))
+                )
+        try:
+            yield
+        finally:
+            _active_timeout.reset(token)
+            for alias, setting in applied.items():
+                if connections[alias].connection is setting.raw:
+                    reset_statement_timeout(connections[alias])
+
+
+def reset_statement_timeout(connection):
+    if connection.connection is None:
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('RESET statement_timeout')
+    except DatabaseError:
+        connection.close()
@@ -0,0 +1,5 @@
+"""PostGIS-бэкенд с пулом соединений внутри процесса.
+
+Подключается через ENGINE = 'art_master_backend.db_pool'; параметры пула
+задаются ключом POOL в настройках базы данных.
+"""
@@ -0,0 +1,58 @@
+from django.contrib.gis.db.backends.postgis.base import (
+    DatabaseWrapper as PostGISDatabaseWrapper
+)
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from .pool import PoolTimeout, get_pool
+
+
+class DatabaseWrapper(PostGISDatabaseWrapper):
+    """PostGIS-соединение, которое берётся из пула и возвращается в него."""
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params
+                ),
+                self.is_pooled_usable
+            )
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get(
+                'isolation_level', IsolationLevel.READ_COMMITTED
+            )
+        )
+        return connection
+
+    def is_pooled_usable(self, connection):
+        """Соединение из пула живо; SELECT 1 при CONN_HEALTH_CHECKS."""
+        if connection.closed:
+            return False
+        if not self.settings_dict['CONN_HEALTH_CHECKS']:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except self.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            try:
+                # ROLLBACK + RESET ALL: соединение уходит в пул чистым.
+                self.connection.reset()
+            except self.Database.Error:
+                self.pool.discard(self.connection)
+            else:
+                self.pool.release(self.connection)
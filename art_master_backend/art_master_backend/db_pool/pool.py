@@ -0,0 +1,94 @@
+import threading
+import time
+
+from art_master_backend.metrics import metrics
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+class ConnectionPool:
+    """Пул соединений с ограничением размера и ожиданием свободного."""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, connect, check=None):
+        """Свободное соединение пула или новое через connect().
+
+        check(connection) проверяет простаивавшее соединение перед
+        выдачей: мёртвые закрываются и освобождают место в пуле.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            connection = self._take(deadline)
+            if connection is None:
+                break
+            if check is None or check(connection):
+                metrics.observe('db.pool.wait', time.monotonic() - started)
+                metrics.incr('db.pool.reused')
+                return connection
+            metrics.incr('db.pool.dead')
+            self.discard(connection)
+        metrics.observe('db.pool.wait', time.monotonic() - started)
+
+        try:
+            connection = connect()
+        except BaseException:
+            self._forget()
+            raise
+        metrics.incr('db.pool.created')
+        return connection
+
+    def _take(self, deadline):
+        """Простаивающее соединение или None, если занято место под новое."""
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    metrics.incr('db.pool.timeouts')
+                    raise PoolTimeout(
+                        f'Нет свободных соединений за {self.timeout} с'
+                    )
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+            return None
+
+    def release(self, connection):
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        finally:
+            self._forget()
+
+    def _forget(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """Возвращает пул процесса для алиаса базы данных."""
+    with _pools_lock:
+        if alias not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[alias] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 5),
+            )
+        return _pools[alias]
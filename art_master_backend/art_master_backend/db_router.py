@@ -0,0 +1,75 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+_replica = ContextVar('replica', default=None)
+_unhealthy_until = {}
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Разрешает чтение с реплик в текущем контексте выполнения.
+
+    Реплика выбирается и проверяется один раз на входе; все чтения
+    контекста (запроса) идут на неё.
+    """
+    token = _replica.set(get_healthy_replica() if enabled else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def get_current_replica():
+    """Реплика текущего контекста чтения или None."""
+    return _replica.get()
+
+
+def mark_unhealthy(alias):
+    """Исключает реплику из ротации на REPLICA_RETRY_SECONDS."""
+    _unhealthy_until[alias] = (
+        time.monotonic() + settings.REPLICA_RETRY_SECONDS
+    )
+
+
+def get_healthy_replica():
+    """Возвращает доступную реплику или None, если таких нет."""
+    now = time.monotonic()
+    replicas = [alias for alias in settings.DATABASE_REPLICAS
+                if _unhealthy_until.get(alias, 0) <= now]
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            mark_unhealthy(alias)
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    """Маршрутизатор чтения безопасных запросов на реплики БД."""
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if (replica is None
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,40 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Потокобезопасный реестр счётчиков и таймингов процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            count, total, maximum = self._timings.get(name, (0, 0.0, 0.0))
+            self._timings[name] = (
+                count + 1, total + seconds, max(maximum, seconds)
+            )
+
+    def snapshot(self):
+        with self._lock:
+            timings = {
+                name: {'count': count,
+                       'avg_ms': round(total / count * 1000, 3),
+                       'max_ms': round(maximum * 1000, 3)}
+                for name, (count, total, maximum) in self._timings.items()
+            }
+            return {'counters': dict(self._counters), 'timings': timings}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
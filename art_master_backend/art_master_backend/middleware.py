@@ -0,0 +1,110 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.core.cache import cache
+from django.db import OperationalError
+from django.middleware import clickjacking, csrf
+
+from .db_router import get_current_replica, mark_unhealthy, replica_reads
+from .metrics import metrics
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтение безопасных запросов на реплику БД.
+
+    Реплика выбирается один раз на запрос и используется для всех
+    его чтений. После успешной записи пользователь на
+    REPLICA_STICKY_SECONDS закрепляется за основной БД, чтобы видеть
+    собственные изменения. Если чтение с реплики оборвалось
+    OperationalError, реплика исключается из ротации, а запрос
+    повторяется на основной БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        sticky_key = self.get_sticky_key(request)
+        use_replica = (request.method in SAFE_METHODS
+                       and not (sticky_key and cache.get(sticky_key)))
+
+        with replica_reads(use_replica):
+            response = self.get_response(request)
+
+        if (sticky_key
+                and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            cache.set(sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_exception(self, request, exception):
+        replica = get_current_replica()
+        if replica is None or not isinstance(exception, OperationalError):
+            return None
+        mark_unhealthy(replica)
+        metrics.incr('db.replica.fallback')
+        with replica_reads(False):
+            return self.get_response(request)
+
+    @staticmethod
+    def get_sticky_key(request):
+        """Ключ пользователя по токену или сессии, без обращения к БД."""
+        identity = (request.META.get('HTTP_AUTHORIZATION')
+                    or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        if not identity:
+            return None
+        digest = hashlib.sha256(identity.encode()).hexdigest()
+        return f'replica-sticky:{digest}'
+
+
+def is_api_request(request):
+    return request.path_info.startswith(settings.API_URL_PREFIX)
+
+
+class SiteOnlyMiddlewareMixin:
+    """Пропускает запросы к API (API_URL_PREFIX) мимо middleware сайта.
+
+    API аутентифицируется только токеном: сессии, CSRF, сообщения и
+    X-Frame-Options нужны админке, а не эндпоинтам API.
+    """
+
+    def __call__(self, request):
+        if is_api_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SiteOnlyMiddlewareMixin,
+                        sessions.SessionMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(SiteOnlyMiddlewareMixin, csrf.CsrfViewMiddleware):
+
+    def process_view(self, request, *args, **kwargs):
+        if is_api_request(request):
+            return None
+        return super().process_view(request, *args, **kwargs)
+
+
+class AuthenticationMiddleware(SiteOnlyMiddlewareMixin,
+                               auth.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(SiteOnlyMiddlewareMixin,
+                        messages.MessageMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(SiteOnlyMiddlewareMixin,
+                              clickjacking.XFrameOptionsMiddleware):
+    pass
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+import sys
 
 from dotenv import load_dotenv
 from pathlib import Path
@@ -29,6 +30,8 @@ SECRET_KEY = os.getenv('SECRET_KEY', default='key')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = bool(os.getenv('DEBUG') == 'True')
 
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -46,23 +49,28 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'django_filters',
     'djoser',
-    'colorfield',
     'phonenumber_field',
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
     'services.apps.ServicesConfig',
 ]
 
+# Session, CSRF, auth, messages and clickjacking middleware are subclasses
+# that pass requests under API_URL_PREFIX straight through: the API uses
+# token authentication only, the full stack is kept for the admin.
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'art_master_backend.middleware.ReplicaRoutingMiddleware',
+    'art_master_backend.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'art_master_backend.middleware.CsrfViewMiddleware',
+    'art_master_backend.middleware.AuthenticationMiddleware',
+    'art_master_backend.middleware.MessageMiddleware',
+    'art_master_backend.middleware.XFrameOptionsMiddleware',
 ]
 
+API_URL_PREFIX = '/api/'
+
 ROOT_URLCONF = 'art_master_backend.urls'
 
 TEMPLATES = [
@@ -87,14 +95,72 @@ WSGI_APPLICATION = 'art_master_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DB_POOL=True switches to the in-process connection pool (for ASGI);
+# connections then go back to the pool after each request.
+
+DB_POOL = bool(os.getenv('DB_POOL') == 'True')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.contrib.gis.db.backends.postgis',
+        'ENGINE': ('art_master_backend.db_pool' if DB_POOL
+                   else 'django.contrib.gis.db.backends.postgis'),
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': (0 if DB_POOL
+                         else int(os.getenv('DB_CONN_MAX_AGE', 60))),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        },
+    }
+}
+
+# Default server-side statement timeout for API views, in milliseconds.
+DATABASE_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 10000))
+
+# Read replicas: comma-separated hosts, each gets a replica_N alias.
+
+DATABASE_REPLICAS = []
+
+for index, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# Tests get a 'replica' alias mirroring the test database; only the
+# routing tests put it into DATABASE_REPLICAS.
+
+if TESTING:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['art_master_backend.db_router.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
     }
 }
 
@@ -124,11 +190,125 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageSizePagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserRateThrottle',
+        'api.throttling.IPRateThrottle',
+        'api.throttling.EndpointRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.getenv('THROTTLE_USER_RATE', '600/min'),
+        'ip': os.getenv('THROTTLE_IP_RATE', '300/min'),
+        'endpoint': os.getenv('THROTTLE_ENDPOINT_RATE', '200/min'),
+        'login': os.getenv('THROTTLE_LOGIN_RATE', '10/min'),
+        'login_identity': os.getenv('THROTTLE_LOGIN_IDENTITY_RATE', '5/min'),
+    },
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted
+    # for client IPs; 0 uses REMOTE_ADDR only, so the header can't be forged.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Batch endpoint (/api/batch/): sub-requests per batch and the cap on their
+# summed throttle cost, which is charged once for the whole batch.
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+BATCH_MAX_COST = int(os.getenv('BATCH_MAX_COST', 50))
+
+# Throttle counters: 'local' keeps sliding windows in process memory (limits
+# are per worker), 'cache' shares them through CACHES['default'].
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', 'local')
+
+# Recommendations: neighbours stored per service and the weight of a shared
+# activity relative to a shared favorite.
+SIMILAR_SERVICES_TOP_K = int(os.getenv('SIMILAR_SERVICES_TOP_K', 10))
+SIMILARITY_ACTIVITY_WEIGHT = float(
+    os.getenv('SIMILARITY_ACTIVITY_WEIGHT', 0.5)
+)
+
+# Service ranking (services.ranking): Bayesian prior for the 1-10 score,
+# term weights, recency half-life and the distance scale for ?near=.
+SERVICE_RANKING = {
+    'PRIOR_MEAN': 7.0,
+    'PRIOR_WEIGHT': 5,
+    'RATING': 1.0,
+    'REVIEWS': 0.3,
+    'FAVORITES': 0.2,
+    'RECENCY': 0.5,
+    'HALF_LIFE_DAYS': 30,
+    'DISTANCE_KM': 10,
+}
+
+# Activity facets (services.facets): grid cell size in degrees for ?near=.
+FACET_CELL_DEGREES = float(os.getenv('FACET_CELL_DEGREES', 0.5))
+
+# Activity registry (services.registry): how often a process compares its
+# copy with a checksum of the activity table in the database.
+ACTIVITY_REGISTRY_CHECK_SECONDS = float(
+    os.getenv('ACTIVITY_REGISTRY_CHECK_SECONDS', 5)
+)
+
+# Cold start (settings, django.setup() and URLconf import in a fresh
+# process) budget checked by `manage.py profile_startup --check`.
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', 2.0))
+
+# Background deletion (services.deletion): dependent rows removed per batch
+# by `manage.py process_deletions`.
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', 500))
+
+# Review archive (services.archive): threads (a review and all of its
+# comments) older than this move to the cold tables, in batches of reviews,
+# by `manage.py archive_reviews`.
+REVIEW_ARCHIVE_DAYS = int(os.getenv('REVIEW_ARCHIVE_DAYS', 365))
+REVIEW_ARCHIVE_BATCH_SIZE = int(os.getenv('REVIEW_ARCHIVE_BATCH_SIZE', 1000))
+
+# Near-duplicate texts (services.duplicates): MinHash over character
+# shingles, BANDS x ROWS LSH buckets (candidate pairs from ~0.7 similarity),
+# at most MAX_CANDIDATES compared per text. ACTION 'reject' fails validation
+# of review and comment texts, 'flag' only marks TextSignature.duplicate_of.
+DUPLICATE_TEXTS = {
+    'ACTION': os.getenv('DUPLICATE_TEXTS_ACTION', 'reject'),
+    'SHINGLE_SIZE': 5,
+    'MIN_LENGTH': 40,
+    'BANDS': 16,
+    'ROWS': 8,
+    'THRESHOLD': 0.8,
+    'MAX_CANDIDATES': 50,
+    'SEED': 1,
+}
+
+# Compiled read-only serializers for list endpoints (api.fast_serializers);
+# opt-in, output is checked against DRF by api.tests.
+FAST_SERIALIZERS = bool(os.getenv('FAST_SERIALIZERS', 'False') == 'True')
+
+# Cache miss coalescing (api.cache): per-key locks ('local' per process or
+# 'cache' shared through CACHES['default']), how long an expired entry may
+# still be served while one worker recomputes it, and the TTL jitter.
+CACHE_COALESCING = {
+    'LOCKS': os.getenv('CACHE_LOCKS', 'local'),
+    'STALE_SECONDS': int(os.getenv('CACHE_STALE_SECONDS', 60)),
+    'JITTER': 0.1,
+    'LOCK_TIMEOUT': 10,
+    'WAIT_SECONDS': 2,
+}
+
+# Per-object fragment cache for service and master lists (api.cache);
+# fragments are versioned, the timeout only bounds missed invalidations.
+# Needs a shared CACHE_BACKEND (system check api.E001): with a per-process
+# cache other workers never see version bumps.
+FRAGMENT_CACHE = bool(os.getenv('FRAGMENT_CACHE', 'False') == 'True')
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 3600))
+
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND',
+                          'django.core.mail.backends.smtp.EmailBackend')
 
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', default=True)
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -136,6 +316,16 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
 
+# Subscriber digests (services.notifications): services published by
+# followed masters are collected for WINDOW_SECONDS after the first one and
+# mailed by `manage.py send_digests`, BATCH_SIZE clients per send_messages()
+# call over one connection. FROM_EMAIL None means DEFAULT_FROM_EMAIL.
+NOTIFICATION_DIGESTS = {
+    'WINDOW_SECONDS': int(os.getenv('NOTIFICATION_DIGEST_WINDOW', 3600)),
+    'BATCH_SIZE': int(os.getenv('NOTIFICATION_DIGEST_BATCH_SIZE', 200)),
+    'FROM_EMAIL': os.getenv('NOTIFICATION_FROM_EMAIL'),
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'ACTIVATION_URL': '#/activation/{uid}/{token}',
@@ -148,6 +338,8 @@ DJOSER = {
         'user': 'api.serializers.ClientSerializer',
         'master': 'api.serializers.MasterSerializer',
         'token_create': 'api.serializers.CustomTokenCreateSerializer',
+        'password_reset': 'api.serializers.CustomSendEmailResetSerializer',
+        'username_reset': 'api.serializers.CustomSendEmailResetSerializer',
     },
     'PERMISSIONS': {
         'user_list': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
@@ -161,6 +353,9 @@ DJOSER = {
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Email and phone lookups go through normalized, uniquely indexed columns.
+AUTHENTICATION_BACKENDS = ['users.backends.IdentityBackend']
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'Europe/Moscow'
@@ -170,6 +365,7 @@ USE_I18N = True
 USE_TZ = True
 
 PHONENUMBER_DEFAULT_REGION = 'RU'
+PHONENUMBER_DB_FORMAT = 'E164'
 
 API_KEY = os.getenv('API_KEY', default='key')
 
@@ -0,0 +1,280 @@
+import hashlib
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import (DEFAULT_DB_ALIAS,
+                       DatabaseError,
+                       OperationalError,
+                       connection,
+                       connections,
+                       transaction)
+from django.test import (SimpleTestCase,
+                         TestCase,
+                         TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from services.models import Service
+from users.models import CustomUser
+
+from . import db_router
+from .connections import AppliedSetting, statement_timeout
+from .db_pool.pool import ConnectionPool
+from .db_router import ReplicaRouter, replica_reads
+
+REPLICAS = ['replica_1', 'replica_2']
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS, REPLICA_RETRY_SECONDS=30)
+class ReplicaRouterTest(SimpleTestCase):
+    """Выбор реплики один раз на контекст чтения."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.connections = {
+            alias: mock.Mock(in_atomic_block=False)
+            for alias in [DEFAULT_DB_ALIAS, *REPLICAS]
+        }
+        patcher = mock.patch.object(db_router, 'connections',
+                                    self.connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db_router._unhealthy_until.clear()
+        self.addCleanup(db_router._unhealthy_until.clear)
+
+    def checks(self):
+        return sum(self.connections[alias].ensure_connection.call_count
+                   for alias in REPLICAS)
+
+    def test_one_replica_per_context(self):
+        with replica_reads():
+            aliases = {self.router.db_for_read(None) for _ in range(10)}
+        self.assertEqual(len(aliases), 1)
+        self.assertIn(aliases.pop(), REPLICAS)
+        self.assertEqual(self.checks(), 1)
+        self.assertEqual(self.router.db_for_read(None), DEFAULT_DB_ALIAS)
+
+    def test_unavailable_replica_skipped(self):
+        self.connections['replica_1'].ensure_connection.side_effect = (
+            DatabaseError
+        )
+        for _ in range(5):
+            with replica_reads():
+                self.assertEqual(self.router.db_for_read(None), 'replica_2')
+        self.assertEqual(
+            self.connections['replica_1'].ensure_connection.call_count, 1
+        )
+        self.assertIn('replica_1', db_router._unhealthy_until)
+
+    def test_no_healthy_replica(self):
+        for alias in REPLICAS:
+            self.connections[alias].ensure_connection.side_effect = (
+                DatabaseError
+            )
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(None), DEFAULT_DB_ALIAS)
+
+    def test_disabled_and_atomic_reads_use_default(self):
+        with replica_reads(False):
+            self.assertEqual(self.router.db_for_read(None), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.checks(), 0)
+        with replica_reads():
+            self.connections[DEFAULT_DB_ALIAS].in_atomic_block = True
+            self.assertEqual(self.router.db_for_read(None), DEFAULT_DB_ALIAS)
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'],
+    REPLICA_STICKY_SECONDS=5,
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'replica-routing-tests',
+    }},
+)
+class ReplicaRoutingMiddlewareTest(TransactionTestCase):
+    """Маршрутизация запросов на зеркало основной БД (TEST MIRROR)."""
+    databases = {DEFAULT_DB_ALIAS, 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        db_router._unhealthy_until.clear()
+        self.addCleanup(db_router._unhealthy_until.clear)
+        self.master = CustomUser.objects.create_user(
+            email='user1@example.com',
+            username='user1',
+            phone_number='+79990000001',
+            password='password',
+            is_master=True
+        )
+        self.service = Service.objects.create(
+            name='Услуга',
+            description='Описание',
+            master=self.master,
+            image='services/image/service.jpg',
+            phone_number='+79990000000'
+        )
+        self.token = Token.objects.create(user=self.master)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_aliases(self, method, url):
+        """Алиасы, на которые ушли запросы к БД, и ответ."""
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default:
+            with CaptureQueriesContext(connections['replica']) as replica:
+                response = getattr(self.client, method)(url)
+        aliases = {alias for alias, queries in (
+            (DEFAULT_DB_ALIAS, default), ('replica', replica)
+        ) if len(queries)}
+        return aliases, response
+
+    def test_reads_go_to_replica(self):
+        aliases, response = self.get_aliases('get', '/api/services/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {'replica'})
+
+    def test_sticky_after_write(self):
+        aliases, response = self.get_aliases(
+            'post', f'/api/services/{self.service.pk}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+        digest = hashlib.sha256(f'Token {self.token}'.encode()).hexdigest()
+        self.assertIs(cache.get(f'replica-sticky:{digest}'), True)
+
+        aliases, _ = self.get_aliases('get', '/api/services/')
+        self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+
+        # Анонимный клиент не закреплён и читает с реплики.
+        self.client.credentials()
+        aliases, _ = self.get_aliases('get', '/api/services/')
+        self.assertEqual(aliases, {'replica'})
+
+    def test_failed_write_not_sticky(self):
+        aliases, response = self.get_aliases('post',
+                                             '/api/services/0/favorite/')
+        self.assertEqual(response.status_code, 404)
+        aliases, _ = self.get_aliases('get', '/api/services/')
+        self.assertEqual(aliases, {'replica'})
+
+    def test_changes_read_from_primary(self):
+        CustomUser.objects.filter(pk=self.master.pk).update(is_staff=True)
+        aliases, response = self.get_aliases('get', '/api/changes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+
+    def test_replica_failure_falls_back_to_primary(self):
+        replica = connections['replica']
+        replica.ensure_connection()
+        with mock.patch.object(replica, 'create_cursor',
+                               side_effect=OperationalError):
+            aliases, response = self.get_aliases('get', '/api/services/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertIn('replica', db_router._unhealthy_until)
+
+        # Пока реплика исключена, чтение идёт с основной БД.
+        aliases, _ = self.get_aliases('get', '/api/services/')
+        self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Проверка простаивавших соединений перед выдачей."""
+
+    def setUp(self):
+        self.pool = ConnectionPool(max_size=2, timeout=0.1)
+        self.connect = mock.Mock(side_effect=lambda: mock.Mock(alive=True))
+
+    def check(self, connection):
+        return connection.alive
+
+    def test_live_connection_reused(self):
+        connection = self.pool.acquire(self.connect, self.check)
+        self.pool.release(connection)
+        self.assertIs(self.pool.acquire(self.connect, self.check), connection)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_dead_connection_discarded(self):
+        first = self.pool.acquire(self.connect, self.check)
+        second = self.pool.acquire(self.connect, self.check)
+        self.pool.release(first)
+        self.pool.release(second)
+        first.alive = second.alive = False
+
+        connection = self.pool.acquire(self.connect, self.check)
+        self.assertNotIn(connection, (first, second))
+        first.close.assert_called_once_with()
+        second.close.assert_called_once_with()
+        # Места мёртвых соединений освобождены: пул не упирается в max_size.
+        self.pool.acquire(self.connect, self.check)
+        self.assertEqual(self.connect.call_count, 4)
+
+
+class StatementTimeoutTest(TestCase):
+    """statement_timeout переживает откат и вложенные контексты."""
+
+    def show(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            return cursor.fetchone()[0]
+
+    def test_reset_on_exit(self):
+        with statement_timeout(1500):
+            self.assertEqual(self.show(), '1500ms')
+        self.assertEqual(self.show(), '0')
+
+    def test_reapplied_after_rollback(self):
+        with statement_timeout(1500):
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    # SET выполнится здесь и откатится вместе с точкой
+                    # сохранения.
+                    self.show()
+                    1 / 0
+            self.assertEqual(self.show(), '1500ms')
+
+    def test_nested_context_keeps_outer(self):
+        with statement_timeout(1500):
+            with statement_timeout(3000):
+                self.assertEqual(self.show(), '1500ms')
+            self.assertEqual(self.show(), '1500ms')
+        self.assertEqual(self.show(), '0')
+
+
+class AppliedSettingTest(SimpleTestCase):
+    """Когда SET на соединении нужно повторить."""
+
+    def make_connection(self, in_atomic_block):
+        connection = mock.Mock(connection=object(),
+                               in_atomic_block=in_atomic_block,
+                               run_on_commit=[])
+        connection.on_commit.side_effect = (
+            lambda func: connection.run_on_commit.append((set(), func, False))
+        )
+        return connection
+
+    def test_autocommit_until_reconnect(self):
+        connection = self.make_connection(in_atomic_block=False)
+        setting = AppliedSetting(connection)
+        connection.on_commit.assert_not_called()
+        self.assertTrue(setting.is_active(connection))
+        connection.connection = object()
+        self.assertFalse(setting.is_active(connection))
+
+    def test_transaction_rolled_back(self):
+        connection = self.make_connection(in_atomic_block=True)
+        setting = AppliedSetting(connection)
+        self.assertTrue(setting.is_active(connection))
+        # Откат выбрасывает колбэки on_commit транзакции.
+        connection.run_on_commit.clear()
+        self.assertFalse(setting.is_active(connection))
+
+    def test_transaction_committed(self):
+        connection = self.make_connection(in_atomic_block=True)
+        setting = AppliedSetting(connection)
+        for _, func, _ in connection.run_on_commit:
+            func()
+        connection.run_on_commit.clear()
+        self.assertTrue(setting.is_active(connection))
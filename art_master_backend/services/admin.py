@@ -4,16 +4,29 @@ from django.contrib.gis.admin import OSMGeoAdmin
 from .models import (Activity,
                      ActivityService,
                      Comment,
+                     DeletionJob,
                      Location,
                      LocationService,
+                     NotificationDigest,
                      Review,
-                     Service)
+                     Service,
+                     TextSignature)
+from .registry import activities
 
 
 class ActivityInService(admin.TabularInline):
     model = ActivityService
     min_num = 1
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'activity':
+            formfield.choices = [('', formfield.empty_label),
+                                 *activities.choices('pk')]
+        return formfield
+
 
 class LocationInService(admin.TabularInline):
     model = LocationService
@@ -92,3 +105,41 @@ class LocationServiceAdmin(admin.ModelAdmin):
     search_fields = ('location', 'service')
     list_filter = ('location', 'service')
     empty_value_display = '-пусто-'
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('id',
+                    'model',
+                    'object_id',
+                    'status',
+                    'step',
+                    'deleted',
+                    'updated')
+    list_filter = ('status', 'model')
+    readonly_fields = ('model',
+                       'object_id',
+                       'status',
+                       'step',
+                       'deleted',
+                       'created',
+                       'updated',
+                       'finished')
+
+
+@admin.register(TextSignature)
+class TextSignatureAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model', 'object_id', 'duplicate_of', 'created')
+    list_filter = ('model', ('duplicate_of', admin.EmptyFieldListFilter))
+    search_fields = ('object_id',)
+    readonly_fields = ('model',
+                       'object_id',
+                       'signature',
+                       'duplicate_of',
+                       'created')
+
+
+@admin.register(NotificationDigest)
+class NotificationDigestAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created', 'last_client', 'sent', 'finished')
+    readonly_fields = ('last_client', 'sent', 'created', 'finished')
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Comment, CommentArchive, Review, ReviewArchive
+from .signals import rows_archived
+
+
+def get_cutoff(days=None, now=None):
+    """Граница горячих данных: ветки старше неё переносятся в архив."""
+    if days is None:
+        days = settings.REVIEW_ARCHIVE_DAYS
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archivable_reviews(cutoff):
+    """Отзывы, ветка которых целиком старше cutoff."""
+    return Review.objects.filter(pub_date__lt=cutoff).filter(
+        ~Exists(Comment.objects.filter(review=OuterRef('pk'),
+                                       pub_date__gte=cutoff))
+    )
+
+
+def copy_rows(connection, cursor, model, archive, column, ids):
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column)
+                        for field in model._meta.concrete_fields)
+    cursor.execute(
+        f'INSERT INTO {quote_name(archive._meta.db_table)} ({columns}) '
+        f'SELECT {columns} FROM {quote_name(model._meta.db_table)} '
+        f'WHERE {quote_name(column)} = ANY(%s)',
+        [ids]
+    )
+
+
+def delete_rows(connection, cursor, model, column, ids):
+    quote_name = connection.ops.quote_name
+    cursor.execute(
+        f'DELETE FROM {quote_name(model._meta.db_table)} '
+        f'WHERE {quote_name(column)} = ANY(%s)',
+        [ids]
+    )
+    return cursor.rowcount
+
+
+def archive_batch(cutoff, batch_size=None):
+    """Переносит до batch_size веток в архив одной транзакцией.
+
+    Отзыв переносится вместе со всеми комментариями, id сохраняются.
+    Возвращает количество перенесённых отзывов и комментариев.
+    """
+    batch_size = batch_size or settings.REVIEW_ARCHIVE_BATCH_SIZE
+    connection = connections[router.db_for_write(Review)]
+    with transaction.atomic(using=connection.alias):
+        rows = list(archivable_reviews(cutoff).select_for_update(
+            skip_locked=True
+        ).order_by('pub_date', 'pk').values('pk', 'service')[:batch_size])
+        if not rows:
+            return 0, 0
+
+        ids = [row['pk'] for row in rows]
+        with connection.cursor() as cursor:
+            copy_rows(connection, cursor, Review, ReviewArchive, 'id', ids)
+            copy_rows(connection, cursor, Comment, CommentArchive,
+                      'review_id', ids)
+            comments = delete_rows(connection, cursor, Comment,
+                                   'review_id', ids)
+            delete_rows(connection, cursor, Review, 'id', ids)
+        rows_archived.send(Review, rows=rows)
+        return len(rows), comments
+
+
+def archive_reviews(days=None, batch_size=None, max_batches=None):
+    """Переносит в архив все ветки старше days дней пакетами."""
+    cutoff = get_cutoff(days)
+    reviews = comments = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved, moved_comments = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        reviews += moved
+        comments += moved_comments
+        batches += 1
+    return reviews, comments
+
+
+def relation_sizes(using=None):
+    """Размер таблиц и индексов горячих и архивных данных в байтах."""
+    models = (Review, Comment, ReviewArchive, CommentArchive)
+    connection = connections[using or router.db_for_read(Review)]
+    sizes = {}
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            cursor.execute('SELECT pg_table_size(%s), pg_indexes_size(%s)',
+                           [table, table])
+            sizes[table] = cursor.fetchone()
+    return sizes
@@ -0,0 +1,91 @@
+from django.db.models import BigIntegerField, Func, Q
+
+from .models import ChangeLog
+
+
+class CurrentTransactionId(Func):
+    """Номер текущей транзакции (PostgreSQL 13+)."""
+    template = 'pg_current_xact_id()::text::bigint'
+    output_field = BigIntegerField()
+
+
+class SnapshotXmin(Func):
+    """Наименьший номер незавершённой транзакции.
+
+    Все транзакции с меньшим номером уже зафиксированы или откачены:
+    новых записей с таким txid не появится.
+    """
+    template = 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+    output_field = BigIntegerField()
+
+
+def get_relations(instance):
+    """id связанных объектов: потребителю удалённой записи нужны ключи."""
+    return {field.name: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields
+            if field.is_relation}
+
+
+def log_change(instance, action):
+    ChangeLog.objects.create(model=instance._meta.label_lower,
+                             object_id=instance.pk,
+                             action=action,
+                             data=get_relations(instance),
+                             txid=CurrentTransactionId())
+
+
+def log_relations(model_relation, rows, action=ChangeLog.CREATE):
+    """Журнал строк, вставленных или удалённых в обход Model.
+
+    Вставка связей - api.utils, пакетное удаление - services.deletion.
+    В журнал, как и у log_change, попадают только id связанных объектов.
+    """
+    names = [field.name for field in model_relation._meta.concrete_fields
+             if field.is_relation]
+    ChangeLog.objects.bulk_create(
+        ChangeLog(model=model_relation._meta.label_lower,
+                  object_id=row['pk'],
+                  action=action,
+                  data={name: row[name] for name in names if name in row},
+                  txid=CurrentTransactionId())
+        for row in rows
+    )
+
+
+def parse_cursor(value):
+    """Курсор 'txid.id' в пару; число - id записи до появления txid."""
+    if not value:
+        return 0, 0
+    txid, _, change_id = str(value).rpartition('.')
+    return int(txid or 0), int(change_id)
+
+
+def get_cursor(change):
+    return f'{change.txid}.{change.id}'
+
+
+def read_changes(since=(0, 0), limit=500):
+    """Изменения после курсора since по возрастанию (txid, id).
+
+    Отдаются только записи транзакций старше xmin текущего снимка:
+    транзакция, получившая меньший id, может зафиксироваться позже,
+    но пока она не завершена, не отдаются и все более поздние.
+    Номера транзакций общие для кластера, поэтому одна долгая
+    транзакция в любой его базе, даже не пишущая в журнал,
+    останавливает ленту до своего завершения.
+    """
+    txid, change_id = since
+    return list(ChangeLog.objects.filter(
+        Q(txid__gt=txid) | Q(txid=txid, id__gt=change_id),
+        txid__lt=SnapshotXmin()
+    ).order_by('txid', 'id')[:limit])
+
+
+def serialize_change(change):
+    return {'id': change.id,
+            'cursor': get_cursor(change),
+            'model': change.model,
+            'object_id': change.object_id,
+            'action': change.action,
+            'data': change.data,
+            'created': change.created}
@@ -0,0 +1,201 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from users.models import CustomUser, Subscribe
+
+from .models import (ActivityService,
+                     Comment,
+                     CommentArchive,
+                     DeletionJob,
+                     Favorite,
+                     LocationService,
+                     NotificationEvent,
+                     Review,
+                     ReviewArchive,
+                     Service,
+                     SimilarService)
+from .signals import rows_deactivated, rows_deleted
+
+
+def user_steps(user_id):
+    """Зависимые строки пользователя: от листьев к Сервисам Мастера."""
+    return (
+        ('archived comments on services', CommentArchive.objects.filter(
+            review__service__master_id=user_id)),
+        ('archived comments on reviews', CommentArchive.objects.filter(
+            review__author_id=user_id)),
+        ('archived comments', CommentArchive.objects.filter(
+            author_id=user_id)),
+        ('archived reviews on services', ReviewArchive.objects.filter(
+            service__master_id=user_id)),
+        ('archived reviews', ReviewArchive.objects.filter(
+            author_id=user_id)),
+        ('comments on services', Comment.objects.filter(
+            review__service__master_id=user_id)),
+        ('comments on reviews', Comment.objects.filter(
+            review__author_id=user_id)),
+        ('comments', Comment.objects.filter(author_id=user_id)),
+        ('reviews on services', Review.objects.filter(
+            service__master_id=user_id)),
+        ('reviews', Review.objects.filter(author_id=user_id)),
+        ('favorites of services', Favorite.objects.filter(
+            service__master_id=user_id)),
+        ('favorites', Favorite.objects.filter(client_id=user_id)),
+        ('subscribers', Subscribe.objects.filter(master_id=user_id)),
+        ('subscriptions', Subscribe.objects.filter(client_id=user_id)),
+        ('similar services', SimilarService.objects.filter(
+            service__master_id=user_id)),
+        ('similar to services', SimilarService.objects.filter(
+            similar__master_id=user_id)),
+        ('service activities', ActivityService.objects.filter(
+            service__master_id=user_id)),
+        ('service locations', LocationService.objects.filter(
+            service__master_id=user_id)),
+        ('service notifications', NotificationEvent.objects.filter(
+            service__master_id=user_id)),
+        ('services', Service.objects.filter(master_id=user_id)),
+    )
+
+
+def service_steps(service_id):
+    """Зависимые строки Сервиса."""
+    return (
+        ('archived comments', CommentArchive.objects.filter(
+            review__service_id=service_id)),
+        ('archived reviews', ReviewArchive.objects.filter(
+            service_id=service_id)),
+        ('comments', Comment.objects.filter(review__service_id=service_id)),
+        ('reviews', Review.objects.filter(service_id=service_id)),
+        ('favorites', Favorite.objects.filter(service_id=service_id)),
+        ('similar services', SimilarService.objects.filter(
+            service_id=service_id)),
+        ('similar to services', SimilarService.objects.filter(
+            similar_id=service_id)),
+        ('activities', ActivityService.objects.filter(
+            service_id=service_id)),
+        ('locations', LocationService.objects.filter(service_id=service_id)),
+        ('notifications', NotificationEvent.objects.filter(
+            service_id=service_id)),
+    )
+
+
+STEPS = {
+    CustomUser._meta.label_lower: user_steps,
+    Service._meta.label_lower: service_steps,
+}
+
+
+# Поля, по которым получатели rows_deleted сдвигают счётчики.
+COUNTED_FIELDS = ('score',)
+
+
+def delete_rows(queryset, batch_size):
+    """Удаляет до batch_size строк queryset одним DELETE, без Collector.
+
+    Возвращает удалённые строки: 'pk', id связанных объектов и поля
+    COUNTED_FIELDS. rows_deleted заменяет post_delete для счётчиков,
+    журнала и кэшей.
+    """
+    model = queryset.model
+    opts = model._meta
+    names = [field.name for field in opts.concrete_fields
+             if field.is_relation or field.name in COUNTED_FIELDS]
+    attnames = [opts.get_field(name).attname for name in names]
+    values = queryset.order_by('pk').values_list('pk', *attnames)
+    rows = [dict(zip(['pk', *names], row)) for row in values[:batch_size]]
+    if not rows:
+        return rows
+
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote_name(opts.db_table)} '
+            f'WHERE {quote_name(opts.pk.column)} = ANY(%s)',
+            [[row['pk'] for row in rows]]
+        )
+    rows_deleted.send(model, rows=rows)
+    return rows
+
+
+def deactivate_services(queryset):
+    """Деактивирует активные Сервисы queryset одним UPDATE.
+
+    rows_deactivated заменяет post_save: фасеты, журнал изменений и
+    версии фрагментов. Возвращает деактивированные строки.
+    """
+    rows = list(queryset.filter(is_active=True).select_for_update().order_by(
+        'pk'
+    ).values('pk', 'master'))
+    if rows:
+        Service.objects.filter(
+            pk__in=[row['pk'] for row in rows]
+        ).update(is_active=False)
+        rows_deactivated.send(Service, rows=rows)
+    return rows
+
+
+@transaction.atomic
+def schedule_deletion(instance):
+    """Деактивирует пользователя или Сервис и ставит задачу удаления."""
+    instance.is_active = False
+    if isinstance(instance, CustomUser):
+        instance.save(update_fields=['is_active'])
+        deactivate_services(Service.objects.filter(master=instance))
+    else:
+        deactivate_services(Service.objects.filter(pk=instance.pk))
+    job, _ = DeletionJob.objects.get_or_create(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        status=DeletionJob.PENDING
+    )
+    return job
+
+
+def run_batch(job_id, batch_size=None):
+    """Один пакет задачи в своей транзакции; True - задача завершена."""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    with transaction.atomic():
+        job = DeletionJob.objects.select_for_update(
+            skip_locked=True
+        ).filter(pk=job_id, status=DeletionJob.PENDING).first()
+        if job is None:
+            return True
+
+        for step, queryset in STEPS[job.model](job.object_id):
+            rows = delete_rows(queryset, batch_size)
+            if rows:
+                job.step = step
+                job.deleted[step] = job.deleted.get(step, 0) + len(rows)
+                job.save(update_fields=['step', 'deleted', 'updated'])
+                return False
+
+        # Зависимых строк не осталось: Collector удалит сам объект и
+        # немногие оставшиеся связи (токен, записи админки).
+        target = apps.get_model(job.model)._base_manager.filter(
+            pk=job.object_id
+        ).first()
+        if target is not None:
+            target.delete()
+        job.status = DeletionJob.DONE
+        job.step = ''
+        job.finished = timezone.now()
+        job.save(update_fields=['status', 'step', 'finished', 'updated'])
+        return True
+
+
+def process_deletions(batch_size=None, max_batches=None):
+    """Выполняет ожидающие задачи по порядку; возвращает число пакетов."""
+    batches = 0
+    for job_id in DeletionJob.objects.filter(
+        status=DeletionJob.PENDING
+    ).values_list('pk', flat=True):
+        done = False
+        while not done:
+            if max_batches is not None and batches >= max_batches:
+                return batches
+            done = run_batch(job_id, batch_size)
+            batches += 1
+    return batches
@@ -0,0 +1,255 @@
+import re
+from functools import lru_cache
+from hashlib import blake2b
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+
+from .models import (Comment,
+                     CommentHistory,
+                     Review,
+                     ReviewHistory,
+                     TextBucket,
+                     TextSignature)
+
+NON_WORD = re.compile(r'[\W_]+')
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+@lru_cache(maxsize=None)
+def get_permutations():
+    """Коэффициенты хешей (a * x + b) mod p и перемешивания полос.
+
+    a и b равномерны на [1, p), p = 2^61 - 1. Зависят только от
+    DUPLICATE_TEXTS['SEED']: подписи, посчитанные разными процессами,
+    сравнимы между собой.
+    """
+    import numpy as np
+
+    options = settings.DUPLICATE_TEXTS
+    rng = np.random.default_rng(options['SEED'])
+    num_perm = options['BANDS'] * options['ROWS']
+    a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    band_weights = rng.integers(1, 1 << 63, options['ROWS'],
+                                dtype=np.uint64) | np.uint64(1)
+    band_salts = rng.integers(0, 1 << 63, options['BANDS'], dtype=np.uint64)
+    return a, b, band_weights, band_salts
+
+
+def mod_mersenne(values):
+    """values mod p для uint64: 2^61 = 1 по модулю p."""
+    import numpy as np
+
+    prime = np.uint64(MERSENNE_PRIME)
+    values = (values & prime) + (values >> np.uint64(61))
+    return np.where(values >= prime, values - prime, values)
+
+
+def universal_hash(x, a, b):
+    """(a * x + b) mod p без переполнения uint64.
+
+    Множители делятся на 32-битные половины: a * x =
+    hi * hi * 2^64 + (hi * lo + lo * hi) * 2^32 + lo * lo, и каждое
+    слагаемое приводится по модулю p сдвигами (2^64 = 2^3 mod p).
+    """
+    import numpy as np
+
+    low_bits, shift = np.uint64(MAX_HASH), np.uint64(32)
+    x_hi, x_lo = x >> shift, x & low_bits
+    a_hi, a_lo = a >> shift, a & low_bits
+    high = mod_mersenne((x_hi * a_hi) << np.uint64(3))
+    middle = mod_mersenne(x_hi * a_lo + x_lo * a_hi)
+    middle = ((middle << shift) & np.uint64(MERSENNE_PRIME)
+              | middle >> np.uint64(29))
+    low = mod_mersenne(x_lo * a_lo)
+    return mod_mersenne(mod_mersenne(high + middle + low) + b)
+
+
+def hash_shingle(shingle):
+    """64-битный хеш шингла, приведённый к [0, p]."""
+    digest = blake2b(shingle.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') & MERSENNE_PRIME
+
+
+def get_shingle_hashes(text):
+    """Хеши символьных шинглов нормализованного текста.
+
+    None - текст короче MIN_LENGTH: короткие ответы вроде
+    'Отлично!' совпадают законно.
+    """
+    import numpy as np
+
+    options = settings.DUPLICATE_TEXTS
+    normalized = ' '.join(NON_WORD.split(text.lower())).strip()
+    if len(normalized) < options['MIN_LENGTH']:
+        return None
+    size = options['SHINGLE_SIZE']
+    return np.fromiter(
+        {hash_shingle(normalized[start:start + size])
+         for start in range(len(normalized) - size + 1)},
+        dtype=np.uint64
+    )
+
+
+def compute_signatures(texts):
+    """MinHash-подписи пачки текстов одной операцией numpy.
+
+    Возвращает позиции текстов, получивших подпись, и матрицу
+    подписей (тексты x BANDS * ROWS, uint32).
+    """
+    import numpy as np
+
+    a, b, _, _ = get_permutations()
+    positions, hashes = [], []
+    for position, text in enumerate(texts):
+        shingles = get_shingle_hashes(text)
+        if shingles is not None:
+            positions.append(position)
+            hashes.append(shingles)
+    if not positions:
+        return positions, np.empty((0, len(a)), dtype=np.uint32)
+
+    offsets = np.cumsum([0] + [len(shingles) for shingles in hashes[:-1]])
+    permuted = universal_hash(np.concatenate(hashes)[:, None], a, b)
+    signatures = np.minimum.reduceat(permuted, offsets, axis=0)
+    return positions, (signatures & MAX_HASH).astype(np.uint32)
+
+
+def get_buckets(signatures):
+    """Ключи LSH-корзин: хеш каждой полосы из ROWS значений подписи.
+
+    Тексты с оценкой сходства s совпадают хотя бы в одной полосе с
+    вероятностью 1 - (1 - s ** ROWS) ** BANDS.
+    """
+    import numpy as np
+
+    options = settings.DUPLICATE_TEXTS
+    _, _, band_weights, band_salts = get_permutations()
+    bands = signatures.astype(np.uint64).reshape(
+        len(signatures), options['BANDS'], options['ROWS']
+    )
+    buckets = (bands * band_weights).sum(axis=2, dtype=np.uint64)
+    return (buckets ^ band_salts).view(np.int64)
+
+
+def find_similar(signature, buckets, exclude=None):
+    """Сохранённая подпись с оценкой сходства не ниже THRESHOLD.
+
+    Кандидаты - подписи из тех же корзин, не больше MAX_CANDIDATES:
+    сначала совпавшие в большем числе полос, затем более новые.
+    exclude - Отзыв или Комментарий, который не сравнивается сам с собой.
+    """
+    import numpy as np
+
+    options = settings.DUPLICATE_TEXTS
+    matches = TextBucket.objects.filter(bucket__in=buckets.tolist())
+    if exclude is not None:
+        matches = matches.exclude(
+            signature__model=exclude._meta.label_lower,
+            signature__object_id=exclude.pk
+        )
+    candidates = TextSignature.objects.filter(
+        pk__in=matches.values('signature').annotate(
+            bands=Count('pk')
+        ).order_by('-bands', '-signature').values(
+            'signature'
+        )[:options['MAX_CANDIDATES']]
+    )
+
+    best, best_score = None, options['THRESHOLD']
+    for candidate in candidates:
+        score = np.mean(
+            np.frombuffer(candidate.signature, dtype=np.uint32) == signature
+        )
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def find_duplicate(text, exclude=None):
+    """Почти совпадающий опубликованный текст или None."""
+    positions, signatures = compute_signatures([text])
+    if not positions:
+        return None
+    return find_similar(signatures[0], get_buckets(signatures)[0], exclude)
+
+
+def save_signatures(model, object_ids, signatures, duplicates=None):
+    """Подписи и корзины текстов модели двумя bulk_create."""
+    buckets = get_buckets(signatures)
+    duplicates = duplicates or [None] * len(object_ids)
+    created = TextSignature.objects.bulk_create(
+        TextSignature(model=model._meta.label_lower,
+                      object_id=object_id,
+                      signature=signature.tobytes(),
+                      duplicate_of=duplicate)
+        for object_id, signature, duplicate
+        in zip(object_ids, signatures, duplicates)
+    )
+    TextBucket.objects.bulk_create(
+        TextBucket(signature=text_signature, bucket=bucket)
+        for text_signature, row in zip(created, buckets.tolist())
+        for bucket in row
+    )
+    return created
+
+
+def drop_signatures(model, object_ids):
+    TextSignature.objects.filter(model=model._meta.label_lower,
+                                 object_id__in=object_ids).delete()
+
+
+def index_text(instance):
+    """Пересчитывает подпись сохранённого текста и отмечает дубликат."""
+    model = type(instance)
+    drop_signatures(model, [instance.pk])
+    positions, signatures = compute_signatures([instance.text])
+    if not positions:
+        return None
+    duplicate = find_similar(signatures[0], get_buckets(signatures)[0])
+    return save_signatures(model, [instance.pk], signatures, [duplicate])[0]
+
+
+def backfill_signatures(batch_size=100, flag=False):
+    """Подписи всех текстов без подписи, включая архив.
+
+    Подписи пачки считаются одной операцией numpy; с flag для каждого
+    текста ищется дубликат среди уже сохранённых подписей.
+    Возвращает количество сохранённых подписей.
+    """
+    saved = 0
+    for model, history in ((Review, ReviewHistory),
+                           (Comment, CommentHistory)):
+        queryset = history.objects.filter(
+            ~Exists(TextSignature.objects.filter(
+                model=model._meta.label_lower, object_id=OuterRef('pk')
+            ))
+        ).order_by('pk').values_list('pk', 'text')
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            object_ids, texts = zip(*rows)
+            positions, signatures = compute_signatures(texts)
+            if not positions:
+                continue
+            duplicates = None
+            if flag:
+                duplicates = [
+                    find_similar(signature, buckets)
+                    for signature, buckets
+                    in zip(signatures, get_buckets(signatures))
+                ]
+            with transaction.atomic():
+                save_signatures(model,
+                                [object_ids[position]
+                                 for position in positions],
+                                signatures,
+                                duplicates)
+            saved += len(positions)
+    return saved
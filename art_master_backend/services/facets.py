@@ -0,0 +1,172 @@
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import ActivityFacet, ActivityService, Service, ServiceFacet
+from .registry import activities
+
+GLOBAL_CELL = ''
+
+
+def get_cell(point):
+    """Ячейка сетки FACET_CELL_DEGREES, в которую попадает точка."""
+    size = settings.FACET_CELL_DEGREES
+    latitude = math.floor(point.y / size) * size
+    longitude = math.floor(point.x / size) * size
+    return f'{latitude:.2f}:{longitude:.2f}'
+
+
+def get_facet_keys(queryset):
+    """Строки (id Сервиса, ключ) активных Сервисов queryset связей.
+
+    Ключ - (id Активности, ячейка); ячейка '' - все области.
+    """
+    rows = queryset.filter(service__is_active=True).order_by().values_list(
+        'activity_id', 'service_id', 'service__in_locations__location__point'
+    )
+    for activity_id, service_id, point in rows:
+        yield service_id, (activity_id, GLOBAL_CELL)
+        if point is not None:
+            yield service_id, (activity_id, get_cell(point))
+
+
+@transaction.atomic
+def refresh_activity_facets(activity_ids=None):
+    """Пересчитывает фасеты Активностей; None - всех Активностей."""
+    from .models import Activity
+
+    if activity_ids is None:
+        activity_ids = list(Activity.objects.values_list('pk', flat=True))
+    services = defaultdict(set)
+    for service_id, key in get_facet_keys(
+        ActivityService.objects.filter(activity_id__in=activity_ids)
+    ):
+        services[key].add(service_id)
+
+    ActivityFacet.objects.filter(activity_id__in=activity_ids).delete()
+    ActivityFacet.objects.bulk_create(
+        ActivityFacet(activity_id=activity_id, cell=cell,
+                      services_count=len(service_ids))
+        for (activity_id, cell), service_ids in services.items()
+    )
+    ServiceFacet.objects.filter(activity_id__in=activity_ids).delete()
+    ServiceFacet.objects.bulk_create(
+        ServiceFacet(service_id=service_id, activity_id=activity_id,
+                     cell=cell)
+        for (activity_id, cell), service_ids in services.items()
+        for service_id in service_ids
+    )
+
+
+@transaction.atomic
+def apply_service_changes(service_ids):
+    """Меняет счётчики фасетов на изменение вклада Сервисов.
+
+    Текущие ключи Сервисов сравниваются с сохранёнными в ServiceFacet,
+    и каждый затронутый (Активность, ячейка) получает F() + разница;
+    остальные Сервисы не пересчитываются.
+    """
+    service_ids = sorted(set(service_ids))
+    # Блокировки сериализуют конкурирующие изменения одного Сервиса.
+    list(Service.objects.select_for_update().filter(
+        pk__in=service_ids
+    ).values_list('pk', flat=True))
+    stored = list(ServiceFacet.objects.select_for_update().filter(
+        service_id__in=service_ids
+    ))
+    current = set(get_facet_keys(
+        ActivityService.objects.filter(service_id__in=service_ids)
+    ))
+
+    deltas = Counter()
+    removed = []
+    for facet in stored:
+        row = facet.service_id, (facet.activity_id, facet.cell)
+        if row in current:
+            current.discard(row)
+        else:
+            removed.append(facet.pk)
+            deltas[row[1]] -= 1
+    for _, key in current:
+        deltas[key] += 1
+
+    ActivityFacet.objects.bulk_create(
+        [ActivityFacet(activity_id=activity_id, cell=cell)
+         for (activity_id, cell), delta in deltas.items() if delta > 0],
+        ignore_conflicts=True
+    )
+    for (activity_id, cell), delta in sorted(deltas.items()):
+        if delta:
+            ActivityFacet.objects.filter(
+                activity_id=activity_id, cell=cell
+            ).update(services_count=F('services_count') + delta)
+    ServiceFacet.objects.filter(pk__in=removed).delete()
+    ServiceFacet.objects.bulk_create(
+        ServiceFacet(service_id=service_id, activity_id=activity_id,
+                     cell=cell)
+        for service_id, (activity_id, cell) in current
+    )
+
+
+class PendingRefresh:
+    """Обработчик on_commit с Сервисами, изменёнными в транзакции."""
+
+    def __init__(self):
+        self.service_ids = set()
+
+    def __call__(self):
+        apply_service_changes(self.service_ids)
+
+
+def schedule_refresh(service_ids):
+    """Откладывает обновление фасетов Сервисов до фиксации транзакции.
+
+    Изменения одной транзакции (set() Активностей, создание Локаций)
+    собираются в одном PendingRefresh из очереди on_commit соединения.
+    При откате Django снимает его вместе с накопленными Сервисами.
+    """
+    connection = transaction.get_connection()
+    for entry in connection.run_on_commit:
+        if isinstance(entry[1], PendingRefresh):
+            entry[1].service_ids.update(service_ids)
+            return
+    pending = PendingRefresh()
+    pending.service_ids.update(service_ids)
+    transaction.on_commit(pending)
+
+
+def annotate_services_count(queryset, cell=GLOBAL_CELL):
+    """Аннотирует Активности числом Сервисов из таблицы фасетов."""
+    facets = ActivityFacet.objects.filter(
+        activity=OuterRef('pk'), cell=cell
+    ).order_by().values('services_count')[:1]
+    return queryset.annotate(
+        services_count=Coalesce(Subquery(facets), Value(0))
+    )
+
+
+def get_services_counts(cell=GLOBAL_CELL):
+    """{id Активности: число Сервисов} для ячейки."""
+    return dict(ActivityFacet.objects.filter(
+        cell=cell, services_count__gt=0
+    ).values_list('activity_id', 'services_count'))
+
+
+def get_activity_facets(cell=GLOBAL_CELL):
+    """Блок facets для списка Сервисов: одно чтение по индексу ячейки.
+
+    Названия и slug берутся из реестра Активностей.
+    """
+    facets = []
+    for activity_id, services_count in get_services_counts(cell).items():
+        activity = activities.get(activity_id)
+        if activity is not None:
+            facets.append({'slug': activity.slug,
+                           'name': activity.name,
+                           'count': services_count})
+    facets.sort(key=lambda facet: (-facet['count'], facet['name']))
+    return {'activities': facets}
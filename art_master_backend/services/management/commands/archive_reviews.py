@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services.archive import archive_reviews, relation_sizes
+
+
+class Command(BaseCommand):
+    help = ('Перенос веток обсуждения старше --days дней в архивные '
+            'таблицы пакетами; с --sizes печатает размеры таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.REVIEW_ARCHIVE_DAYS)
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.REVIEW_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--sizes', action='store_true')
+
+    def handle(self, *args, **options):
+        reviews, comments = archive_reviews(options['days'],
+                                            options['batch_size'],
+                                            options['max_batches'])
+        self.stdout.write(
+            f'В архив перенесено отзывов: {reviews}, '
+            f'комментариев: {comments}'
+        )
+        if options['sizes']:
+            for table, (table_size, indexes_size) in relation_sizes().items():
+                self.stdout.write(
+                    f'  {table}: таблица {table_size / 2 ** 20:.1f} MB, '
+                    f'индексы {indexes_size / 2 ** 20:.1f} MB'
+                )
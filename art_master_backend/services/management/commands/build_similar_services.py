@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from services.recommendations import rebuild_similar_services
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт похожих Сервисов по избранному и активностям. '
+            'Запускается по расписанию; --services обновляет только '
+            'указанные Сервисы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', nargs='+', type=int)
+        parser.add_argument('--top-k', type=int)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        saved = rebuild_similar_services(
+            service_ids=options['services'],
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Сохранено пар похожих Сервисов: {saved}')
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from services.duplicates import backfill_signatures
+from services.models import TextSignature
+
+
+class Command(BaseCommand):
+    help = ('MinHash-подписи и LSH-корзины текстов Отзывов и Комментариев '
+            '(включая архив), у которых подписи ещё нет; --rebuild '
+            'пересчитывает все.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--flag', action='store_true',
+                            help='Отмечать найденные дубликаты.')
+        parser.add_argument('--rebuild', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            TextSignature.objects.all().delete()
+        saved = backfill_signatures(options['batch_size'], options['flag'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Сохранено подписей: {saved}')
+        )
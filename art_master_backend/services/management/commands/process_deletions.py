@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services.deletion import process_deletions
+
+
+class Command(BaseCommand):
+    help = ('Фоновое удаление деактивированных пользователей и Сервисов '
+            'пакетами; с --follow ожидает новые задачи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.DELETION_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--follow', action='store_true')
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            batches = process_deletions(options['batch_size'],
+                                        options['max_batches'])
+            if batches:
+                self.stdout.write(f'Выполнено пакетов: {batches}')
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from services.facets import refresh_activity_facets
+
+
+class Command(BaseCommand):
+    help = ('Полный пересчёт фасетов Активностей. Изменения применяются '
+            'сигналами; команда нужна после массового импорта данных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--activities', nargs='+', type=int)
+
+    def handle(self, *args, **options):
+        refresh_activity_facets(options['activities'])
+        self.stdout.write(self.style.SUCCESS('Фасеты Активностей обновлены'))
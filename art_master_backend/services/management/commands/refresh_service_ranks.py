@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from services.ranking import refresh_service_ranks
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт счётчиков и ранга Сервисов. Запускается по '
+            'расписанию, чтобы обновить затухание по свежести.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', nargs='+', type=int)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = refresh_service_ranks(
+            service_ids=options['services'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Обновлено Сервисов: {updated}')
+        )
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from services.notifications import send_digests
+
+
+class Command(BaseCommand):
+    help = ('Дайджесты новых Сервисов подписчикам Мастеров: события '
+            'окна группируются по клиентам и отправляются пачками через '
+            'одно соединение; с --follow ожидает новые события.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.NOTIFICATION_DIGESTS['BATCH_SIZE']
+        )
+        parser.add_argument(
+            '--window', type=int,
+            default=settings.NOTIFICATION_DIGESTS['WINDOW_SECONDS']
+        )
+        parser.add_argument('--follow', action='store_true')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_digests(batch_size=options['batch_size'],
+                                window=options['window'])
+            if sent:
+                self.stdout.write(f'Отправлено писем: {sent}')
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.renderers import FastJSONRenderer
+from services.changelog import (parse_cursor,
+                                read_changes,
+                                serialize_change)
+
+
+class Command(BaseCommand):
+    help = ('Чтение журнала изменений пачками по возрастанию (txid, id) '
+            'в формате JSONL; с --follow ожидает новые записи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default='0.0',
+                            help='Курсор последней обработанной записи.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--follow', action='store_true')
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        renderer = FastJSONRenderer()
+        since = parse_cursor(options['since'])
+        while True:
+            changes = read_changes(since, options['batch_size'])
+            for change in changes:
+                sys.stdout.buffer.write(
+                    renderer.render(serialize_change(change)) + b'\n'
+                )
+            sys.stdout.flush()
+            if changes:
+                since = changes[-1].txid, changes[-1].id
+            if len(changes) < options['batch_size']:
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
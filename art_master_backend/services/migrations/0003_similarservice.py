@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_services', to='services.service')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='services.service')),
+            ],
+            options={
+                'verbose_name_plural': 'Similar Services',
+                'ordering': ['service', '-score'],
+                'indexes': [models.Index(fields=['service', '-score'], name='similar_service_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='similarservice',
+            constraint=models.UniqueConstraint(fields=('service', 'similar'), name='unique_similar_service'),
+        ),
+    ]
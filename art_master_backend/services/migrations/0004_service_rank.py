@@ -0,0 +1,80 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_ranks(apps, schema_editor):
+    from services.ranking import compute_rank
+
+    Service = apps.get_model('services', 'Service')
+    Review = apps.get_model('services', 'Review')
+    Favorite = apps.get_model('services', 'Favorite')
+    reviews = Review.objects.filter(
+        service=OuterRef('pk')
+    ).order_by().values('service')
+    favorites = Favorite.objects.filter(
+        service=OuterRef('pk')
+    ).order_by().values('service')
+    services = Service.objects.only('pk', 'created').annotate(
+        reviews_total=Coalesce(Subquery(
+            reviews.annotate(total=Count('pk')).values('total')
+        ), 0),
+        reviews_score_total=Coalesce(Subquery(
+            reviews.annotate(total=Sum('score')).values('total')
+        ), 0),
+        favorites_total=Coalesce(Subquery(
+            favorites.annotate(total=Count('pk')).values('total')
+        ), 0),
+    )
+    batch = []
+    for service in services.iterator(chunk_size=1000):
+        service.reviews_count = service.reviews_total
+        service.reviews_score_sum = service.reviews_score_total
+        service.favorites_count = service.favorites_total
+        service.rank = compute_rank(service.reviews_count,
+                                    service.reviews_score_sum,
+                                    service.favorites_count,
+                                    service.created)
+        batch.append(service)
+    Service.objects.bulk_update(
+        batch,
+        ['reviews_count', 'reviews_score_sum', 'favorites_count', 'rank'],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_similarservice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rank',
+            field=models.FloatField(default=0, editable=False, verbose_name='Ранг'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='reviews_score_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['-rank', '-id'], name='service_rank_idx'),
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+
+
+def backfill_facets(apps, schema_editor):
+    from services.facets import GLOBAL_CELL, get_cell
+
+    ActivityService = apps.get_model('services', 'ActivityService')
+    ActivityFacet = apps.get_model('services', 'ActivityFacet')
+    counts = defaultdict(set)
+    rows = ActivityService.objects.order_by().values_list(
+        'activity_id', 'service_id', 'service__in_locations__location__point'
+    )
+    for activity_id, service_id, point in rows.iterator():
+        counts[activity_id, GLOBAL_CELL].add(service_id)
+        if point is not None:
+            counts[activity_id, get_cell(point)].add(service_id)
+    ActivityFacet.objects.bulk_create(
+        ActivityFacet(activity_id=activity_id, cell=cell,
+                      services_count=len(services))
+        for (activity_id, cell), services in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.CharField(blank=True, max_length=32, verbose_name='Ячейка области')),
+                ('services_count', models.PositiveIntegerField(default=0, verbose_name='Количество Сервисов')),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='services.activity')),
+            ],
+            options={
+                'verbose_name_plural': 'Activity Facets',
+                'ordering': ['activity'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activityfacet',
+            constraint=models.UniqueConstraint(fields=('cell', 'activity'), name='unique_activity_facet'),
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_activityfacet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('action', models.CharField(choices=[('create', 'Создание'), ('update', 'Изменение'), ('delete', 'Удаление')], max_length=6, verbose_name='Действие')),
+                ('data', models.JSONField(default=dict, verbose_name='Связи объекта')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Change',
+                'verbose_name_plural': 'Change Log',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0007_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('done', 'Завершено')], default='pending', max_length=7, verbose_name='Статус')),
+                ('step', models.CharField(blank=True, max_length=100, verbose_name='Текущий шаг')),
+                ('deleted', models.JSONField(default=dict, verbose_name='Удалено строк')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('finished', models.DateTimeField(null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'Deletion Job',
+                'verbose_name_plural': 'Deletion Jobs',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='is_active',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Активен'),
+        ),
+        migrations.AddConstraint(
+            model_name='deletionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('model', 'object_id'), name='unique_pending_deletion_job'),
+        ),
+    ]
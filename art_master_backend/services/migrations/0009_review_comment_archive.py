@@ -0,0 +1,100 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Представления полной истории (ReviewHistory, CommentHistory). Столбцы
+# перечислены явно: изменение таблиц Отзывов и Комментариев потребует
+# пересоздать представления в той же миграции.
+HISTORY_VIEWS = (
+    ('services_review_history', 'services_review', 'services_reviewarchive',
+     'id, service_id, text, score, author_id, pub_date'),
+    ('services_comment_history', 'services_comment',
+     'services_commentarchive', 'id, review_id, text, author_id, pub_date'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('services', '0008_service_is_active_deletionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+            ],
+            options={
+                'db_table': 'services_comment_history',
+                'ordering': ['-pub_date'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReviewHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('score', models.PositiveSmallIntegerField(verbose_name='Оценка')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+            ],
+            options={
+                'db_table': 'services_review_history',
+                'ordering': ['-pub_date'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReviewArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('score', models.PositiveSmallIntegerField(verbose_name='Оценка')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('service', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.service', verbose_name='Сервис')),
+            ],
+            options={
+                'verbose_name': 'Archived Review',
+                'verbose_name_plural': 'Archived Reviews',
+                'ordering': ['-pub_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommentArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('review', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.reviewarchive', verbose_name='Отзыв')),
+            ],
+            options={
+                'verbose_name': 'Archived Comment',
+                'verbose_name_plural': 'Archived Comments',
+                'ordering': ['-pub_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reviewarchive',
+            index=models.Index(fields=['service', '-pub_date', '-id'], name='review_archive_service_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentarchive',
+            index=models.Index(fields=['review', '-pub_date', '-id'], name='comment_archive_review_idx'),
+        ),
+        *(
+            migrations.RunSQL(
+                f'CREATE VIEW {view} AS SELECT {columns} FROM {hot} '
+                f'UNION ALL SELECT {columns} FROM {archive}',
+                f'DROP VIEW {view}'
+            )
+            for view, hot, archive, columns in HISTORY_VIEWS
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0009_review_comment_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('signature', models.BinaryField(verbose_name='Подпись')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='services.textsignature', verbose_name='Дубликат текста')),
+            ],
+            options={
+                'verbose_name': 'Text Signature',
+                'verbose_name_plural': 'Text Signatures',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TextBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='Корзина')),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='services.textsignature', verbose_name='Подпись')),
+            ],
+            options={
+                'verbose_name': 'Text Bucket',
+                'verbose_name_plural': 'Text Buckets',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='textsignature',
+            constraint=models.UniqueConstraint(fields=('model', 'object_id'), name='unique_text_signature'),
+        ),
+        migrations.AddIndex(
+            model_name='textbucket',
+            index=models.Index(fields=['bucket', 'signature'], name='text_bucket_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('services', '0010_textsignature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_client', models.BigIntegerField(default=0, verbose_name='Последний клиент')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено писем')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('finished', models.DateTimeField(null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'Notification Digest',
+                'verbose_name_plural': 'Notification Digests',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата события')),
+                ('digest', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='services.notificationdigest', verbose_name='Дайджест')),
+                ('master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Мастер')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.service', verbose_name='Сервис')),
+            ],
+            options={
+                'verbose_name': 'Notification Event',
+                'verbose_name_plural': 'Notification Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('digest', None)), fields=['created'], name='notification_pending_idx')],
+            },
+        ),
+    ]
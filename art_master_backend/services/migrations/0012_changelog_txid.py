@@ -0,0 +1,26 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0011_notifications'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='changelog',
+            options={'ordering': ['txid', 'id'], 'verbose_name': 'Change', 'verbose_name_plural': 'Change Log'},
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='txid',
+            field=models.BigIntegerField(default=0, verbose_name='Транзакция'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['txid', 'id'], name='changelog_txid_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:53
+
+from django.db import migrations, models
+from collections import defaultdict
+
+
+def backfill_service_facets(apps, schema_editor):
+    """Вклады активных Сервисов и пересчитанные по ним счётчики."""
+    from services.facets import GLOBAL_CELL, get_cell
+
+    ActivityService = apps.get_model('services', 'ActivityService')
+    ActivityFacet = apps.get_model('services', 'ActivityFacet')
+    ServiceFacet = apps.get_model('services', 'ServiceFacet')
+    services = defaultdict(set)
+    rows = ActivityService.objects.filter(
+        service__is_active=True
+    ).order_by().values_list(
+        'activity_id', 'service_id', 'service__in_locations__location__point'
+    )
+    for activity_id, service_id, point in rows.iterator():
+        services[activity_id, GLOBAL_CELL].add(service_id)
+        if point is not None:
+            services[activity_id, get_cell(point)].add(service_id)
+    ActivityFacet.objects.all().delete()
+    ActivityFacet.objects.bulk_create(
+        ActivityFacet(activity_id=activity_id, cell=cell,
+                      services_count=len(service_ids))
+        for (activity_id, cell), service_ids in services.items()
+    )
+    ServiceFacet.objects.bulk_create(
+        ServiceFacet(service_id=service_id, activity_id=activity_id,
+                     cell=cell)
+        for (activity_id, cell), service_ids in services.items()
+        for service_id in service_ids
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0012_changelog_txid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_id', models.BigIntegerField(verbose_name='id Сервиса')),
+                ('activity_id', models.BigIntegerField(verbose_name='id Активности')),
+                ('cell', models.CharField(blank=True, max_length=32, verbose_name='Ячейка области')),
+            ],
+            options={
+                'verbose_name_plural': 'Service Facets',
+                'ordering': ['service_id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='servicefacet',
+            constraint=models.UniqueConstraint(fields=('service_id', 'activity_id', 'cell'), name='unique_service_facet'),
+        ),
+        migrations.RunPython(backfill_service_facets,
+                             migrations.RunPython.noop),
+    ]
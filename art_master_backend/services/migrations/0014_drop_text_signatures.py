@@ -0,0 +1,22 @@
+# Generated by Django 4.2.6 on 2026-10-19 13:03
+
+from django.db import migrations
+
+
+def drop_signatures(apps, schema_editor):
+    """Подписи старого семейства хешей несравнимы с новыми.
+
+    После миграции их пересчитывает build_text_signatures.
+    """
+    apps.get_model('services', 'TextSignature').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0013_servicefacet'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+from django.db import router, transaction
+
+
+class AtomicSaveMixin:
+    """save() вместе с post_save в одной транзакции.
+
+    Django отправляет post_save после выхода из транзакции сохранения,
+    а журнал изменений (ChangeLog) должен фиксироваться атомарно с самой
+    записью. Удаление через Collector уже атомарно вместе с post_delete.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
@@ -3,10 +3,10 @@ from django.contrib.gis.db import models as gismodels
 from django.db import models
 from django.core.validators import MaxValueValidator, MinValueValidator
 
-from colorfield.fields import ColorField
-
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .mixins import AtomicSaveMixin
+
 
 class Activity(models.Model):
     """Модель Активности."""
@@ -23,7 +23,7 @@ class Activity(models.Model):
         return self.name
 
 
-class Location(gismodels.Model):
+class Location(AtomicSaveMixin, gismodels.Model):
     """Модель Локации."""
     address = models.CharField(
         verbose_name='Адрес',
@@ -40,7 +40,7 @@ class Location(gismodels.Model):
         return self.address
 
 
-class Service(models.Model):
+class Service(AtomicSaveMixin, models.Model):
     """Модель Сервиса."""
     name = models.CharField('Наименование услуги', max_length=256)
     description = models.TextField('Описание', null=False, blank=False)
@@ -77,18 +77,36 @@ class Service(models.Model):
     created = models.DateTimeField(
         'Дата размещения информации', auto_now_add=True, db_index=True
     )
+    reviews_count = models.PositiveIntegerField(
+        'Количество отзывов', default=0, editable=False
+    )
+    reviews_score_sum = models.PositiveIntegerField(
+        'Сумма оценок', default=0, editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    rank = models.FloatField('Ранг', default=0, editable=False)
+    is_active = models.BooleanField(
+        'Активен', default=True, editable=False
+    )
 
     class Meta:
         ordering = ['-created']
         verbose_name = 'Service'
         verbose_name_plural = 'Services'
         default_related_name = 'services'
+        indexes = [
+            models.Index(fields=['-rank', '-id'], name='service_rank_idx'),
+            models.Index(fields=['master', '-created'],
+                         name='service_master_created_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Review(models.Model):
+class Review(AtomicSaveMixin, models.Model):
     """Модель Отзыва."""
     service = models.ForeignKey(
         Service,
@@ -114,6 +132,10 @@ class Review(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Review'
         verbose_name_plural = 'Reviews'
+        indexes = [
+            models.Index(fields=['service', '-pub_date', '-id'],
+                         name='review_service_pub_date_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['service', 'author'],
@@ -122,7 +144,7 @@ class Review(models.Model):
         ]
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveMixin, models.Model):
     """Модель Комментария к Отзыву."""
     review = models.ForeignKey(
         Review,
@@ -145,6 +167,129 @@ class Comment(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
+        indexes = [
+            models.Index(fields=['review', '-pub_date', '-id'],
+                         name='comment_review_pub_date_idx'),
+        ]
+
+
+class ReviewArchive(models.Model):
+    """Модель архива Отзывов (холодная таблица).
+
+    Ветки обсуждения старше REVIEW_ARCHIVE_DAYS переносятся сюда
+    командой archive_reviews вместе с комментариями и сохраняют id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    service = models.ForeignKey(
+        Service,
+        verbose_name='Сервис',
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    text = models.TextField('Текст')
+    score = models.PositiveSmallIntegerField('Оценка')
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Archived Review'
+        verbose_name_plural = 'Archived Reviews'
+        indexes = [
+            models.Index(fields=['service', '-pub_date', '-id'],
+                         name='review_archive_service_idx'),
+        ]
+
+
+class CommentArchive(models.Model):
+    """Модель архива Комментариев к Отзывам (холодная таблица)."""
+    id = models.BigIntegerField(primary_key=True)
+    review = models.ForeignKey(
+        ReviewArchive,
+        verbose_name='Отзыв',
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False
+    )
+    text = models.TextField('Текст')
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Archived Comment'
+        verbose_name_plural = 'Archived Comments'
+        indexes = [
+            models.Index(fields=['review', '-pub_date', '-id'],
+                         name='comment_archive_review_idx'),
+        ]
+
+
+class ReviewHistory(models.Model):
+    """Все Отзывы: представление UNION ALL горячей и архивной таблиц.
+
+    Только для чтения. Условия по service и pub_date PostgreSQL
+    переносит в обе таблицы, поэтому страница ленты по индексам
+    сначала читает горячую таблицу и продолжается в архиве.
+    """
+    service = models.ForeignKey(
+        Service,
+        verbose_name='Сервис',
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_constraint=False
+    )
+    text = models.TextField('Текст')
+    score = models.PositiveSmallIntegerField('Оценка')
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор',
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_constraint=False
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        managed = False
+        db_table = 'services_review_history'
+        ordering = ['-pub_date']
+
+
+class CommentHistory(models.Model):
+    """Все Комментарии: представление UNION ALL, только для чтения."""
+    review = models.ForeignKey(
+        ReviewHistory,
+        verbose_name='Отзыв',
+        on_delete=models.DO_NOTHING,
+        related_name='comments',
+        db_constraint=False
+    )
+    text = models.TextField('Текст')
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор',
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_constraint=False
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        managed = False
+        db_table = 'services_comment_history'
+        ordering = ['-pub_date']
 
 
 class ActivityService(models.Model):
@@ -197,7 +342,7 @@ class LocationService(models.Model):
         return f'{self.location} {self.service}'
 
 
-class Favorite(models.Model):
+class Favorite(AtomicSaveMixin, models.Model):
     """Модель избранных Сервисов."""
     client = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -216,6 +361,272 @@ class Favorite(models.Model):
             models.UniqueConstraint(fields=['client', 'service'],
                                     name='unique_favorite')
         ]
+        indexes = [
+            models.Index(fields=['service'], include=['client'],
+                         name='favorite_service_idx'),
+        ]
 
     def __str__(self):
         return f'{self.client} {self.service}'
+
+
+class SimilarService(models.Model):
+    """Модель предрассчитанных похожих Сервисов (top-K соседей)."""
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        related_name='similar_services'
+    )
+    similar = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        related_name='similar_to'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        ordering = ['service', '-score']
+        verbose_name_plural = 'Similar Services'
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'similar'],
+                                    name='unique_similar_service')
+        ]
+        indexes = [
+            models.Index(fields=['service', '-score'],
+                         name='similar_service_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.service} {self.similar}'
+
+
+class ActivityFacet(models.Model):
+    """Модель предрассчитанного числа Сервисов Активности по областям."""
+    activity = models.ForeignKey(
+        Activity,
+        on_delete=models.CASCADE,
+        related_name='facets'
+    )
+    cell = models.CharField('Ячейка области', max_length=32, blank=True)
+    services_count = models.PositiveIntegerField(
+        'Количество Сервисов', default=0
+    )
+
+    class Meta:
+        ordering = ['activity']
+        verbose_name_plural = 'Activity Facets'
+        constraints = [
+            models.UniqueConstraint(fields=['cell', 'activity'],
+                                    name='unique_activity_facet')
+        ]
+
+    def __str__(self):
+        return f'{self.activity} {self.cell} {self.services_count}'
+
+
+class ServiceFacet(models.Model):
+    """Модель вклада Сервиса в фасеты: ключи (Активность, ячейка).
+
+    При изменении Сервиса счётчики ActivityFacet меняются на разницу
+    сохранённых и текущих ключей. Ссылки без внешних ключей: строки
+    переживают удаление Сервиса, пока его вклад не вычтен.
+    """
+    service_id = models.BigIntegerField('id Сервиса')
+    activity_id = models.BigIntegerField('id Активности')
+    cell = models.CharField('Ячейка области', max_length=32, blank=True)
+
+    class Meta:
+        ordering = ['service_id']
+        verbose_name_plural = 'Service Facets'
+        constraints = [
+            models.UniqueConstraint(fields=['service_id', 'activity_id',
+                                            'cell'],
+                                    name='unique_service_facet')
+        ]
+
+    def __str__(self):
+        return f'{self.service_id} {self.activity_id} {self.cell}'
+
+
+class ChangeLog(models.Model):
+    """Модель журнала изменений (transactional outbox).
+
+    Запись добавляется в транзакции изменения объекта. id выдаются
+    раньше фиксации и не упорядочены по ней, поэтому курсор
+    потребителя - пара (txid, id): txid - номер транзакции записи.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = (
+        (CREATE, 'Создание'),
+        (UPDATE, 'Изменение'),
+        (DELETE, 'Удаление'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField('Модель', max_length=100)
+    object_id = models.BigIntegerField('id объекта')
+    action = models.CharField('Действие', max_length=6, choices=ACTIONS)
+    data = models.JSONField('Связи объекта', default=dict)
+    created = models.DateTimeField('Дата изменения', auto_now_add=True)
+    txid = models.BigIntegerField('Транзакция', default=0)
+
+    class Meta:
+        ordering = ['txid', 'id']
+        verbose_name = 'Change'
+        verbose_name_plural = 'Change Log'
+        indexes = [
+            models.Index(fields=['txid', 'id'], name='changelog_txid_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.id} {self.action} {self.model}:{self.object_id}'
+
+
+class DeletionJob(models.Model):
+    """Модель фонового пакетного удаления пользователя или Сервиса.
+
+    Объект деактивируется сразу, зависимые строки удаляются пакетами
+    командой process_deletions; deleted - удалено строк по шагам.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    STATUSES = (
+        (PENDING, 'Ожидает'),
+        (DONE, 'Завершено'),
+    )
+
+    model = models.CharField('Модель', max_length=100)
+    object_id = models.BigIntegerField('id объекта')
+    status = models.CharField('Статус', max_length=7, choices=STATUSES,
+                              default=PENDING)
+    step = models.CharField('Текущий шаг', max_length=100, blank=True)
+    deleted = models.JSONField('Удалено строк', default=dict)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    finished = models.DateTimeField('Дата завершения', null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Deletion Job'
+        verbose_name_plural = 'Deletion Jobs'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model', 'object_id'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_deletion_job'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.model}:{self.object_id} {self.status}'
+
+
+class TextSignature(models.Model):
+    """Модель MinHash-подписи текста Отзыва или Комментария.
+
+    signature - минимальные хеши шинглов (uint32), buckets - ключи
+    LSH-полос для поиска кандидатов; duplicate_of - найденный почти
+    совпадающий текст.
+    """
+    model = models.CharField('Модель', max_length=100)
+    object_id = models.BigIntegerField('id объекта')
+    signature = models.BinaryField('Подпись')
+    duplicate_of = models.ForeignKey(
+        'self',
+        verbose_name='Дубликат текста',
+        on_delete=models.SET_NULL,
+        related_name='duplicates',
+        null=True,
+        blank=True
+    )
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Text Signature'
+        verbose_name_plural = 'Text Signatures'
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id'],
+                                    name='unique_text_signature')
+        ]
+
+    def __str__(self):
+        return f'{self.model}:{self.object_id}'
+
+
+class TextBucket(models.Model):
+    """Модель LSH-корзины: ключ полосы подписи текста."""
+    signature = models.ForeignKey(
+        TextSignature,
+        verbose_name='Подпись',
+        on_delete=models.CASCADE,
+        related_name='buckets'
+    )
+    bucket = models.BigIntegerField('Корзина')
+
+    class Meta:
+        verbose_name = 'Text Bucket'
+        verbose_name_plural = 'Text Buckets'
+        indexes = [
+            models.Index(fields=['bucket', 'signature'],
+                         name='text_bucket_idx'),
+        ]
+
+
+class NotificationDigest(models.Model):
+    """Модель рассылки дайджеста подписчикам.
+
+    События окна привязываются к дайджесту при создании; клиенты
+    обходятся по возрастанию id, last_client - курсор продолжения.
+    """
+    last_client = models.BigIntegerField('Последний клиент', default=0)
+    sent = models.PositiveIntegerField('Отправлено писем', default=0)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+    finished = models.DateTimeField('Дата завершения', null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Notification Digest'
+        verbose_name_plural = 'Notification Digests'
+
+    def __str__(self):
+        return f'{self.id} {self.created}'
+
+
+class NotificationEvent(models.Model):
+    """Модель события для подписчиков: Мастер опубликовал Сервис."""
+    master = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Мастер',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    service = models.ForeignKey(
+        Service,
+        verbose_name='Сервис',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    digest = models.ForeignKey(
+        NotificationDigest,
+        verbose_name='Дайджест',
+        on_delete=models.CASCADE,
+        related_name='events',
+        null=True
+    )
+    created = models.DateTimeField('Дата события', auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Notification Event'
+        verbose_name_plural = 'Notification Events'
+        indexes = [
+            models.Index(fields=['created'],
+                         condition=models.Q(digest=None),
+                         name='notification_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.master_id}:{self.service_id}'
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import CustomUser, Subscribe
+
+from .models import NotificationDigest, NotificationEvent
+
+DIGEST_SUBJECT = 'Новые услуги мастеров, на которых вы подписаны'
+
+
+def record_service_published(service):
+    """Событие для подписчиков Мастера; письма отправит send_digests."""
+    if Subscribe.objects.filter(master_id=service.master_id).exists():
+        NotificationEvent.objects.create(master_id=service.master_id,
+                                         service=service)
+
+
+def collect_digest(window=None, now=None):
+    """Новый дайджест из ожидающих событий.
+
+    Создаётся, когда самому старому событию больше окна: клиент
+    получает не больше одного письма за WINDOW_SECONDS.
+    """
+    if window is None:
+        window = settings.NOTIFICATION_DIGESTS['WINDOW_SECONDS']
+    now = now or timezone.now()
+    with transaction.atomic():
+        events = list(NotificationEvent.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            digest=None, created__lte=now
+        ).order_by('created').values_list('pk', 'created'))
+        if not events or events[0][1] > now - timedelta(seconds=window):
+            return None
+        digest = NotificationDigest.objects.create()
+        NotificationEvent.objects.filter(
+            pk__in=[pk for pk, _ in events]
+        ).update(digest=digest)
+    return digest
+
+
+def get_services_by_master(digest_id):
+    """Опубликованные Сервисы дайджеста по id Мастера."""
+    services = defaultdict(list)
+    for event in NotificationEvent.objects.filter(
+        digest_id=digest_id, service__is_active=True
+    ).select_related('service__master').order_by('pk'):
+        services[event.master_id].append(event.service)
+    return services
+
+
+def build_message(client, services):
+    lines = [f'Здравствуйте, {client.username}!', '', DIGEST_SUBJECT + ':']
+    lines += [f'- {service.master.username}: {service.name}'
+              for service in services]
+    return EmailMessage(DIGEST_SUBJECT,
+                        '\n'.join(lines),
+                        settings.NOTIFICATION_DIGESTS['FROM_EMAIL'],
+                        [client.email])
+
+
+def send_page(digest_id, services_by_master, connection, batch_size=None):
+    """Письма следующим batch_size подписчикам одним send_messages().
+
+    Клиенты выбираются по ключу (id больше курсора), курсор сохраняется
+    в той же транзакции. Возвращает число писем; None - дайджест
+    завершён или обрабатывается другим процессом.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_DIGESTS['BATCH_SIZE']
+    with transaction.atomic():
+        digest = NotificationDigest.objects.select_for_update(
+            skip_locked=True
+        ).filter(pk=digest_id, finished=None).first()
+        if digest is None:
+            return None
+
+        subscriptions = Subscribe.objects.filter(
+            master_id__in=services_by_master
+        )
+        client_ids = list(subscriptions.filter(
+            client_id__gt=digest.last_client
+        ).order_by('client_id').values_list(
+            'client_id', flat=True
+        ).distinct()[:batch_size])
+        if not client_ids:
+            digest.finished = timezone.now()
+            digest.save(update_fields=['finished'])
+            return None
+
+        masters = defaultdict(list)
+        for client_id, master_id in subscriptions.filter(
+            client_id__in=client_ids
+        ).order_by('client_id', 'master_id').values_list('client_id',
+                                                         'master_id'):
+            masters[client_id].append(master_id)
+        clients = CustomUser.objects.filter(
+            pk__in=client_ids, is_active=True
+        ).exclude(email='').only('pk', 'username', 'email')
+        messages = [
+            build_message(client, [service
+                                   for master_id in masters[client.pk]
+                                   for service
+                                   in services_by_master[master_id]])
+            for client in clients
+        ]
+        sent = connection.send_messages(messages) or 0
+
+        digest.last_client = client_ids[-1]
+        digest.sent += sent
+        digest.save(update_fields=['last_client', 'sent'])
+        return sent
+
+
+def send_digests(connection=None, batch_size=None, window=None):
+    """Собирает и отправляет дайджесты; возвращает число писем.
+
+    Все страницы всех дайджестов уходят через одно соединение
+    get_connection(). Письма страницы, отправленные до сбоя
+    сохранения курсора, при повторе уйдут ещё раз.
+    """
+    collect_digest(window)
+    connection = connection or get_connection()
+    sent = 0
+    with connection:
+        for digest_id in NotificationDigest.objects.filter(
+            finished=None
+        ).values_list('pk', flat=True):
+            services_by_master = get_services_by_master(digest_id)
+            while True:
+                page = send_page(digest_id, services_by_master,
+                                 connection, batch_size)
+                if page is None:
+                    break
+                sent += page
+    return sent
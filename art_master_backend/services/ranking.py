@@ -0,0 +1,193 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance
+from django.db import transaction
+from django.db.models import (Count,
+                              ExpressionWrapper,
+                              F,
+                              FloatField,
+                              OuterRef,
+                              Subquery,
+                              Sum,
+                              Value)
+from django.db.models.functions import Cast, Coalesce, Extract, Ln, Power
+from django.utils import timezone
+
+from .models import Favorite, LocationService, ReviewHistory, Service
+
+MAX_SCORE = 10
+SECONDS_PER_DAY = 86400
+
+# Хранимые счётчики Сервиса в порядке сдвигов apply_counter_deltas.
+COUNTERS = ('reviews_count', 'reviews_score_sum', 'favorites_count')
+
+
+def compute_rank(reviews_count, reviews_score_sum, favorites_count,
+                 created=None, now=None):
+    """Ранг Сервиса: сглаженная оценка, популярность и свежесть.
+
+    Оценка сглаживается по Байесу к PRIOR_MEAN с весом PRIOR_WEIGHT
+    отзывов, счётчики входят логарифмически, свежесть затухает
+    вдвое за HALF_LIFE_DAYS.
+    """
+    weights = settings.SERVICE_RANKING
+    now = now or timezone.now()
+    rating = (
+        (weights['PRIOR_MEAN'] * weights['PRIOR_WEIGHT'] + reviews_score_sum)
+        / (weights['PRIOR_WEIGHT'] + reviews_count)
+    )
+    age_days = max((now - (created or now)).total_seconds(), 0)
+    age_days /= SECONDS_PER_DAY
+    return (weights['RATING'] * rating / MAX_SCORE
+            + weights['REVIEWS'] * math.log1p(reviews_count)
+            + weights['FAVORITES'] * math.log1p(favorites_count)
+            + weights['RECENCY']
+            * 0.5 ** (age_days / weights['HALF_LIFE_DAYS']))
+
+
+def annotate_counters(queryset):
+    """Счётчики отзывов (с архивом) и избранного подзапросами."""
+    reviews = ReviewHistory.objects.filter(
+        service=OuterRef('pk')
+    ).order_by().values('service')
+    favorites = Favorite.objects.filter(
+        service=OuterRef('pk')
+    ).order_by().values('service')
+    return queryset.annotate(
+        reviews_total=Coalesce(
+            Subquery(reviews.annotate(total=Count('pk')).values('total')), 0
+        ),
+        reviews_score_total=Coalesce(
+            Subquery(reviews.annotate(total=Sum('score')).values('total')), 0
+        ),
+        favorites_total=Coalesce(
+            Subquery(favorites.annotate(total=Count('pk')).values('total')), 0
+        ),
+    )
+
+
+def refresh_service_ranks(service_ids=None, now=None, batch_size=1000):
+    """Пересчитывает счётчики и ранг Сервисов; None - все Сервисы.
+
+    Возвращает количество обновлённых Сервисов.
+    """
+    now = now or timezone.now()
+    queryset = Service.objects.order_by('pk')
+    if service_ids is not None:
+        queryset = queryset.filter(pk__in=service_ids)
+    queryset = annotate_counters(queryset.only('pk', 'created'))
+
+    updated = 0
+    batch = []
+    for service in queryset.iterator(chunk_size=batch_size):
+        service.reviews_count = service.reviews_total
+        service.reviews_score_sum = service.reviews_score_total
+        service.favorites_count = service.favorites_total
+        service.rank = compute_rank(service.reviews_count,
+                                    service.reviews_score_sum,
+                                    service.favorites_count,
+                                    service.created,
+                                    now)
+        batch.append(service)
+        if len(batch) >= batch_size:
+            updated += save_ranks(batch)
+            batch = []
+    return updated + save_ranks(batch)
+
+
+def apply_counter_deltas(deltas, now=None):
+    """Сдвигает счётчики Сервисов и пересчитывает их ранг в SQL.
+
+    deltas - {id Сервиса: (отзывы, сумма оценок, избранное)}. Сервисы
+    с одинаковым сдвигом меняются одним UPDATE через F(), поэтому
+    конкурирующие транзакции не теряют изменений друг друга. Возвращает
+    количество затронутых Сервисов.
+    """
+    groups = defaultdict(list)
+    for service_id, delta in deltas.items():
+        if any(delta):
+            groups[tuple(delta)].append(service_id)
+    if not groups:
+        return 0
+    service_ids = sorted(pk for ids in groups.values() for pk in ids)
+    with transaction.atomic():
+        for delta, ids in groups.items():
+            Service.objects.filter(pk__in=ids).update(**{
+                name: F(name) + value
+                for name, value in zip(COUNTERS, delta) if value
+            })
+        Service.objects.filter(pk__in=service_ids).update(
+            rank=rank_expression(now, *COUNTERS)
+        )
+    return len(service_ids)
+
+
+def save_ranks(services):
+    Service.objects.bulk_update(services, ['reviews_count',
+                                           'reviews_score_sum',
+                                           'favorites_count',
+                                           'rank'])
+    return len(services)
+
+
+def rank_expression(now=None, reviews='reviews_total',
+                    score='reviews_score_total', favorites='favorites_total'):
+    """compute_rank как SQL-выражение над счётчиками.
+
+    По умолчанию счётчики берутся из annotate_counters, для UPDATE -
+    из хранимых полей COUNTERS.
+    """
+    weights = settings.SERVICE_RANKING
+    now = now or timezone.now()
+    reviews = Cast(reviews, FloatField())
+    favorites = Cast(favorites, FloatField())
+    age_days = Cast(
+        Extract(Value(now) - F('created'), 'epoch'), FloatField()
+    ) / SECONDS_PER_DAY
+    return ExpressionWrapper(
+        weights['RATING'] / MAX_SCORE
+        * (weights['PRIOR_MEAN'] * weights['PRIOR_WEIGHT']
+           + Cast(score, FloatField()))
+        / (weights['PRIOR_WEIGHT'] + reviews)
+        + weights['REVIEWS'] * Ln(reviews + 1)
+        + weights['FAVORITES'] * Ln(favorites + 1)
+        + weights['RECENCY'] * Power(
+            Value(0.5), age_days / weights['HALF_LIFE_DAYS']
+        ),
+        output_field=FloatField()
+    )
+
+
+def annotate_rank(queryset, now=None):
+    """Ранг, вычисляемый в запросе: эталон для сравнения с хранимым."""
+    return annotate_counters(queryset).annotate(
+        computed_rank=rank_expression(now)
+    )
+
+
+def order_by_rank(queryset, point=None):
+    """Сортировка по хранимому рангу, с point - с учётом расстояния.
+
+    Без точки сортировка идёт по индексу (-rank, -id). Расстояние
+    до ближайшей Локации делит ранг на 1 + км / DISTANCE_KM; Сервисы
+    без Локаций считаются удалёнными на DISTANCE_KM.
+    """
+    if point is None:
+        return queryset.order_by('-rank', '-id')
+    scale = settings.SERVICE_RANKING['DISTANCE_KM']
+    nearest = LocationService.objects.filter(
+        service=OuterRef('pk')
+    ).annotate(
+        distance=Distance('location__point', point)
+    ).order_by('distance').values('distance')[:1]
+    distance_km = Coalesce(
+        Subquery(nearest, output_field=FloatField()) / 1000, Value(scale),
+        output_field=FloatField()
+    )
+    return queryset.annotate(
+        local_rank=ExpressionWrapper(
+            F('rank') / (1 + distance_km / scale), output_field=FloatField()
+        )
+    ).order_by('-local_rank', '-id')
@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import ActivityService, Favorite, Service, SimilarService
+
+
+def build_feature_matrix():
+    """Разреженная матрица Сервис x (клиенты избранного + активности).
+
+    Возвращает массив id Сервисов (порядок строк) и матрицу CSR
+    с L2-нормированными строками.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    service_ids = np.fromiter(
+        Service.objects.order_by('pk').values_list('pk', flat=True),
+        dtype=np.int64
+    )
+    favorites = np.array(
+        Favorite.objects.values_list('service_id', 'client_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    activities = np.array(
+        ActivityService.objects.values_list('service_id', 'activity_id'),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+    _, client_columns = np.unique(favorites[:, 1], return_inverse=True)
+    _, activity_columns = np.unique(activities[:, 1], return_inverse=True)
+    n_clients = client_columns.max(initial=-1) + 1
+    n_features = n_clients + activity_columns.max(initial=-1) + 1
+
+    rows = np.searchsorted(
+        service_ids, np.concatenate([favorites[:, 0], activities[:, 0]])
+    )
+    columns = np.concatenate([client_columns, activity_columns + n_clients])
+    weights = np.concatenate([
+        np.ones(len(favorites)),
+        np.full(len(activities), settings.SIMILARITY_ACTIVITY_WEIGHT),
+    ])
+    matrix = sparse.csr_matrix(
+        (weights, (rows, columns)), shape=(len(service_ids), n_features)
+    )
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return service_ids, sparse.diags(1 / norms) @ matrix
+
+
+def top_neighbours(similarity, row, top_k):
+    """Индексы и значения top-K ненулевых элементов строки CSR."""
+    import numpy as np
+
+    start, end = similarity.indptr[row], similarity.indptr[row + 1]
+    columns = similarity.indices[start:end]
+    scores = similarity.data[start:end]
+    if len(scores) > top_k:
+        best = np.argpartition(-scores, top_k)[:top_k]
+        columns, scores = columns[best], scores[best]
+    order = np.argsort(-scores, kind='stable')
+    return columns[order], scores[order]
+
+
+def rebuild_similar_services(service_ids=None, top_k=None, batch_size=1000):
+    """Пересчитывает top-K похожих Сервисов по косинусному сходству.
+
+    Без service_ids пересчитываются все Сервисы, иначе указанные и те,
+    в чьих списках они сейчас есть: из чужого списка изменённый Сервис
+    выпадает сразу. В чужой список он попадает только при полном
+    пересчёте, который запускается по расписанию. Строки
+    обрабатываются пачками, чтобы ограничить память. Возвращает число
+    сохранённых пар.
+    """
+    import numpy as np
+
+    top_k = top_k or settings.SIMILAR_SERVICES_TOP_K
+    all_ids, matrix = build_feature_matrix()
+    if service_ids is None:
+        rows = np.arange(len(all_ids))
+    else:
+        service_ids = {*service_ids, *SimilarService.objects.filter(
+            similar_id__in=service_ids
+        ).values_list('service_id', flat=True)}
+        rows = np.flatnonzero(np.isin(all_ids, list(service_ids)))
+
+    transposed = matrix.T.tocsr()
+    saved = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        similarity = (matrix[batch] @ transposed).tocsr()
+        # Сервис не считается похожим сам на себя.
+        entry_rows = np.repeat(np.arange(len(batch)),
+                               np.diff(similarity.indptr))
+        similarity.data[similarity.indices == batch[entry_rows]] = 0
+        similarity.eliminate_zeros()
+
+        neighbours = []
+        for position, row in enumerate(batch):
+            columns, scores = top_neighbours(similarity, position, top_k)
+            neighbours.extend(
+                SimilarService(service_id=all_ids[row],
+                               similar_id=all_ids[column],
+                               score=float(score))
+                for column, score in zip(columns, scores)
+            )
+        with transaction.atomic():
+            SimilarService.objects.filter(
+                service_id__in=all_ids[batch].tolist()
+            ).delete()
+            SimilarService.objects.bulk_create(neighbours)
+        saved += len(neighbours)
+    return saved
+
+
+def recommend_master_ids(user, limit=None):
+    """id Мастеров, чьи Сервисы похожи на избранное пользователя.
+
+    Ранг - сумма сходства по предрассчитанным соседям избранных Сервисов;
+    сам пользователь и Мастера из его подписок исключаются.
+    """
+    return list(SimilarService.objects.filter(
+        service__in_favorite_for_clients__client=user
+    ).exclude(
+        similar__master=user
+    ).exclude(
+        similar__master__subscribers__client=user
+    ).values(
+        'similar__master'
+    ).annotate(
+        total=Sum('score')
+    ).order_by(
+        '-total'
+    ).values_list(
+        'similar__master', flat=True
+    )[:limit or settings.SIMILAR_SERVICES_TOP_K])
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+# Отпечаток таблицы Активностей: меняется при любом изменении строк,
+# в том числе из других процессов, админки и миграций.
+VERSION_SQL = (
+    "SELECT md5(coalesce(string_agg(concat_ws(chr(31), id, name, slug, "
+    "description), chr(30) ORDER BY id), '')) FROM {table}"
+)
+
+
+class ActivityRegistry:
+    """Справочник Активностей в памяти процесса.
+
+    Загружается при первом обращении. Процессы не чаще раза в
+    ACTIVITY_REGISTRY_CHECK_SECONDS сверяют отпечаток таблицы в БД
+    и при расхождении перечитывают её; общий кэш не нужен.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = None
+        self.by_id = {}
+        self.by_slug = {}
+
+    def get_shared_version(self):
+        from .models import Activity
+
+        connection = connections[router.db_for_read(Activity)]
+        with connection.cursor() as cursor:
+            cursor.execute(VERSION_SQL.format(
+                table=connection.ops.quote_name(Activity._meta.db_table)
+            ))
+            return cursor.fetchone()[0]
+
+    def load(self, version):
+        from .models import Activity
+
+        activities = list(Activity.objects.order_by('name'))
+        self.by_id = {activity.pk: activity for activity in activities}
+        self.by_slug = {activity.slug: activity for activity in activities}
+        self.version = version
+
+    def is_checked(self, now):
+        return (self.checked is not None and now - self.checked
+                < settings.ACTIVITY_REGISTRY_CHECK_SECONDS)
+
+    def ensure_loaded(self):
+        now = time.monotonic()
+        if self.is_checked(now):
+            return
+        with self.lock:
+            if self.is_checked(now):
+                return
+            version = self.get_shared_version()
+            if version != self.version:
+                self.load(version)
+            self.checked = now
+
+    def invalidate(self):
+        """Сверка отпечатка при следующем обращении после фиксации.
+
+        Другие процессы увидят изменение при очередной сверке.
+        """
+        def expire():
+            self.checked = None
+        transaction.on_commit(expire)
+
+    def all(self):
+        """Активности в порядке Meta.ordering (по названию)."""
+        self.ensure_loaded()
+        return list(self.by_id.values())
+
+    def get(self, pk):
+        self.ensure_loaded()
+        return self.by_id.get(pk)
+
+    def get_by_slug(self, slug):
+        self.ensure_loaded()
+        return self.by_slug.get(slug)
+
+    def choices(self, field='slug'):
+        return [(getattr(activity, field), activity.name)
+                for activity in self.all()]
+
+
+activities = ActivityRegistry()
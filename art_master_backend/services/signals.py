@@ -0,0 +1,238 @@
+from collections import Counter
+
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_save,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+
+from users.models import Subscribe
+
+from .changelog import log_change, log_relations
+from .duplicates import drop_signatures, index_text
+from .facets import schedule_refresh
+from .notifications import record_service_published
+from .models import (Activity,
+                     ActivityService,
+                     ChangeLog,
+                     Comment,
+                     CommentArchive,
+                     Favorite,
+                     Location,
+                     LocationService,
+                     Review,
+                     ReviewArchive,
+                     Service)
+from .ranking import apply_counter_deltas, compute_rank
+from .registry import activities
+
+# Вставка связей в обход Model.save() (api.utils), в той же транзакции:
+# sender - модель связи, client - пользователь, rows - добавленные строки
+# (словари с 'pk', 'client' и field), field - поле связанного объекта.
+relations_created = Signal()
+
+# Удаление строк одним DELETE в обход Collector (services.deletion), в той
+# же транзакции: sender - модель, rows - удалённые строки (словари с 'pk',
+# id связанных объектов по именам полей и оценкой 'score' у отзывов).
+rows_deleted = Signal()
+
+# Деактивация Сервисов одним UPDATE (services.deletion), в той же
+# транзакции: sender - Service, rows - деактивированные Сервисы (словари
+# с 'pk' и 'master').
+rows_deactivated = Signal()
+
+# Перенос веток в архив (services.archive), в той же транзакции: sender -
+# Review, rows - перенесённые отзывы (словари с 'pk' и 'service').
+rows_archived = Signal()
+
+# Архивная модель -> горячая: удаление из архива журналируется и
+# пересчитывается как удаление исходной записи.
+ARCHIVED_MODELS = {ReviewArchive: Review, CommentArchive: Comment}
+
+
+@receiver(pre_save, sender=Service)
+def set_initial_rank(sender, instance, raw=False, **kwargs):
+    if instance._state.adding and not raw:
+        instance.rank = compute_rank(0, 0, 0)
+
+
+@receiver(post_save, sender=Service)
+def service_published(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_service_published(instance)
+
+
+@receiver(pre_save, sender=Review)
+def remember_score(sender, instance, raw=False, update_fields=None,
+                   **kwargs):
+    if (not raw and not instance._state.adding
+            and (update_fields is None or 'score' in update_fields)):
+        instance._saved_score = Review.objects.filter(
+            pk=instance.pk
+        ).values_list('score', flat=True).first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        delta = (1, instance.score, 0)
+    else:
+        saved = getattr(instance, '_saved_score', None)
+        if saved is None:
+            return
+        delta = (0, instance.score - saved, 0)
+        del instance._saved_score
+    apply_counter_deltas({instance.service_id: delta})
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    apply_counter_deltas({instance.service_id: (-1, -instance.score, 0)})
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        apply_counter_deltas({instance.service_id: (0, 0, 1)})
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    apply_counter_deltas({instance.service_id: (0, 0, -1)})
+
+
+@receiver(relations_created, sender=Favorite)
+def favorites_created(sender, rows, **kwargs):
+    counts = Counter(row['service'] for row in rows)
+    apply_counter_deltas({
+        service_id: (0, 0, count) for service_id, count in counts.items()
+    })
+
+
+@receiver(rows_deleted, sender=Review)
+@receiver(rows_deleted, sender=ReviewArchive)
+def reviews_deleted(sender, rows, **kwargs):
+    counts, scores = Counter(), Counter()
+    for row in rows:
+        counts[row['service']] -= 1
+        scores[row['service']] -= row['score']
+    apply_counter_deltas({
+        service_id: (count, scores[service_id], 0)
+        for service_id, count in counts.items()
+    })
+
+
+@receiver(rows_deleted, sender=Favorite)
+def favorites_deleted(sender, rows, **kwargs):
+    counts = Counter(row['service'] for row in rows)
+    apply_counter_deltas({
+        service_id: (0, 0, -count) for service_id, count in counts.items()
+    })
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Comment)
+def text_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and (update_fields is None or 'text' in update_fields):
+        index_text(instance)
+
+
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Comment)
+def text_deleted(sender, instance, **kwargs):
+    drop_signatures(sender, [instance.pk])
+
+
+@receiver(rows_deleted, sender=Review)
+@receiver(rows_deleted, sender=ReviewArchive)
+@receiver(rows_deleted, sender=Comment)
+@receiver(rows_deleted, sender=CommentArchive)
+def texts_deleted(sender, rows, **kwargs):
+    drop_signatures(ARCHIVED_MODELS.get(sender, sender),
+                    [row['pk'] for row in rows])
+
+
+@receiver(m2m_changed, sender=ActivityService)
+def activities_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_refresh([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        schedule_refresh(pk_set)
+    elif action == 'pre_clear':
+        schedule_refresh(instance.services.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=ActivityService)
+@receiver(post_delete, sender=ActivityService)
+@receiver(post_save, sender=LocationService)
+@receiver(post_delete, sender=LocationService)
+def service_relation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_refresh([instance.service_id])
+
+
+@receiver(rows_deleted, sender=ActivityService)
+@receiver(rows_deleted, sender=LocationService)
+def service_relations_deleted(sender, rows, **kwargs):
+    schedule_refresh({row['service'] for row in rows})
+
+
+@receiver(rows_deactivated, sender=Service)
+def services_deactivated(sender, rows, **kwargs):
+    schedule_refresh([row['pk'] for row in rows])
+
+
+@receiver(post_save, sender=Location)
+def location_moved(sender, instance, created, raw=False, **kwargs):
+    if not (created or raw):
+        schedule_refresh(LocationService.objects.filter(
+            location=instance
+        ).values_list('service_id', flat=True))
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def activity_changed(sender, instance, raw=False, **kwargs):
+    activities.invalidate()
+
+
+CHANGE_LOGGED_MODELS = (
+    Service, Review, Comment, Location, Favorite, Subscribe
+)
+
+
+def log_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        log_change(instance,
+                   ChangeLog.CREATE if created else ChangeLog.UPDATE)
+
+
+def log_deleted(sender, instance, **kwargs):
+    log_change(instance, ChangeLog.DELETE)
+
+
+def log_created_relations(sender, rows, **kwargs):
+    log_relations(sender, rows)
+
+
+def log_deleted_rows(sender, rows, **kwargs):
+    log_relations(ARCHIVED_MODELS.get(sender, sender), rows,
+                  ChangeLog.DELETE)
+
+
+@receiver(rows_deactivated, sender=Service)
+def log_deactivated_rows(sender, rows, **kwargs):
+    log_relations(sender, rows, ChangeLog.UPDATE)
+
+
+for model in CHANGE_LOGGED_MODELS:
+    post_save.connect(log_saved, sender=model)
+    post_delete.connect(log_deleted, sender=model)
+    relations_created.connect(log_created_relations, sender=model)
+    rows_deleted.connect(log_deleted_rows, sender=model)
+
+for archive in ARCHIVED_MODELS:
+    rows_deleted.connect(log_deleted_rows, sender=archive)
@@ -1,3 +1,656 @@
-from django.test import TestCase
+import random
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.core import mail
+from django.db import connection, transaction
+from django.test import (SimpleTestCase,
+                         TestCase,
+                         TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from api.utils import create_relations
+from users.models import CustomUser, Subscribe
+
+from .archive import archive_batch, get_cutoff
+from .changelog import log_relations, read_changes
+from .deletion import delete_rows, run_batch, schedule_deletion
+from .duplicates import (MERSENNE_PRIME,
+                         compute_signatures,
+                         get_buckets,
+                         get_permutations,
+                         get_shingle_hashes,
+                         universal_hash)
+from .facets import (PendingRefresh,
+                     get_cell,
+                     get_services_counts,
+                     refresh_activity_facets,
+                     schedule_refresh)
+from .models import (Activity,
+                     ActivityService,
+                     ChangeLog,
+                     Comment,
+                     CommentArchive,
+                     DeletionJob,
+                     Favorite,
+                     Location,
+                     LocationService,
+                     NotificationDigest,
+                     NotificationEvent,
+                     Review,
+                     ReviewArchive,
+                     Service,
+                     ServiceFacet,
+                     SimilarService)
+from .notifications import collect_digest, send_digests
+from .ranking import annotate_counters, apply_counter_deltas, compute_rank
+from .recommendations import rebuild_similar_services
+from .registry import ActivityRegistry
+
+
+def create_user(number, **kwargs):
+    return CustomUser.objects.create_user(
+        email=f'user{number}@example.com',
+        username=f'user{number}',
+        phone_number=f'+7999000{number:04}',
+        password='password',
+        **kwargs
+    )
+
+
+def create_service(master, name='Услуга'):
+    return Service.objects.create(name=name,
+                                  description='Описание',
+                                  master=master,
+                                  image='services/image/service.jpg',
+                                  phone_number='+79990000000')
+
+
+class ChangeLogFenceTest(TransactionTestCase):
+    """Запись, зафиксированная позже записи с большим id, не теряется."""
+
+    def log(self, pk):
+        log_relations(Favorite, [{'pk': pk, 'client': 1, 'service': 1}])
+
+    def test_entry_committed_out_of_id_order(self):
+        logged, release = threading.Event(), threading.Event()
+
+        def slow_transaction():
+            try:
+                with transaction.atomic():
+                    self.log(1)
+                    logged.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=slow_transaction)
+        thread.start()
+        self.assertTrue(logged.wait(10))
+        self.log(2)
+
+        # Запись 2 зафиксирована, но транзакция с меньшим id ещё открыта.
+        self.assertEqual(read_changes(), [])
+
+        release.set()
+        thread.join()
+        changes = read_changes()
+        self.assertEqual([change.object_id for change in changes], [1, 2])
+        self.assertLess(changes[0].id, changes[1].id)
+
+        last = changes[-1]
+        self.assertEqual(read_changes((last.txid, last.id)), [])
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    NOTIFICATION_DIGESTS={'WINDOW_SECONDS': 3600,
+                          'BATCH_SIZE': 2,
+                          'FROM_EMAIL': 'noreply@example.com'}
+)
+class NotificationDigestTest(TestCase):
+    """События, окно дайджеста и постраничная рассылка подписчикам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = 0
+        cls.master = cls.create_user(is_master=True)
+        cls.clients = [cls.create_user() for _ in range(3)]
+        Subscribe.objects.bulk_create(
+            Subscribe(client=client, master=cls.master)
+            for client in cls.clients
+        )
+
+    @classmethod
+    def create_user(cls, **kwargs):
+        cls.users += 1
+        return create_user(cls.users, **kwargs)
+
+    def create_service(self, master=None):
+        return create_service(master or self.master)
+
+    def recipients(self):
+        return [message.to[0] for message in mail.outbox]
+
+    def test_event_recorded_for_subscribed_master(self):
+        service = self.create_service()
+        self.create_service(self.create_user(is_master=True))
+        self.assertEqual(
+            list(NotificationEvent.objects.values_list('service', flat=True)),
+            [service.pk]
+        )
+
+    def test_digest_waits_for_window(self):
+        self.create_service()
+        self.assertIsNone(collect_digest(3600))
+        digest = collect_digest(3600, timezone.now() + timedelta(hours=2))
+        self.assertIsNotNone(digest)
+        self.assertFalse(
+            NotificationEvent.objects.filter(digest=None).exists()
+        )
+
+    def test_pages_cover_all_subscribers(self):
+        self.create_service()
+        self.create_service()
+        self.assertEqual(send_digests(window=0), 3)
+        self.assertEqual(self.recipients(),
+                         [client.email for client in self.clients])
+        self.assertIn('Услуга', mail.outbox[0].body)
+        digest = NotificationDigest.objects.get()
+        self.assertEqual(digest.last_client, self.clients[-1].pk)
+        self.assertEqual(digest.sent, 3)
+        self.assertIsNotNone(digest.finished)
+        self.assertEqual(send_digests(window=0), 0)
+
+    def test_resume_from_last_client(self):
+        self.create_service()
+        digest = collect_digest(0)
+        digest.last_client = self.clients[0].pk
+        digest.save(update_fields=['last_client'])
+        self.assertEqual(send_digests(window=0), 2)
+        self.assertEqual(self.recipients(),
+                         [client.email for client in self.clients[1:]])
+
+    def test_inactive_clients_and_services_skipped(self):
+        CustomUser.objects.filter(pk=self.clients[1].pk).update(
+            is_active=False
+        )
+        self.create_service()
+        other = self.create_user(is_master=True)
+        Subscribe.objects.create(client=self.clients[0], master=other)
+        inactive = self.create_service(other)
+        Service.objects.filter(pk=inactive.pk).update(is_active=False)
+
+        self.assertEqual(send_digests(window=0), 2)
+        self.assertEqual(self.recipients(), [self.clients[0].email,
+                                             self.clients[2].email])
+        self.assertNotIn(other.username, mail.outbox[0].body)
+
+
+class DeletionTest(TestCase):
+    """Пакеты удаления от листьев, счётчики и деактивация Сервисов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.master = create_user(1, is_master=True)
+        cls.client_user = create_user(2)
+        cls.other = create_user(3)
+        cls.service = create_service(cls.master)
+        cls.activity = Activity.objects.create(name='Керамика',
+                                               description='Описание',
+                                               slug='ceramics')
+        ActivityService.objects.create(activity=cls.activity,
+                                       service=cls.service)
+        own = Review.objects.create(service=cls.service,
+                                    author=cls.client_user,
+                                    text='Отзыв клиента об услуге мастера',
+                                    score=4)
+        other = Review.objects.create(service=cls.service,
+                                      author=cls.other,
+                                      text='Другой отзыв, совсем о другом',
+                                      score=8)
+        Comment.objects.create(review=own, author=cls.other,
+                               text='Ответ на отзыв клиента')
+        Comment.objects.create(review=other, author=cls.client_user,
+                               text='Комментарий клиента')
+        Favorite.objects.create(client=cls.client_user, service=cls.service)
+        Subscribe.objects.create(client=cls.client_user, master=cls.master)
+        refresh_activity_facets()
+
+    def test_user_batches_from_leaves(self):
+        schedule_deletion(self.client_user)
+        job = DeletionJob.objects.get()
+        steps = []
+        while not run_batch(job.pk, batch_size=1):
+            job.refresh_from_db()
+            steps.append(job.step)
+
+        self.assertEqual(steps, ['comments on reviews',
+                                 'comments',
+                                 'reviews',
+                                 'favorites',
+                                 'subscriptions'])
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.deleted, dict.fromkeys(steps, 1))
+        self.assertFalse(
+            CustomUser.objects.filter(pk=self.client_user.pk).exists()
+        )
+        self.service.refresh_from_db()
+        self.assertEqual(self.service.reviews_count, 1)
+        self.assertEqual(self.service.reviews_score_sum, 8)
+        self.assertEqual(self.service.favorites_count, 0)
+
+    def test_master_services_deactivated(self):
+        self.assertEqual(get_services_counts(), {self.activity.pk: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_deletion(self.master)
+
+        self.assertFalse(Service.objects.filter(is_active=True).exists())
+        self.assertEqual(get_services_counts(), {})
+        self.assertEqual(
+            list(ChangeLog.objects.filter(
+                model='services.service', action=ChangeLog.UPDATE
+            ).values_list('object_id', 'data')),
+            [(self.service.pk, {'master': self.master.pk})]
+        )
+
+        review = self.service.reviews.first()
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.post(
+            f'/api/services/{self.service.pk}/reviews/{review.pk}/comments/',
+            {'text': 'Комментарий к удалённой услуге'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_deactivated_master_not_subscribable(self):
+        schedule_deletion(self.master)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.post('/api/users/subscribe/',
+                               {'ids': [self.master.pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.other.subscriptions.exists())
+
+        # Подписка клиента ещё не удалена пакетом, но в списке её нет.
+        client.force_authenticate(self.client_user)
+        response = client.get('/api/users/subscriptions/')
+        self.assertEqual(response.json()['results'], [])
+
+
+class FacetDeltaTest(TestCase):
+    """Фасеты меняются на вклад изменённого Сервиса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.master = create_user(1, is_master=True)
+        cls.activity = Activity.objects.create(name='Керамика',
+                                               description='Описание',
+                                               slug='ceramics')
+        cls.locations = [
+            Location.objects.create(address='Москва',
+                                    point=Point(37.62, 55.75)),
+            Location.objects.create(address='Санкт-Петербург',
+                                    point=Point(30.31, 59.94)),
+        ]
+        cls.cells = [get_cell(location.point) for location in cls.locations]
+
+    def counts(self, cell=''):
+        return get_services_counts(cell).get(self.activity.pk, 0)
+
+    def add_service(self, location):
+        with self.captureOnCommitCallbacks(execute=True):
+            service = create_service(self.master)
+            ActivityService.objects.create(activity=self.activity,
+                                           service=service)
+            LocationService.objects.create(location=location,
+                                           service=service)
+        return service
+
+    def test_deltas_per_cell(self):
+        first = self.add_service(self.locations[0])
+        self.add_service(self.locations[1])
+        self.assertEqual(self.counts(), 2)
+        self.assertEqual(self.counts(self.cells[0]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LocationService.objects.filter(service=first).update(
+                location=self.locations[1]
+            )
+            schedule_refresh([first.pk])
+        self.assertEqual(self.counts(), 2)
+        self.assertEqual(self.counts(self.cells[0]), 0)
+        self.assertEqual(self.counts(self.cells[1]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.counts(), 1)
+        self.assertEqual(self.counts(self.cells[1]), 1)
+        self.assertFalse(
+            ServiceFacet.objects.filter(service_id=first.pk).exists()
+        )
+
+    def test_rollback_drops_pending(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                schedule_refresh([1])
+                raise RuntimeError
+        self.assertFalse(any(
+            isinstance(entry[1], PendingRefresh)
+            for entry in transaction.get_connection().run_on_commit
+        ))
+
+
+class RankCounterTest(TestCase):
+    """Счётчики и ранг Сервиса сдвигаются на изменения, не пересчётом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.master = create_user(1, is_master=True)
+        cls.clients = [create_user(number) for number in range(2, 5)]
+        cls.services = [create_service(cls.master, f'Услуга {number}')
+                        for number in range(2)]
+
+    def assertCounters(self, service, expected):
+        service = annotate_counters(
+            Service.objects.filter(pk=service.pk)
+        ).get()
+        self.assertEqual((service.reviews_count,
+                          service.reviews_score_sum,
+                          service.favorites_count), expected)
+        self.assertEqual((service.reviews_total,
+                          service.reviews_score_total,
+                          service.favorites_total), expected)
+        self.assertAlmostEqual(
+            service.rank, compute_rank(*expected, service.created), places=4
+        )
+
+    def review(self, client, score, service=None):
+        return Review.objects.create(service=service or self.services[0],
+                                     author=client,
+                                     text='Отзыв',
+                                     score=score)
+
+    def test_review_saved_and_deleted(self):
+        service = self.services[0]
+        first = self.review(self.clients[0], 6)
+        self.review(self.clients[1], 9)
+        self.assertCounters(service, (2, 15, 0))
+
+        first.score = 2
+        first.save()
+        self.assertCounters(service, (2, 11, 0))
+        first.text = 'Новый текст'
+        first.save(update_fields=['text'])
+        self.assertCounters(service, (2, 11, 0))
+
+        first.delete()
+        self.assertCounters(service, (1, 9, 0))
+
+    def test_favorite_saved_and_deleted(self):
+        service = self.services[0]
+        favorite = Favorite.objects.create(client=self.clients[0],
+                                           service=service)
+        self.assertCounters(service, (0, 0, 1))
+        favorite.delete()
+        self.assertCounters(service, (0, 0, 0))
+
+    def test_bulk_paths(self):
+        ids = [service.pk for service in self.services]
+        for client in self.clients:
+            create_relations(SimpleNamespace(user=client), Favorite,
+                             ids, 'service')
+            self.review(client, 5, self.services[1])
+        self.assertCounters(self.services[0], (0, 0, 3))
+        self.assertCounters(self.services[1], (3, 15, 3))
+
+        delete_rows(Favorite.objects.filter(client=self.clients[0]), 10)
+        delete_rows(Review.objects.filter(author__in=self.clients[1:]), 10)
+        self.assertCounters(self.services[0], (0, 0, 2))
+        self.assertCounters(self.services[1], (1, 5, 2))
+
+    def test_equal_deltas_grouped(self):
+        self.assertEqual(apply_counter_deltas({}), 0)
+        ids = [service.pk for service in self.services]
+        with self.assertNumQueries(4):
+            # SAVEPOINT, UPDATE счётчиков, UPDATE ранга, RELEASE.
+            updated = apply_counter_deltas(dict.fromkeys(ids, (0, 0, 1)))
+        self.assertEqual(updated, 2)
+        Favorite.objects.bulk_create(
+            Favorite(client=self.clients[0], service_id=pk) for pk in ids
+        )
+        for service in self.services:
+            self.assertCounters(service, (0, 0, 1))
+
+
+class SimilarServicesTest(TestCase):
+    """Частичный пересчёт обновляет и списки, где были изменённые."""
+
+    def test_changed_service_leaves_other_lists(self):
+        master = create_user(1, is_master=True)
+        clients = [create_user(number) for number in (2, 3)]
+        services = [create_service(master, f'Услуга {number}')
+                    for number in range(3)]
+        for service in services[:2]:
+            Favorite.objects.create(client=clients[0], service=service)
+        Favorite.objects.create(client=clients[1], service=services[2])
+        rebuild_similar_services()
+
+        def pairs():
+            return set(SimilarService.objects.values_list('service',
+                                                          'similar'))
+
+        self.assertEqual(pairs(), {(services[0].pk, services[1].pk),
+                                   (services[1].pk, services[0].pk)})
+
+        Favorite.objects.filter(service=services[1]).delete()
+        Favorite.objects.create(client=clients[1], service=services[1])
+        rebuild_similar_services([services[1].pk])
+        self.assertEqual(pairs(), {(services[1].pk, services[2].pk)})
+
+        # services[2] получит services[1] в список при полном пересчёте.
+        rebuild_similar_services()
+        self.assertEqual(pairs(), {(services[1].pk, services[2].pk),
+                                   (services[2].pk, services[1].pk)})
+
+
+class ArchiveTest(TestCase):
+    """Архивные ветки читаются через API, но не изменяются."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.master = create_user(1, is_master=True)
+        cls.author = create_user(2)
+        cls.service = create_service(cls.master)
+        cls.review = Review.objects.create(service=cls.service,
+                                           author=cls.author,
+                                           text='Старый отзыв',
+                                           score=7)
+        cls.comment = Comment.objects.create(review=cls.review,
+                                             author=cls.master,
+                                             text='Ответ мастера')
+        old = timezone.now() - timedelta(days=400)
+        Review.objects.update(pub_date=old)
+        Comment.objects.update(pub_date=old)
+        archive_batch(get_cutoff(days=365))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.url = f'/api/services/{self.service.pk}/reviews/'
+
+    def test_thread_moved_with_counters(self):
+        self.assertFalse(Review.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            list(ReviewArchive.objects.values_list('pk', flat=True)),
+            [self.review.pk]
+        )
+        self.assertEqual(
+            list(CommentArchive.objects.values_list('pk', 'review')),
+            [(self.comment.pk, self.review.pk)]
+        )
+        self.service.refresh_from_db()
+        self.assertEqual((self.service.reviews_count,
+                          self.service.reviews_score_sum), (1, 7))
+
+    def test_archived_review_readable(self):
+        results = self.client.get(self.url).json()['results']
+        self.assertEqual([review['id'] for review in results],
+                         [self.review.pk])
+        review = self.client.get(f'{self.url}{self.review.pk}/').json()
+        self.assertEqual([comment['id'] for comment in review['comments']],
+                         [self.comment.pk])
+        comments = self.client.get(
+            f'{self.url}{self.review.pk}/comments/'
+        ).json()['results']
+        self.assertEqual([comment['id'] for comment in comments],
+                         [self.comment.pk])
+
+    def test_archived_review_read_only(self):
+        response = self.client.patch(f'{self.url}{self.review.pk}/',
+                                     {'score': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f'{self.url}{self.review.pk}/comments/',
+                                    {'text': 'Новый комментарий'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_unique_author_includes_archive(self):
+        response = self.client.post(self.url, {'text': 'Ещё один отзыв',
+                                               'score': 9})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Review.objects.exists())
+
+
+@override_settings(ACTIVITY_REGISTRY_CHECK_SECONDS=5)
+class ActivityRegistryTest(TestCase):
+    """Реестр другого процесса сверяется с таблицей раз в интервал."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.activity = Activity.objects.create(name='Керамика',
+                                               description='Описание',
+                                               slug='ceramics')
+
+    def setUp(self):
+        # Отдельный экземпляр - память другого процесса: сигналы и
+        # invalidate() этого процесса его не касаются.
+        self.registry = ActivityRegistry()
+        self.load = mock.patch.object(self.registry, 'load',
+                                      wraps=self.registry.load).start()
+        self.clock = mock.patch('services.registry.time.monotonic',
+                                return_value=100.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def name_at(self, moment):
+        self.clock.return_value = moment
+        return self.registry.get_by_slug('ceramics').name
+
+    def test_change_seen_after_interval(self):
+        self.assertEqual(self.name_at(100), 'Керамика')
+        Activity.objects.filter(pk=self.activity.pk).update(name='Глина')
+        self.assertEqual(self.name_at(104), 'Керамика')
+        self.assertEqual(self.name_at(105), 'Глина')
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_unchanged_table_not_reloaded(self):
+        with mock.patch.object(self.registry, 'get_shared_version',
+                               wraps=self.registry.get_shared_version
+                               ) as get_version:
+            for moment in (100, 103, 106, 112):
+                self.assertEqual(self.name_at(moment), 'Керамика')
+        self.assertEqual(get_version.call_count, 3)
+        self.assertEqual(self.load.call_count, 1)
+
+
+class MinHashTest(SimpleTestCase):
+    """Оценка сходства MinHash и порог LSH-полос."""
+
+    LETTERS = 'абвгдежзиклмнопрстуфхцчшщыэюя'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = random.Random(7)
+        words = [''.join(rng.choice(cls.LETTERS)
+                         for _ in range(rng.randint(3, 9)))
+                 for _ in range(400)]
+        cls.pairs = []
+        for _ in range(200):
+            first = [rng.choice(words) for _ in range(rng.randint(15, 60))]
+            second = list(first)
+            for index in rng.sample(range(len(first)),
+                                    rng.randint(0, len(first))):
+                second[index] = rng.choice(words)
+            cls.pairs.append((' '.join(first), ' '.join(second)))
+
+    def jaccard(self, first, second):
+        first = set(get_shingle_hashes(first).tolist())
+        second = set(get_shingle_hashes(second).tolist())
+        return len(first & second) / len(first | second)
+
+    def test_universal_hash_is_exact(self):
+        import numpy as np
+
+        a, b, _, _ = get_permutations()
+        rng = random.Random(1)
+        values = [rng.getrandbits(61) for _ in range(20)]
+        values += [0, MERSENNE_PRIME - 1, MERSENNE_PRIME]
+        hashes = universal_hash(np.array(values, dtype=np.uint64)[:, None],
+                                a, b)
+        for row, x in zip(hashes.tolist(), values):
+            self.assertEqual(row, [(int(a_i) * x + int(b_i)) % MERSENNE_PRIME
+                                   for a_i, b_i in zip(a, b)])
+
+    def test_estimate_close_to_exact_jaccard(self):
+        import numpy as np
+
+        errors = []
+        for first, second in self.pairs:
+            _, signatures = compute_signatures([first, second])
+            estimate = np.mean(signatures[0] == signatures[1])
+            errors.append(abs(estimate - self.jaccard(first, second)))
+        errors = np.array(errors)
+        self.assertLess(errors.mean(), 0.05)
+        self.assertGreaterEqual(np.mean(errors <= 0.1), 0.95)
+
+    def test_band_collision_probability(self):
+        """Доля пар с общей полосой - 1 - (1 - s ** ROWS) ** BANDS."""
+        import numpy as np
+
+        options = settings.DUPLICATE_TEXTS
+        size = options['BANDS'] * options['ROWS']
+        rng = np.random.default_rng(3)
+        for similarity in (0.5, 0.7, 0.9):
+            with self.subTest(similarity=similarity):
+                first = rng.integers(0, 1 << 32, (2000, size),
+                                     dtype=np.uint32)
+                second = np.where(
+                    rng.random((2000, size)) < similarity,
+                    first,
+                    rng.integers(0, 1 << 32, (2000, size), dtype=np.uint32)
+                )
+                collided = np.any(get_buckets(first) == get_buckets(second),
+                                  axis=1).mean()
+                expected = 1 - (1 - similarity ** options['ROWS']) ** (
+                    options['BANDS']
+                )
+                self.assertAlmostEqual(collided, expected, delta=0.03)
+
+    def test_texts_share_bucket_above_threshold(self):
+        for first, second in self.pairs:
+            similarity = self.jaccard(first, second)
+            if 0.4 <= similarity < 0.9:
+                continue
+            _, signatures = compute_signatures([first, second])
+            buckets = get_buckets(signatures)
+            shared = bool(set(buckets[0].tolist()) & set(buckets[1].tolist()))
+            self.assertEqual(shared, similarity >= 0.9, similarity)
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class IdentityBackend(ModelBackend):
+    """Аутентификация по email или номеру телефона (ALT_USERNAME_FIELD)."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user_model = get_user_model()
+        email = username or kwargs.get(user_model.USERNAME_FIELD)
+        phone_number = kwargs.get(user_model.ALT_USERNAME_FIELD)
+        if password is None or not (email or phone_number):
+            return None
+
+        user = user_model._default_manager.get_by_identity(
+            email=email, phone_number=phone_number
+        )
+        if user is None:
+            # Выравнивает время ответа для несуществующих пользователей.
+            user_model().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from users.normalization import backfill_identities
+
+
+class Command(BaseCommand):
+    help = ('Заполнение email_normalized и приведение номеров телефонов '
+            'пользователей к E.164.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated, conflicts = backfill_identities(
+            get_user_model(), batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Обновлено пользователей: {updated}')
+        )
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                'Совпадающие email/телефоны после нормализации, id: '
+                + ', '.join(map(str, conflicts))
+            ))
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import UserManager
+
+from .normalization import normalize_email, normalize_phone_number
+
+
+class CustomUserManager(UserManager):
+    """Менеджер пользователей с поиском по нормализованным полям.
+
+    Каждый поиск - одна проба уникального индекса: email_normalized
+    или phone_number в E.164.
+    """
+
+    def get_by_natural_key(self, username):
+        return self.get(email_normalized=normalize_email(username))
+
+    def get_by_identity(self, email=None, phone_number=None):
+        """Пользователь по email или номеру телефона, иначе None."""
+        if email:
+            lookup = {'email_normalized': normalize_email(email)}
+        else:
+            phone_number = normalize_phone_number(phone_number)
+            if phone_number is None:
+                return None
+            lookup = {'phone_number': phone_number}
+        return self.filter(**lookup).first()
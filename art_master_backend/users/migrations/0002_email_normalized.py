@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:08
+
+from django.db import migrations, models
+import users.managers
+
+
+def backfill_identities(apps, schema_editor):
+    from users.normalization import backfill_identities
+
+    backfill_identities(apps.get_model('users', 'CustomUser'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='customuser',
+            managers=[
+                ('objects', users.managers.CustomUserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='email_normalized',
+            field=models.EmailField(editable=False, max_length=254, null=True, unique=True, verbose_name='Email без учёта регистра'),
+        ),
+        migrations.RunPython(backfill_identities, migrations.RunPython.noop),
+    ]
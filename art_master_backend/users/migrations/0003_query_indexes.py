@@ -0,0 +1,21 @@
+# Generated by Django 4.2.6 on 2026-10-19 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_email_normalized'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='customuser',
+            name='unique_user',
+        ),
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['master'], include=('client',), name='subscribe_master_idx'),
+        ),
+    ]
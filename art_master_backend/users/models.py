@@ -5,6 +5,11 @@ from django.utils.translation import gettext_lazy as _
 
 from phonenumber_field.modelfields import PhoneNumberField
 
+from services.mixins import AtomicSaveMixin
+
+from .managers import CustomUserManager
+from .normalization import normalize_email
+
 
 class CustomUser(AbstractUser):
     """Кастомная модель пользователя."""
@@ -16,6 +21,13 @@ class CustomUser(AbstractUser):
         null=False,
         blank=False
     )
+    email_normalized = models.EmailField(
+        'Email без учёта регистра',
+        max_length=254,
+        unique=True,
+        null=True,
+        editable=False
+    )
     first_name = models.CharField('Имя', max_length=150)
     last_name = models.CharField('Фамилия', max_length=150)
     phone_number = PhoneNumberField('Номер телефона', unique=True)
@@ -31,17 +43,28 @@ class CustomUser(AbstractUser):
     ALT_USERNAME_FIELD = 'phone_number'
     REQUIRED_FIELDS = ['username', 'password']
 
+    objects = CustomUserManager()
+
     class Meta:
         ordering = ['username']
-        constraints = [
-            models.UniqueConstraint(
-                fields=['username', 'email', 'phone_number'],
-                name='unique_user'
-            ),
-        ]
 
+    def save(self, *args, **kwargs):
+        normalized = normalize_email(self.email)
+        if (self.email_normalized is None and not self._state.adding
+                and type(self)._default_manager.filter(
+                    email_normalized=normalized
+                ).exclude(pk=self.pk).exists()):
+            # Дубликат без учёта регистра из данных до 0002_email_normalized
+            # остаётся без email_normalized, пока email не исправят.
+            normalized = None
+        self.email_normalized = normalized
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'email_normalized'}
+        super().save(*args, **kwargs)
 
-class Subscribe(models.Model):
+
+class Subscribe(AtomicSaveMixin, models.Model):
     """Модель подписок."""
     client = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -60,6 +83,10 @@ class Subscribe(models.Model):
             models.UniqueConstraint(fields=['client', 'master'],
                                     name='unique_subscribe')
         ]
+        indexes = [
+            models.Index(fields=['master'], include=['client'],
+                         name='subscribe_master_idx'),
+        ]
 
     def __str__(self):
         return f'{self.client} {self.master}'
@@ -0,0 +1,68 @@
+from phonenumber_field.phonenumber import to_python
+
+
+def normalize_email(value):
+    """Канонический email для уникальности и поиска: без регистра."""
+    if not value:
+        return None
+    return str(value).strip().lower()
+
+
+def normalize_phone_number(value):
+    """Номер телефона в E.164 или None, если номер некорректен."""
+    if not value:
+        return None
+    phone_number = to_python(value)
+    if phone_number is None or not phone_number.is_valid():
+        return None
+    return phone_number.as_e164
+
+
+def backfill_identities(user_model, batch_size=1000):
+    """Заполняет email_normalized и приводит телефоны к E.164.
+
+    Принимает модель пользователя (в том числе историческую из миграции).
+    При совпадении нормализованных значений поле остаётся прежним у
+    всех, кроме первого по id. Возвращает (обновлено, конфликты).
+    """
+    emails = set()
+    phone_numbers = set(
+        str(phone_number.raw_input) for phone_number in
+        user_model.objects.values_list('phone_number', flat=True)
+    )
+    updated, conflicts, batch = 0, [], []
+    users = user_model.objects.order_by('pk').only(
+        'pk', 'email', 'email_normalized', 'phone_number'
+    )
+    for user in users.iterator(chunk_size=batch_size):
+        changed = False
+        email = normalize_email(user.email)
+        if email in emails:
+            conflicts.append(user.pk)
+        else:
+            emails.add(email)
+            changed = user.email_normalized != email
+            user.email_normalized = email
+
+        current = str(user.phone_number.raw_input)
+        phone_number = normalize_phone_number(user.phone_number)
+        if phone_number and phone_number != current:
+            if phone_number in phone_numbers:
+                conflicts.append(user.pk)
+            else:
+                phone_numbers.add(phone_number)
+                user.phone_number = phone_number
+                changed = True
+
+        if changed:
+            batch.append(user)
+        if len(batch) >= batch_size:
+            updated += save_identities(user_model, batch)
+            batch = []
+    return updated + save_identities(user_model, batch), conflicts
+
+
+def save_identities(user_model, users):
+    user_model.objects.bulk_update(users,
+                                   ['email_normalized', 'phone_number'])
+    return len(users)
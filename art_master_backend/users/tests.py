@@ -1,3 +1,57 @@
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-# Create your tests here.
+from api.serializers import ClientSerializer
+
+from .models import CustomUser
+
+
+class ProfileEmailTest(TestCase):
+    """Email профиля уникален без учёта регистра."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email='user@example.com', username='user',
+            phone_number='+79990000001', password='password'
+        )
+        cls.other = CustomUser.objects.create_user(
+            email='other.user@example.com', username='other',
+            phone_number='+79990000002', password='password'
+        )
+
+    def validate(self, email):
+        serializer = ClientSerializer(self.user, data={'email': email},
+                                      partial=True)
+        return serializer.is_valid(), serializer.errors
+
+    def test_variant_of_other_email_rejected(self):
+        valid, errors = self.validate('Other.User@Example.com')
+        self.assertFalse(valid)
+        self.assertIn('email', errors)
+
+    def test_own_email_variant_allowed(self):
+        valid, errors = self.validate('USER@example.com')
+        self.assertTrue(valid, errors)
+
+    def test_legacy_duplicate_saved_without_normalized(self):
+        # Дубликат, оставленный миграцией 0002 без email_normalized.
+        CustomUser.objects.filter(pk=self.other.pk).update(
+            email='USER@example.com', email_normalized=None
+        )
+        legacy = CustomUser.objects.get(pk=self.other.pk)
+        legacy.first_name = 'Имя'
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.email_normalized)
+
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email_normalized, 'user@example.com')
+
+        # Новые пользователи по-прежнему упираются в ограничение.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CustomUser.objects.create_user(
+                email='User@example.com', username='third',
+                phone_number='+79990000003', password='password'
+            )